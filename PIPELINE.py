@@ -3,204 +3,505 @@ import sys
 import time
 import os
 import json
+import importlib.util
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from tsv_io import read_tsv, frame_to_text_records, read_frame, write_frame, frame_format, FRAME_FORMATS, PYARROW_AVAILABLE
+from merge_files import select_pathogenic, merge_common, merge_files_streaming
+from intervar import query_wintervar, RateLimiter, WINTERVAR_VERSION, DEFAULT_RATE_LIMIT, DEFAULT_BURST
+from json_to_csv_intervar import intervar_records_to_frame, merge_intervar_frames
+from final_acmg_classifier import (
+    is_pipeline_column, records_to_classifier_frame, classify_sets, classify_partial_records, stack_classified_sets,
+)
+from stage_manifest import StageManifest
+from auto_acmg_server import start_auto_acmg_pool, AUTO_ACMG_DIR
+from runtime_model import RunTimings, estimate_runtime, save_run, count_table_rows
+from stage_metrics import StageMeter, append_metrics_log, write_prometheus_textfile, PROMETHEUS_TEXTFILE
+from http_archive import HttpArchive, HTTP_MODES
+from variant_triage import load_triage_rules, triage_variants, classify_triaged, TRIAGE_COLUMN
 
 # Define test directory for temporary files
 TEST_DIR = "test"
 os.makedirs(TEST_DIR, exist_ok=True)
-TIMING_LOG = "pipeline_timing.json"
-
-def load_timing_data():
-    if os.path.exists(TIMING_LOG):
-        with open(TIMING_LOG, "r") as f:
-            return json.load(f)
-    return {}
-
-def save_timing_data(data):
-    with open(TIMING_LOG, "w") as f:
-        json.dump(data, f, indent=4)
-
-def estimate_runtime(num_rows):
-    """Estimate runtime based on historical data and row count."""
-    data = load_timing_data()
-    
-    # Basic linear estimation
-    estimated_time = num_rows * 0.05
-    
-    # If historical data is available, use a weighted average
-    if str(num_rows) in data:
-        historical_time = data[str(num_rows)]
-        estimated_time = (estimated_time * 0.7) + (historical_time * 0.3)
-    
-    return max(10.0, round(estimated_time, 2))  # Ensure a minimum runtime of 10 seconds
-
-
-def log_execution_time(num_rows, elapsed_time):
-    data = load_timing_data()
-    data[num_rows] = elapsed_time
-    save_timing_data(data)
-
-def count_rows_in_file(filepath):
-    try:
-        with open(filepath, "r") as f:
-            return sum(1 for _ in f) - 1  # Exclude header
-    except Exception:
-        return 0
+# Records what every stage output in TEST_DIR was built from
+MANIFEST_PATH = os.path.join(TEST_DIR, "manifest.json")
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Diablo outputs larger than this are merged in bounded-memory streaming mode
+STREAMING_THRESHOLD_BYTES = 2 * 1024 ** 3
+# Seconds between rewrites of the partial final output while Auto-ACMG results come in
+PARTIAL_OUTPUT_INTERVAL = 30
 
 def run_command(command, cwd=None):
     """Executes a shell command inside a specified directory (if provided)."""
     print(f"Executing: {command}")
     subprocess.run(command, shell=True, check=True, cwd=cwd)
 
-def start_auto_acmg_server():
-    """Starts the Auto-ACMG server, handling port conflicts if necessary."""
-    print("Starting Auto-ACMG Server...")
-
-    auto_acmg_dir = "auto-acmg"
-    if not os.path.exists(auto_acmg_dir):
-        print("Error: auto-acmg directory not found.")
-        sys.exit(1)
-
-    env = os.environ.copy()
-    env["PIPENV_PIPFILE"] = os.path.abspath(os.path.join(auto_acmg_dir, "Pipfile"))
-    log_path = os.path.join(auto_acmg_dir, "auto_acmg.log")
-
+def ensure_file_exists(filepath, command, cwd=None, manifest=None, inputs=()):
+    """
+    Runs the provided command if the file is missing or, with a manifest, if it is not
+    up to date with the inputs and command it was built from. Returns True if the command ran.
+    """
+    if manifest is None:
+        if not os.path.exists(filepath):
+            print(f"{filepath} missing, running command to generate it...")
+            run_command(command, cwd)
+            return True
+        print(f"{filepath} already exists, skipping command.")
+        return False
+
+    signature = manifest.signature(inputs, {"command": command})
+    status = manifest.status(filepath, signature)
+    if status == "current":
+        print(f"{filepath} is up to date, skipping command.")
+        return False
+
+    print(f"{filepath} {describe_status(filepath, status)}, running command to generate it...")
+    manifest.start(filepath, signature)
+    run_command(command, cwd)
+    manifest.record(filepath, signature)
+    return True
+
+def describe_status(output, status):
+    if not os.path.exists(output):
+        return "missing"
+    return {"stale": "is out of date", "pending": "is incomplete", "missing": "has no manifest record"}[status]
+
+def stage_code(*modules):
+    """Source files a stage runs, so that changing them invalidates its outputs."""
+    return [os.path.join(PROJECT_DIR, f"{module}.py") for module in modules]
+
+def load_auto_acmg_query():
+    """Imports auto-acmg-query.py (hyphenated, so not importable by name) from the auto-acmg folder."""
+    path = os.path.join(AUTO_ACMG_DIR, "auto-acmg-query.py")
+    if not os.path.exists(path):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "auto-acmg-query.py")
+    spec = importlib.util.spec_from_file_location("auto_acmg_query", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def load_tsv(path):
+    """Reads a checkpointed stage table (TSV, Parquet or Arrow) with the columns later stages use."""
+    if frame_format(path):
+        return read_frame(path, keep=is_pipeline_column)
     try:
-        # Ensure dependencies are installed
-        subprocess.run(["pipenv", "install"], cwd=auto_acmg_dir, env=env, check=True)
-
-        # Start server in a new terminal and log output
-        command = (
-            "nohup pipenv run uvicorn src.main:app --host 0.0.0.0 --port 8080 --reload > auto_acmg.log 2>&1 &"
-        )
-        subprocess.run(command, shell=True, cwd=auto_acmg_dir, env=env, check=True)
-        print("Auto-ACMG Server started. Waiting for confirmation...")
-
-        startup_success = False
-
-        for _ in range(30):  # Check for 30 seconds
-            with open(log_path, "r", errors="ignore") as log_file:
-                logs = log_file.read()
-
-                if "Application startup complete." in logs:
-                    print("Auto-ACMG Server is running.")
-                    startup_success = True
-                    break
-
-                if "[Errno 98] Address already in use" in logs:
-                    print("Error: Port 8080 is already in use. Resolving...")
-
-                    # Find and kill the process using port 8080
-                    try:
-                        result = subprocess.run(
-                            "lsof -i :8080 | awk 'NR>1 {print $2}'",
-                            shell=True,
-                            capture_output=True,
-                            text=True,
-                            check=True,
-                        )
-                        pids = result.stdout.strip().split("\n")
-                        for pid in pids:
-                            if pid.isdigit():
-                                print(f"Killing process {pid} on port 8080...")
-                                subprocess.run(["kill", "-9", pid], check=True)
-                        print("Restarting Auto-ACMG Server...")
-                        return start_auto_acmg_server()  # Restart function after killing processes
-
-                    except subprocess.CalledProcessError as e:
-                        print(f"Failed to resolve port issue: {e}")
-                        sys.exit(1)
-
-            time.sleep(1)
-
-        if not startup_success:
-            print("Error: Auto-ACMG Server did not start properly. Check auto_acmg.log for details.")
-            sys.exit(1)
-
-    except subprocess.CalledProcessError as e:
-        print(f"Error starting Auto-ACMG: {e}")
-        sys.exit(1)
-
+        return read_tsv(path, keep=is_pipeline_column)
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame()
+
+def load_text_tsv(path):
+    """
+    Reads a checkpointed stage TSV as text, the way csv.DictReader sees it. Parquet and
+    Arrow checkpoints hold the stage result unchanged and are read as they are.
+    """
+    if frame_format(path):
+        return read_frame(path)
+    try:
+        return pd.read_csv(path, sep='\t', dtype=str, keep_default_na=False)
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame()
 
-def ensure_file_exists(filepath, command, cwd=None):
-    """Checks if a file exists, and runs the provided command if it's missing."""
-    if not os.path.exists(filepath):
-        print(f"{filepath} missing, running command to generate it...")
-        run_command(command, cwd)
+def save_tsv(df, path):
+    if frame_format(path):
+        write_frame(df, path)
     else:
-        print(f"{filepath} already exists, skipping command.")
-
-def main(input_vcf, final_output, annotated_vcf=None):
+        df.to_csv(path, sep='\t', index=False)
+
+def load_json(path):
+    if os.stat(path).st_size == 0:
+        return []
+    with open(path, "r") as f:
+        return json.load(f)
+
+def save_json(records, path):
+    with open(path, "w") as f:
+        json.dump(records, f, indent=4)
+
+def save_compact_json(records, path):
+    with open(path, "w") as f:
+        json.dump(records, f, separators=(",", ":"))
+
+def run_stage(name, checkpoint_path, compute, load=None, save=None, manifest=None, inputs=(), params=None,
+              version=None, timings=None, rows_in=None, stats=None):
+    """
+    Runs one pipeline stage in this process and returns its result. With checkpointing
+    (checkpoint_path set), a checkpoint the manifest shows is up to date with the stage
+    inputs, parameters and version is loaded instead of running the stage, and a new
+    result is saved to it and recorded. With timings (a RunTimings), the stage's metrics
+    (StageMeter) and row counts are recorded; rows_in may be a function called once compute
+    has run, and stats a dict compute fills with cache hits, remote calls and HTTP statistics.
+    """
+    meter = StageMeter()
+    signature = None
+    if checkpoint_path and save is not None and manifest is not None:
+        signature = manifest.signature(inputs, params, version)
+        status = manifest.status(checkpoint_path, signature)
+        if status == "current":
+            print(f"{checkpoint_path} is up to date, skipping {name}.")
+            result = load(checkpoint_path)
+            if timings is not None:
+                metrics = meter.stop()
+                timings.record(name, metrics["wall_seconds"], rows_out=len(result), skipped=True, metrics=metrics)
+            return result
+        if os.path.exists(checkpoint_path):
+            print(f"{checkpoint_path} {describe_status(checkpoint_path, status)}, rerunning {name}.")
+
+    print(f"Running {name}...")
+    result = compute()
+    if checkpoint_path and save is not None:
+        save(result, checkpoint_path)
+        if signature is not None:
+            manifest.record(checkpoint_path, signature)
+        print(f"Checkpoint saved as {checkpoint_path}")
+    metrics = meter.stop()
+    print(f"{name} finished in {metrics['wall_seconds']:.2f} seconds.")
+    if timings is not None:
+        timings.record(name, metrics["wall_seconds"], rows_in() if callable(rows_in) else rows_in, len(result),
+                       metrics=metrics, **(stats or {}))
+    return result
+
+def partial_output_writer(partial_output, interval=PARTIAL_OUTPUT_INTERVAL):
+    """
+    Returns a function giving the on_batch callback for a set. The callbacks collect
+    the Auto-ACMG result rows in memory and rewrite the partial final output at most
+    every interval seconds.
+    """
+    record_sets = {}
+    last_write = [time.time()]
+    lock = threading.Lock()  # Both set branches report batches
+
+    def for_set(set_name):
+        with lock:
+            rows = record_sets.setdefault(set_name, [])
+
+        def on_batch(batch_rows):
+            with lock:
+                rows.extend(batch_rows)
+                if time.time() - last_write[0] < interval:
+                    return
+                df_partial = classify_partial_records(list(record_sets.values()))
+                temp_output = f"{partial_output}.tmp"
+                df_partial.to_csv(temp_output, sep='\t', index=False)
+                os.replace(temp_output, partial_output)
+                print(f"Partial output updated: {len(df_partial)} classified variants in {partial_output}")
+                last_write[0] = time.time()
+
+        return on_batch
+
+    return for_set
+
+def sample_set_stages(base_name, annotated_vcf, annotated_diablo, manifest, table_path=lambda name: None, timings=None):
+    """
+    Returns the Set 1 (with an annotated VCF) and Set 2 stages of merge_files for a sample:
+    ({set_name: path}, {set_name: function returning the set}). A Diablo output larger than
+    STREAMING_THRESHOLD_BYTES is merged by streaming to files in TEST_DIR, unless the manifest
+    shows they are up to date, and the sets are read back from them. A smaller one is read
+    once and merged in memory, through run_stage checkpoints at table_path(name).
+    """
+    has_set1 = bool(annotated_vcf) and os.path.exists(annotated_vcf)
+    set_names = ["set1", "set2"] if has_set1 else ["set2"]
+    merge_code = stage_code("merge_files", "tsv_io", "final_acmg_classifier")
+
+    if os.path.getsize(annotated_diablo) > STREAMING_THRESHOLD_BYTES:
+        # Too large to hold in memory: stream the merge to files and read back the (much smaller) sets
+        merged_variants = os.path.join(TEST_DIR, f"{base_name}_merged_set1.tsv")
+        pathogenic_variants = os.path.join(TEST_DIR, f"{base_name}_pathogenic_set2.tsv")
+        set_paths = {"set1": merged_variants, "set2": pathogenic_variants}
+        signature = manifest.signature([annotated_vcf if has_set1 else "", annotated_diablo, *merge_code])
+        if any(manifest.status(set_paths[set_name], signature) != "current" for set_name in set_names):
+            meter = StageMeter()
+            merge_files_streaming(annotated_vcf if has_set1 else None, annotated_diablo,
+                                  merged_variants if has_set1 else None, pathogenic_variants)
+            for set_name in set_names:
+                manifest.record(set_paths[set_name], signature)
+            metrics = meter.stop()
+            if timings is not None:
+                timings.record("merge_files (streaming)", metrics["wall_seconds"], metrics=metrics)
+        else:
+            print("Streamed Set 1/Set 2 files are up to date, skipping merge_files.")
+        return ({set_name: set_paths[set_name] for set_name in set_names},
+                {set_name: (lambda path=set_paths[set_name]: load_tsv(path)) for set_name in set_names})
+
+    diablo = {}
+    diablo_lock = threading.Lock()
+
+    def read_diablo():
+        # Both sets start from the same Diablo output; read it once
+        with diablo_lock:
+            if not diablo:
+                df2 = read_tsv(annotated_diablo, keep=is_pipeline_column, categorical=True)
+                df2.columns = df2.columns.str.strip()
+                # Also lower-cases ACMG, as the Set 1 join expects
+                diablo["set2"] = select_pathogenic(df2)
+                diablo["all"] = df2
+        return diablo
+
+    set_paths = {"set1": table_path("merged_set1"), "set2": table_path("pathogenic_set2")}
+    merge_stages = {
+        "set1": lambda: run_stage(
+            "merge_files (Set 1)", set_paths["set1"],
+            lambda: merge_common(read_tsv(annotated_vcf, keep=is_pipeline_column, categorical=True), read_diablo()["all"]),
+            load_tsv, save_tsv, manifest, [annotated_vcf, annotated_diablo, *merge_code],
+            timings=timings, rows_in=lambda: len(read_diablo()["all"]),
+        ),
+        "set2": lambda: run_stage(
+            "merge_files (Set 2)", set_paths["set2"],
+            lambda: read_diablo()["set2"], load_tsv, save_tsv, manifest, [annotated_diablo, *merge_code],
+            timings=timings, rows_in=lambda: len(read_diablo()["all"]),
+        ),
+    }
+    return ({set_name: set_paths[set_name] for set_name in set_names},
+            {set_name: merge_stages[set_name] for set_name in set_names})
+
+def main(input_vcf, final_output, annotated_vcf=None, checkpoint=False, table_format="tsv", archive_raw=False,
+         metrics_textfile=PROMETHEUS_TEXTFILE, http_mode="passthrough", http_archive_path=None, auto_acmg_instances=1,
+         triage_rules=None, wintervar_rate=DEFAULT_RATE_LIMIT):
+    """
+    Runs the pipeline stages in this process, handing DataFrames and records from one
+    stage to the next. Intermediate files are written to TEST_DIR only with checkpoint
+    set; a rerun with checkpoint set reuses those the manifest shows are up to date.
+    table_format ("tsv", "parquet" or "arrow") is the format of the table checkpoints;
+    with Parquet or Arrow the JSON checkpoints are also stored compactly. With archive_raw
+    the complete Auto-ACMG responses are kept in TEST_DIR next to the extracted fields.
+    Per-stage metrics are appended to pipeline_metrics.jsonl and written to metrics_textfile for
+    the Prometheus textfile collector. With http_mode "record", every WinterVar and Auto-ACMG
+    response is saved to http_archive_path (TEST_DIR/<sample>_http.sqlite by default); with
+    "replay", they are served from it and neither service (nor the variant cache) is used.
+    Auto-ACMG runs as a pool of auto_acmg_instances servers that the queries are spread over.
+    With triage_rules (see variant_triage.py), variants a rule resolves from their Diablo
+    annotations are classified without WinterVar or Auto-ACMG queries and marked with the
+    rule's code in the Triage column. wintervar_rate caps the WinterVar requests per second
+    (None for no cap).
+    """
     print("Starting pipeline...")
 
-    # Estimate and display runtime
-    num_rows = count_rows_in_file(input_vcf)
-    estimated_time = estimate_runtime(num_rows)
-    print(f"Estimated runtime: {estimated_time:.2f} seconds")
+    # Estimate and display runtime from the per-stage history
+    has_set1 = bool(annotated_vcf) and os.path.exists(annotated_vcf)
+    num_rows, estimated_time, stage_estimates = estimate_runtime(
+        input_vcf, include=lambda stage: has_set1 or not stage.casefold().replace(" ", "").endswith("(set1)"),
+    )
+    print(f"Estimated runtime: {estimated_time:.2f} seconds for {num_rows} variants")
+    for stage, seconds in stage_estimates.items():
+        print(f"  {stage}: {seconds:.2f} seconds")
+    timings = RunTimings(num_rows)
 
     base_name = os.path.splitext(os.path.basename(input_vcf))[0]
     annotated_diablo = os.path.join(TEST_DIR, f"{base_name}_diablo.tsv")
 
-    start_time = time.time()
-
-    ensure_file_exists(annotated_diablo, f"time python Diablo_annotate.py -i {input_vcf} -o {annotated_diablo}")
-
-    merged_variants = os.path.join(TEST_DIR, f"{base_name}_merged_set1.tsv")
-    pathogenic_variants = os.path.join(TEST_DIR, f"{base_name}_pathogenic_set2.tsv")
+    def checkpoint_path(name):
+        return os.path.join(TEST_DIR, f"{base_name}_{name}") if checkpoint else None
 
-    if annotated_vcf:
-        ensure_file_exists(merged_variants, f"python merge_files.py {annotated_vcf} {annotated_diablo} {pathogenic_variants} {merged_variants}")
-    else:
-        ensure_file_exists(pathogenic_variants, f"python merge_files.py {annotated_diablo} {pathogenic_variants}")
-
-    wintervar_set1_json = os.path.join(TEST_DIR, f"{base_name}_wintervar_set1.json")
-    wintervar_set2_json = os.path.join(TEST_DIR, f"{base_name}_wintervar_set2.json")
-
-    if annotated_vcf:
-        ensure_file_exists(wintervar_set1_json, f"python intervar.py {merged_variants} {wintervar_set1_json}")
-    ensure_file_exists(wintervar_set2_json, f"python intervar.py {pathogenic_variants} {wintervar_set2_json}")
-
-    intervar_set1_csv = os.path.join(TEST_DIR, f"{base_name}_intervar_set1.tsv")
-    intervar_set2_csv = os.path.join(TEST_DIR, f"{base_name}_intervar_set2.tsv")
-    merged_set1_intervar = os.path.join(TEST_DIR, f"{base_name}_merged_set1_intervar.tsv")
-    merged_set2_intervar = os.path.join(TEST_DIR, f"{base_name}_merged_set2_intervar.tsv")
-
-    if annotated_vcf:
-        ensure_file_exists(merged_set1_intervar, f"python json_to_csv_intervar.py {wintervar_set1_json} {intervar_set1_csv} {merged_variants} {merged_set1_intervar} set1")
-    ensure_file_exists(merged_set2_intervar, f"python json_to_csv_intervar.py {wintervar_set2_json} {intervar_set2_csv} {pathogenic_variants} {merged_set2_intervar} set2")
-
-    # Start Auto-ACMG server
-    start_auto_acmg_server()
-
-    auto_acmg_set1_json = os.path.join(TEST_DIR, f"{base_name}_auto_acmg_set1.json")
-    auto_acmg_set2_json = os.path.join(TEST_DIR, f"{base_name}_auto_acmg_set2.json")
-    auto_acmg_set1_csv = os.path.join(TEST_DIR, f"{base_name}_auto_acmg_set1.tsv")
-    auto_acmg_set2_csv = os.path.join(TEST_DIR, f"{base_name}_auto_acmg_set2.tsv")
-
-    if annotated_vcf:
-        ensure_file_exists(auto_acmg_set1_json, f"pipenv run python auto-acmg-query.py ../{merged_set1_intervar} ../{auto_acmg_set1_json}", cwd="auto-acmg")
-    ensure_file_exists(auto_acmg_set2_json, f"pipenv run python auto-acmg-query.py ../{merged_set2_intervar} ../{auto_acmg_set2_json}", cwd="auto-acmg")
+    columnar = table_format in FRAME_FORMATS
 
-    if annotated_vcf:
-        ensure_file_exists(auto_acmg_set1_csv, f"python json_csv_auto_cmg.py {auto_acmg_set1_json} {auto_acmg_set1_csv}")
-    ensure_file_exists(auto_acmg_set2_csv, f"python json_csv_auto_cmg.py {auto_acmg_set2_json} {auto_acmg_set2_csv}")
+    def table_path(name):
+        extension = FRAME_FORMATS[table_format][0] if columnar else ".tsv"
+        return checkpoint_path(f"{name}{extension}")
 
-    if not annotated_vcf:
-        run_command(f"python final_acmg_classifier.py DUMMY {auto_acmg_set2_csv} {final_output}")
-    else:
-        ensure_file_exists(final_output, f"python final_acmg_classifier.py {auto_acmg_set1_csv} {auto_acmg_set2_csv} {final_output}")
+    start_time = time.time()
+    manifest = StageManifest(MANIFEST_PATH)
+    auto_acmg_query = load_auto_acmg_query()
+    # One WinterVar rate limit across both sets
+    wintervar_limiter = RateLimiter(wintervar_rate, DEFAULT_BURST)
+
+    http_archive = None
+    if http_mode != "passthrough":
+        http_archive = HttpArchive(http_archive_path or os.path.join(TEST_DIR, f"{base_name}_http.sqlite"), http_mode)
+        print(f"HTTP {http_mode} mode: archive {http_archive.path}")
+    use_cache = http_archive is None
+    replaying = http_mode == "replay"
+
+    # Triage changes which variants are queried, so it is part of the query stages' signatures
+    triage_params = {"triage": triage_rules} if triage_rules is not None else {}
+    triaged = {}
+
+    partial_output = f"{os.path.splitext(final_output)[0]}_partial.tsv"
+    on_batch = partial_output_writer(partial_output)
+
+    # Set 1 and Set 2 run as independent branches; the Auto-ACMG server needs nothing from
+    # either, so it starts in the background right away
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        def start_servers():
+            # A replayed run never calls the servers
+            if replaying:
+                return None, None
+            pool = start_auto_acmg_pool(auto_acmg_instances)
+            # One balancer for both branches, so dispatch sees every request in flight on the pool
+            if pool is None or len(pool.urls) < 2:
+                return pool, None
+            return pool, auto_acmg_query.LeastOutstandingBalancer(pool.urls)
+
+        server_ready = executor.submit(start_servers)
+
+        # Diablo runs in its own environment and always writes its output file
+        meter = StageMeter()
+        diablo_ran = ensure_file_exists(annotated_diablo, f"time python Diablo_annotate.py -i {input_vcf} -o {annotated_diablo}",
+                                        manifest=manifest, inputs=[input_vcf, "Diablo_annotate.py"])
+        metrics = meter.stop()
+        timings.record("Diablo", metrics["wall_seconds"], num_rows, count_table_rows(annotated_diablo) if diablo_ran else None,
+                       skipped=not diablo_ran, metrics=metrics)
+
+        if not has_set1:
+            print("Annotated VCF file is missing. Only Set 2 (Pathogenic Variants) will be processed.")
+        set_paths, merge_stages = sample_set_stages(base_name, annotated_vcf, annotated_diablo, manifest, table_path, timings)
+
+        def run_branch(set_name):
+            """Runs one set from the merge through Auto-ACMG and returns its classifier input."""
+            set_df = merge_stages[set_name]()
+            if triage_rules is not None:
+                meter = StageMeter()
+                rows_in = len(set_df)
+                set_df, triaged[set_name] = triage_variants(set_df, triage_rules, set_name, use_cache)
+                metrics = meter.stop()
+                timings.record(f"Triage ({set_name})", metrics["wall_seconds"], rows_in, len(set_df), metrics=metrics)
+
+            wintervar_json = checkpoint_path(f"wintervar_{set_name}.json")
+            wintervar_stats = {}
+            wintervar_records = run_stage(
+                f"WinterVar ({set_name})", wintervar_json,
+                lambda: query_wintervar(set_df, set_name, use_cache=use_cache, limiter=wintervar_limiter, stats=wintervar_stats,
+                                        archive=http_archive) if not set_df.empty else [],
+                load_json, save_compact_json if columnar else save_json,
+                manifest, [set_paths[set_name], *stage_code("intervar")], {"dataset": set_name, **triage_params}, WINTERVAR_VERSION,
+                timings=timings, rows_in=len(set_df), stats=wintervar_stats,
+            )
+            intervar_path = table_path(f"merged_{set_name}_intervar")
+            merged_df = run_stage(
+                f"InterVar merge ({set_name})", intervar_path,
+                lambda: merge_intervar_frames(intervar_records_to_frame(wintervar_records), set_df, set_name),
+                load_text_tsv, save_tsv,
+                manifest, [wintervar_json, set_paths[set_name], *stage_code("json_to_csv_intervar", "final_acmg_classifier")],
+                {"merge_type": set_name, **triage_params}, timings=timings, rows_in=len(set_df),
+            )
+
+            # auto-acmg-query.py checkpoints and resumes through its own JSONL log
+            auto_acmg_json = checkpoint_path(f"auto_acmg_{set_name}.json")
+            if auto_acmg_json:
+                signature = manifest.signature([intervar_path, auto_acmg_query.__file__],
+                                               version=auto_acmg_query.detect_auto_acmg_version())
+                status = manifest.status(auto_acmg_json, signature)
+                if status in ["stale", "missing"]:
+                    # Results from other inputs or an older Auto-ACMG must not be resumed
+                    for path in [auto_acmg_json, *auto_acmg_query.checkpoint_paths(auto_acmg_json, columnar)]:
+                        if os.path.exists(path):
+                            os.remove(path)
+                if status != "current":
+                    manifest.start(auto_acmg_json, signature)
+
+            raw_archive = os.path.join(TEST_DIR, f"{base_name}_auto_acmg_{set_name}_raw.jsonl.gz") if archive_raw else None
+
+            # The only cross-branch dependency: Auto-ACMG needs the servers
+            _, balancer = server_ready.result()
+            auto_acmg_stats = {}
+            auto_acmg_records = run_stage(
+                f"Auto-ACMG ({set_name})", None,
+                lambda: auto_acmg_query.process_rows(
+                    list(merged_df.columns), frame_to_text_records(merged_df),
+                    output_json=auto_acmg_json, compress=columnar, use_cache=use_cache, on_batch=on_batch(set_name),
+                    raw_archive=raw_archive, stats=auto_acmg_stats, http_archive=http_archive,
+                    balancer=balancer,
+                ),
+                timings=timings, rows_in=len(merged_df), stats=auto_acmg_stats,
+            )
+            if auto_acmg_json:
+                manifest.record(auto_acmg_json, signature)
+            return records_to_classifier_frame(auto_acmg_records)
+
+        print(f"Partial results will be written to {partial_output} as variants are classified.")
+        set_names = ["set1", "set2"] if has_set1 else ["set2"]
+        branches = {set_name: executor.submit(run_branch, set_name) for set_name in set_names}
+        classifier_inputs = {set_name: branch.result() for set_name, branch in branches.items()}
+        wintervar_limiter.report()
+        pool, balancer = server_ready.result()
+        if balancer is not None:
+            balancer.report()
+        if pool is not None:
+            pool.stop()  # The servers keep running for the next run
+        if http_archive is not None:
+            http_archive.report()
+            http_archive.close()
+
+    df_final = run_stage(
+        "final ACMG classification", None,
+        lambda: classify_sets(classifier_inputs.get("set1", pd.DataFrame()), classifier_inputs["set2"]),
+        timings=timings, rows_in=sum(len(df) for df in classifier_inputs.values()),
+    )
+    if triage_rules is not None:
+        # Triaged variants follow the queried ones
+        triaged_frames = [df for df in triaged.values() if not df.empty]
+        triaged_df = classify_triaged(pd.concat(triaged_frames, ignore_index=True) if triaged_frames else pd.DataFrame(), triage_rules)
+        df_final = stack_classified_sets(df_final.assign(**{TRIAGE_COLUMN: ""}), triaged_df)
+    df_final.to_csv(final_output, sep='\t', index=False)
+    print(f"Final output saved as {final_output}")
+
+    # The complete output supersedes the partial one
+    if os.path.exists(partial_output):
+        os.remove(partial_output)
 
     end_time = time.time()
     elapsed_time = end_time - start_time
-    log_execution_time(num_rows, elapsed_time)
+    run = timings.as_dict(elapsed_time)
+    save_run(run)
+    append_metrics_log(run, base_name)
+    write_prometheus_textfile(run, base_name, metrics_textfile)
     print(f"Pipeline execution completed in {elapsed_time:.2f} seconds! Final output: {final_output}")
 
 if __name__ == "__main__":
-    if len(sys.argv) not in [3, 4]:
-        print("Usage: python pipeline.py <input_vcf> [<annotated_vcf>] <final_output>")
+    # Optional flag: keep every intermediate in test/ and resume from what is already there.
+    # --checkpoint=parquet or --checkpoint=arrow stores the intermediate tables in that format.
+    # --archive-raw keeps the complete Auto-ACMG responses in test/.
+    # --metrics-textfile=<path> writes the Prometheus metrics there (e.g. the node_exporter textfile directory).
+    # --http=record saves every WinterVar and Auto-ACMG response to test/<sample>_http.sqlite (or
+    # --http-archive=<path>); --http=replay reruns from that archive without the network.
+    # --auto-acmg-instances=N runs N Auto-ACMG servers (ports 8080 to 8080+N-1) and balances the queries over them.
+    # --triage classifies variants the default triage rules resolve (e.g. BA1) without remote queries;
+    # --triage=<rules.json> uses the rules in that file.
+    # --wintervar-rate=N caps the WinterVar queries at N per second (no cap by default).
+    checkpoint_flags = [arg for arg in sys.argv if arg == "--checkpoint" or arg.startswith("--checkpoint=")]
+    checkpoint = bool(checkpoint_flags)
+    table_format = (checkpoint_flags[-1].partition("=")[2] or "tsv") if checkpoint else "tsv"
+    archive_raw = "--archive-raw" in sys.argv
+    metrics_flags = [arg for arg in sys.argv if arg.startswith("--metrics-textfile=")]
+    metrics_textfile = metrics_flags[-1].partition("=")[2] if metrics_flags else PROMETHEUS_TEXTFILE
+    http_flags = [arg for arg in sys.argv if arg.startswith(("--http=", "--http-archive="))]
+    http_options = dict(arg[2:].split("=", 1) for arg in http_flags)
+    http_mode = http_options.get("http", "passthrough")
+    instance_flags = [arg for arg in sys.argv if arg.startswith("--auto-acmg-instances=")]
+    auto_acmg_instances = int(instance_flags[-1].partition("=")[2]) if instance_flags else 1
+    triage_flags = [arg for arg in sys.argv if arg == "--triage" or arg.startswith("--triage=")]
+    rate_flags = [arg for arg in sys.argv if arg.startswith("--wintervar-rate=")]
+    wintervar_rate = float(rate_flags[-1].partition("=")[2]) if rate_flags else DEFAULT_RATE_LIMIT
+    args = [arg for arg in sys.argv
+            if arg not in checkpoint_flags + metrics_flags + http_flags + instance_flags + triage_flags + rate_flags
+            and arg != "--archive-raw"]
+
+    if (len(args) not in [3, 4] or table_format not in ["tsv", *FRAME_FORMATS] or http_mode not in HTTP_MODES
+            or auto_acmg_instances < 1 or (wintervar_rate is not None and wintervar_rate <= 0)):
+        print("Usage: python pipeline.py <input_vcf> [<annotated_vcf>] <final_output> [--checkpoint[=tsv|parquet|arrow]] "
+              "[--archive-raw] [--metrics-textfile=<path>] [--http=passthrough|record|replay] [--http-archive=<path>] "
+              "[--auto-acmg-instances=<n>] [--triage[=<rules.json>]] [--wintervar-rate=<n>]")
+        sys.exit(1)
+    if table_format != "tsv" and not PYARROW_AVAILABLE:
+        print(f"Error: --checkpoint={table_format} needs pyarrow (pip install pyarrow).")
+        sys.exit(1)
+
+    input_vcf = args[1]
+    final_output = args[-1]
+    annotated_vcf = args[2] if len(args) == 4 else None
+
+    base_name = os.path.splitext(os.path.basename(input_vcf))[0]
+    http_archive_path = http_options.get("http-archive", os.path.join(TEST_DIR, f"{base_name}_http.sqlite"))
+    if http_mode == "replay" and not os.path.exists(http_archive_path):
+        print(f"Error: HTTP archive {http_archive_path} not found; record one with --http=record first.")
         sys.exit(1)
 
-    input_vcf = sys.argv[1]
-    final_output = sys.argv[-1]
-    annotated_vcf = sys.argv[2] if len(sys.argv) == 4 else None
+    triage_rules = None
+    if triage_flags:
+        try:
+            triage_rules = load_triage_rules(triage_flags[-1].partition("=")[2] or None)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
 
-    main(input_vcf, final_output, annotated_vcf)
+    main(input_vcf, final_output, annotated_vcf, checkpoint, table_format, archive_raw, metrics_textfile,
+         http_mode, http_archive_path, auto_acmg_instances, triage_rules, wintervar_rate)
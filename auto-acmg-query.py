@@ -1,9 +1,31 @@
 import csv
+import gzip
 import json
 import os
-import sys
 import subprocess
+import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+# Shared pipeline modules live in the project folder, one level above auto-acmg/
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from variant_cache import VariantCache
+from variant_priority import sort_by_priority, print_priority_summary
+from final_acmg_classifier import BASE_COLUMNS, is_classifier_column
+from stage_metrics import HttpStats, TimedHTTPAdapter
+from http_archive import HttpArchive, ArchiveHTTPAdapter, HTTP_MODES, archive_path
+from auto_acmg_server import instance_urls
+
+# Auto-ACMG prediction endpoint and client defaults
+AUTO_ACMG_URL = "http://localhost:8080/api/v1/predict/seqvar"
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_TIMEOUT = 60
+WORKERS_PER_INSTANCE = 4  # Requests in flight per instance when querying a server pool
+UNREACHABLE_COOLDOWN = 10.0  # Seconds an instance that refused a connection gets no requests
 
 # Function to ensure 'chr' prefix in chromosome notation
 def format_chromosome(chrom):
@@ -14,46 +36,284 @@ def generate_hgvs(chromosome, position, reference_allele, risk_allele):
     formatted_chromosome = format_chromosome(chromosome)
     return f"{formatted_chromosome}:{position}:{reference_allele}:{risk_allele}"
 
+# Function to identify the Auto-ACMG build, so cached predictions from other versions are ignored
+def detect_auto_acmg_version():
+    # This script lives inside the auto-acmg checkout
+    checkout_dir = os.path.dirname(os.path.abspath(__file__))
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                                cwd=checkout_dir)
+        return result.stdout.strip() or "unknown"
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+# Function to create a keep-alive session shared by all query threads
+def create_session(max_workers=DEFAULT_MAX_WORKERS, max_retries=2, backoff_factor=0.3, http_stats=None, archive=None,
+                   num_hosts=1):
+    session = requests.Session()
+    retry_strategy = Retry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=[500, 502, 503, 504],
+    )
+    # One pooled connection per worker (and a pool per server instance) so no thread waits for a
+    # free socket; with http_stats, every request's latency and failure is recorded in it; with
+    # an HttpArchive, responses are recorded into it or replayed from it
+    adapter_args = dict(pool_connections=num_hosts, pool_maxsize=max_workers, max_retries=retry_strategy)
+    if archive is not None:
+        adapter = ArchiveHTTPAdapter(archive, http_stats, **adapter_args)
+    else:
+        adapter = TimedHTTPAdapter(http_stats, **adapter_args) if http_stats is not None else HTTPAdapter(**adapter_args)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+class LeastOutstandingBalancer:
+    """
+    Spreads requests over a pool of Auto-ACMG instances: each request goes to the instance
+    with the fewest requests in flight, ties rotating. An instance that could not be
+    reached gets no requests for UNREACHABLE_COOLDOWN seconds, unless none can be reached.
+    At most max_in_flight requests (WORKERS_PER_INSTANCE per instance by default) are in
+    flight at once; acquire() waits for a free slot. Safe to share between threads, so
+    concurrent process_rows calls can share one balancer and its limit.
+    """
+
+    def __init__(self, urls, max_in_flight=None):
+        self.urls = list(urls)
+        self.max_in_flight = max_in_flight or WORKERS_PER_INSTANCE * len(self.urls)
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self.outstanding = [0] * len(self.urls)
+        self.sent = [0] * len(self.urls)
+        self.skip_until = [0.0] * len(self.urls)
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Returns the URL to send the next request to; release() it when the request is done."""
+        self._slots.acquire()
+        with self._lock:
+            now = time.monotonic()
+            size = len(self.urls)
+            candidates = [i for i in range(size) if self.skip_until[i] <= now] or range(size)
+            chosen = min(candidates, key=lambda i: (self.outstanding[i], (i - self._next) % size))
+            self._next = (chosen + 1) % size
+            self.outstanding[chosen] += 1
+            self.sent[chosen] += 1
+            return self.urls[chosen]
+
+    def release(self, url, unreachable=False):
+        with self._lock:
+            i = self.urls.index(url)
+            self.outstanding[i] -= 1
+            if unreachable:
+                self.skip_until[i] = time.monotonic() + UNREACHABLE_COOLDOWN
+        self._slots.release()
+
+    def report(self):
+        print("Auto-ACMG requests per instance: " + ", ".join(f"{url} {sent}" for url, sent in zip(self.urls, self.sent)))
+
+# Function to fetch JSON data for a single HGVS notation
+def fetch_json(session, hgvs, timeout=DEFAULT_TIMEOUT, balancer=None):
+    """
+    Returns (json_data, error); error is a dict describing the failure or None. With a
+    balancer, the request goes to its least busy instance, and on to the next one if that
+    instance cannot be reached.
+    """
+    if balancer is None:
+        return request_json(session, AUTO_ACMG_URL, hgvs, timeout)
+
+    for _ in balancer.urls:
+        url = balancer.acquire()
+        json_data, error = request_json(session, url, hgvs, timeout)
+        unreachable = error is not None and error["error"] == "connection"
+        balancer.release(url, unreachable)
+        if not unreachable:
+            break
+    return json_data, error
+
+# Function to send one prediction request to an Auto-ACMG instance
+def request_json(session, url, hgvs, timeout=DEFAULT_TIMEOUT):
+    try:
+        response = session.get(url, params={"variant_name": hgvs}, timeout=timeout)
+        response.raise_for_status()
+
+        if not response.text.strip():
+            return None, {"HGVS": hgvs, "error": "empty_response", "message": "Empty response body"}
+
+        return response.json(), None
+
+    except requests.exceptions.JSONDecodeError as e:
+        return None, {"HGVS": hgvs, "error": "json_decode", "message": str(e)}
+    except requests.exceptions.Timeout as e:
+        return None, {"HGVS": hgvs, "error": "timeout", "message": str(e)}
+    except requests.exceptions.HTTPError as e:
+        return None, {"HGVS": hgvs, "error": "http_status", "status_code": e.response.status_code, "message": str(e)}
+    except requests.exceptions.RequestException as e:
+        return None, {"HGVS": hgvs, "error": "connection", "message": str(e)}
+
 # Function to fetch JSON data for a batch of HGVS notations
-def fetch_json_batch(hgvs_list):
-    results = {}
+def fetch_json_batch(hgvs_list, session=None, max_workers=DEFAULT_MAX_WORKERS, timeout=DEFAULT_TIMEOUT, errors=None,
+                     cache=None, version="unknown", balancer=None):
+    """
+    Queries Auto-ACMG for every HGVS in the batch over a pooled keep-alive session,
+    with at most max_workers requests in flight. Failed lookups map to None and, if an
+    errors list is given, a structured error record is appended to it. With a
+    VariantCache, cached predictions are reused and new ones stored. With a balancer,
+    requests are spread over its server instances.
+    """
+    results = {hgvs: None for hgvs in hgvs_list}
+    pending_hgvs = []
     for hgvs in hgvs_list:
-        command = f"curl -X GET 'http://localhost:8080/api/v1/predict/seqvar?variant_name={hgvs}'"
-        try:
-            result = subprocess.run(command, shell=True, check=True, text=True, capture_output=True)
-
-            if not result.stdout.strip():
-                print(f"Warning: Empty response for HGVS {hgvs}")
-                results[hgvs] = None
-                continue
-
-            results[hgvs] = json.loads(result.stdout)
-
-        except subprocess.CalledProcessError as e:
-            print(f"Error: Failed to fetch data for {hgvs}: {e}")
-            results[hgvs] = None
-        except json.JSONDecodeError as e:
-            print(f"Error: JSON decoding failed for {hgvs}: {e}")
-            print("Response received:", result.stdout)
-            results[hgvs] = None
+        cached = cache.get("auto-acmg", version, *hgvs.split(":")) if cache is not None else None
+        if cached is not None:
+            results[hgvs] = cached
+        else:
+            pending_hgvs.append(hgvs)
+
+    if not pending_hgvs:
+        return results
+
+    own_session = session is None
+    if own_session:
+        session = create_session(max_workers)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            responses = executor.map(lambda hgvs: fetch_json(session, hgvs, timeout, balancer), pending_hgvs)
+            for hgvs, (json_data, error) in zip(pending_hgvs, responses):
+                results[hgvs] = json_data
+                if json_data and cache is not None:
+                    cache.put("auto-acmg", version, *hgvs.split(":"), json_data)
+                if error:
+                    print(f"Error: Failed to fetch data for {hgvs}: {error['error']} ({error['message']})")
+                    if errors is not None:
+                        errors.append(error)
+    finally:
+        if own_session:
+            session.close()
 
     return results
 
-# Function to flatten JSON for CSV writing
-def flatten_json(json_obj, parent_key='', sep='_'):
-    items = []
+# Extraction plan built from the classifier's column list: the "_"-joined prefixes of the
+# response fields it reads, so only nested objects that can hold one of them are entered
+CRITERIA_PREFIX = "prediction_criteria_"  # prediction_criteria_<criterion>_prediction
+CONSUMED_PREFIXES = {
+    "_".join(parts[:i])
+    for parts in [col.casefold().split("_") for col in BASE_COLUMNS] + [CRITERIA_PREFIX.split("_")]
+    for i in range(1, len(parts))
+}
+_plan_steps = {}  # Flattened name -> (enter if an object, keep if a value), filled as names are first seen
+
+def plan_step(name):
+    step = _plan_steps.get(name)
+    if step is None:
+        folded = name.casefold()
+        step = (folded in CONSUMED_PREFIXES or folded.startswith(CRITERIA_PREFIX), is_classifier_column(name))
+        _plan_steps[name] = step
+    return step
+
+# Function to pull the fields the classifier reads out of a response
+def extract_fields(json_obj, parent_key='', sep='_'):
+    """
+    Returns the response values final_acmg_classifier.py reads, named by their nested
+    keys joined with sep (prediction_criteria_pvs1_prediction, ...). Objects that cannot
+    contain such a field are skipped without being walked.
+    """
+    fields = {}
     for k, v in json_obj.items():
         new_key = f"{parent_key}{sep}{k}" if parent_key else k
+        enter, keep = plan_step(new_key)
         if isinstance(v, dict):
-            items.extend(flatten_json(v, new_key, sep=sep).items())
-        else:
-            items.append((new_key, v))
-    return dict(items)
-
-# Function to save results incrementally
-def save_results(file_name, data):
-    with open(file_name, 'w') as json_file:
-        json.dump(data, json_file, indent=4)
+            if enter:
+                fields.update(extract_fields(v, new_key, sep=sep))
+        elif keep:
+            fields[new_key] = v
+    return fields
+
+# Function to archive the raw responses of a batch (opt-in)
+def archive_responses(archive_path, json_results):
+    payload = "".join(json.dumps({'HGVS': hgvs, 'response': json_data}) + "\n"
+                      for hgvs, json_data in json_results.items() if json_data)
+    with gzip.open(archive_path, 'at') as archive_file:
+        archive_file.write(payload)
+
+# Function to locate the archive of complete responses next to an output JSON
+def raw_archive_path(output_json):
+    return f"{os.path.splitext(output_json)[0]}_raw.jsonl.gz"
+
+# Function to locate the append-only result log and its resume index
+def checkpoint_paths(output_json, compress=False):
+    base = os.path.splitext(output_json)[0]
+    log_path = f"{base}.jsonl.gz" if compress else f"{base}.jsonl"
+    return log_path, f"{log_path}.idx"
+
+# Function to read the resume index and roll the log back to the last committed batch
+def load_checkpoint(log_path, index_path):
+    """
+    Returns the set of HGVS already saved. Each index line records the HGVS of one
+    batch and the log size after it was fsynced, so anything written past the last
+    complete index line (a batch interrupted mid-save) is truncated away.
+    """
+    finished_hgvs = set()
+    log_offset = 0
+    index_offset = 0
+    if os.path.exists(index_path):
+        with open(index_path, 'rb') as index_file:
+            for line in index_file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # Torn last line from an interrupted save
+                finished_hgvs.update(entry['HGVS'])
+                log_offset = entry['offset']
+                index_offset += len(line)
+        with open(index_path, 'r+b') as index_file:
+            index_file.truncate(index_offset)
+
+    if os.path.exists(log_path) and os.path.getsize(log_path) > log_offset:
+        with open(log_path, 'r+b') as log_file:
+            log_file.truncate(log_offset)
+
+    return finished_hgvs
+
+# Function to append one batch of results to the log and commit it in the index
+def append_checkpoint(log_path, index_path, rows, compress=False):
+    payload = "".join(json.dumps(row) + "\n" for row in rows).encode('utf-8')
+    if compress:
+        payload = gzip.compress(payload)  # One gzip member per batch; members concatenate
+
+    with open(log_path, 'ab') as log_file:
+        log_file.write(payload)
+        log_file.flush()
+        os.fsync(log_file.fileno())
+        log_offset = log_file.tell()
+
+    with open(index_path, 'a') as index_file:
+        index_file.write(json.dumps({'offset': log_offset, 'HGVS': [row['HGVS'] for row in rows]}) + "\n")
+        index_file.flush()
+        os.fsync(index_file.fileno())
+
+# Function to compact the result log into the JSON list json_csv_auto_cmg.py reads
+def compact_checkpoint(log_path, output_json, compress=False, records=None):
+    """Streams the log into output_json; rows are also parsed into records if a list is given."""
+    opener = gzip.open if compress else open
+    temp_json = f"{output_json}.tmp"
+    count = 0
+    with open(temp_json, 'w') as json_file:
+        json_file.write("[")
+        if os.path.exists(log_path):
+            with opener(log_path, 'rt') as log_file:
+                for line in log_file:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    json_file.write(("\n" if count == 0 else ",\n") + line)
+                    if records is not None:
+                        records.append(json.loads(line))
+                    count += 1
+        json_file.write("\n]\n")
+    os.replace(temp_json, output_json)
+    return count
 
 # Function to determine set type and extract appropriate columns
 def determine_set_type(header):
@@ -64,112 +324,261 @@ def determine_set_type(header):
     else:
         return None
 
-# Main function to process TSV, fetch JSON in batches, and save incrementally
-import os
-import csv
-import json
-import sys
+# Function to map HGVS notations to rows (the last row of a repeated variant wins)
+def rows_by_hgvs(rows, set_type):
+    hgvs_to_row = {}
+    for row in rows:
+        if set_type == "set1":
+            hgvs = generate_hgvs(row['CHROMOSOME'], row['CHROMOSOME_POSITION_HG38'], row['REFERENCE_ALLELE'], row['RISK_ALLELE'])
+        else:  # set2
+            hgvs = generate_hgvs(row['chrom'], row['pos'], row['ref_base'], row['alt_base'])
+
+        row['HGVS'] = hgvs
+        hgvs_to_row[hgvs] = row
+    return hgvs_to_row
+
+# Function to collect the response fields process_rows added to its result rows
+def response_fields_by_hgvs(header, records):
+    input_columns = set(header) | {'HGVS'}
+    return {record['HGVS']: {k: v for k, v in record.items() if k not in input_columns} for record in records}
+
+# Function to build result rows from responses already fetched for the same variants
+def attach_response_fields(header, rows, response_fields):
+    """
+    Returns the result rows process_rows would return for rows, taking each variant's
+    response fields from response_fields (HGVS -> fields, from response_fields_by_hgvs)
+    instead of querying Auto-ACMG.
+    """
+    set_type = determine_set_type(header) if header else None
+    if not set_type:
+        return []
+
+    hgvs_to_row = rows_by_hgvs(rows, set_type)
+    results = []
+    for hgvs in sort_by_priority(list(hgvs_to_row), key_row=hgvs_to_row.get):
+        row_data = hgvs_to_row[hgvs]
+        row_data.update(response_fields.get(hgvs, {}))
+        results.append(row_data)
+    return results
+
+# Function to save failed lookups next to the output JSON
+def save_errors(output_json, errors):
+    errors_json = f"{os.path.splitext(output_json)[0]}_errors.json"
+    with open(errors_json, 'w') as json_file:
+        json.dump(errors, json_file, indent=4)
+    print(f"{len(errors)} failed lookups saved to {errors_json}")
+
+# Function to write an empty result list when there is nothing to query
+def write_empty_output(output_json):
+    if output_json:
+        with open(output_json, 'w') as json_file:
+            json.dump([], json_file, indent=4)  # Write empty JSON list
 
-def process_tsv(input_tsv, output_json):
+# Main function to process TSV, fetch JSON in batches, and save incrementally
+def process_tsv(input_tsv, output_json, max_workers=DEFAULT_MAX_WORKERS, timeout=DEFAULT_TIMEOUT, compress=False,
+                use_cache=True, raw_archive=None, http_archive=None, balancer=None):
     # Check if input file exists and is not empty
     if not os.path.exists(input_tsv) or os.stat(input_tsv).st_size == 0:
         print(f"Input file {input_tsv} is empty or missing. Creating an empty output JSON file.")
-        with open(output_json, 'w') as json_file:
-            json.dump([], json_file, indent=4)  # Write empty JSON list
+        write_empty_output(output_json)
         return  # Exit function early
 
-    # Load existing data if present
-    existing_data = {}
-    if os.path.exists(output_json):
-        with open(output_json, 'r') as json_file:
-            try:
-                existing_data = {row['HGVS']: row for row in json.load(json_file)}
-            except json.JSONDecodeError:
-                print("Warning: Corrupted JSON detected. Starting fresh.")
-
-    # Step 1: Read TSV file and extract unique HGVS notations
-    hgvs_to_row = {}  # Map HGVS to row data
     with open(input_tsv, 'r') as tsv_file:
         reader = csv.DictReader(tsv_file, delimiter='\t')
         header = reader.fieldnames
-
-        if not header:  # Handle files with no header row
-            print(f"Error: Input TSV {input_tsv} has no headers. Creating an empty output JSON file.")
-            with open(output_json, 'w') as json_file:
-                json.dump([], json_file, indent=4)
-            return  # Exit early
-
-        set_type = determine_set_type(header)
-        if not set_type:
-            print("Error: Input TSV does not match expected column names for Set 1 or Set 2.")
-            print(f"Found headers: {header}")  # Debugging info
-            with open(output_json, 'w') as json_file:
-                json.dump([], json_file, indent=4)
-            return  # Exit early
-
-        for row in reader:
-            if set_type == "set1":
-                hgvs = generate_hgvs(row['CHROMOSOME'], row['CHROMOSOME_POSITION_HG38'], row['REFERENCE_ALLELE'], row['RISK_ALLELE'])
-            else:  # set2
-                hgvs = generate_hgvs(row['chrom'], row['pos'], row['ref_base'], row['alt_base'])
-
-            row['HGVS'] = hgvs
-            hgvs_to_row[hgvs] = row
+        rows = list(reader) if header else []
+
+    process_rows(header, rows, output_json, max_workers, timeout, compress, use_cache, source=input_tsv,
+                 raw_archive=raw_archive, http_archive=http_archive, balancer=balancer)
+
+# Function to query Auto-ACMG for TSV rows and return the result rows
+def process_rows(header, rows, output_json=None, max_workers=DEFAULT_MAX_WORKERS, timeout=DEFAULT_TIMEOUT,
+                 compress=False, use_cache=True, source="input", on_batch=None, raw_archive=None, stats=None,
+                 http_archive=None, balancer=None):
+    """
+    Queries Auto-ACMG for rows given as dicts of strings (as csv.DictReader reads the
+    merged InterVar TSV) and returns the result rows, each extended with the response
+    fields the classifier reads. With output_json, results are checkpointed to its
+    append-only log, resumed from it and compacted into output_json; without it nothing
+    is written to disk. on_batch, if given, is called with the result rows of every
+    batch as soon as it is saved. With raw_archive, the complete responses are also
+    appended to that gzipped JSON Lines file. If a stats dict is given, the number of
+    cache hits and remote calls and the HTTP request statistics are stored in it. With an
+    HttpArchive, the HTTP responses are recorded into it or replayed from it. With a
+    LeastOutstandingBalancer over an Auto-ACMG pool, each request goes to the instance with
+    the fewest requests in flight, within the balancer's limit on requests in flight.
+    """
+    if not header:  # Handle files with no header row
+        print(f"Error: Input TSV {source} has no headers. Creating an empty output JSON file.")
+        write_empty_output(output_json)
+        return []  # Exit early
+
+    set_type = determine_set_type(header)
+    if not set_type:
+        print("Error: Input TSV does not match expected column names for Set 1 or Set 2.")
+        print(f"Found headers: {header}")  # Debugging info
+        write_empty_output(output_json)
+        return []  # Exit early
+
+    # Step 1: Extract unique HGVS notations
+    hgvs_to_row = rows_by_hgvs(rows, set_type)
 
     if not hgvs_to_row:  # If there are no valid rows, create an empty JSON file
-        print(f"No valid variants found in {input_tsv}. Creating an empty output JSON file.")
-        with open(output_json, 'w') as json_file:
-            json.dump([], json_file, indent=4)
-        return  # Exit early
-
-    unique_hgvs = list(set(hgvs_to_row.keys()))  # Get unique HGVS
-
-    # Step 2: Remove already processed HGVS
-    pending_hgvs = [hgvs for hgvs in unique_hgvs if hgvs not in existing_data]
+        print(f"No valid variants found in {source}. Creating an empty output JSON file.")
+        write_empty_output(output_json)
+        return []  # Exit early
+
+    # Resume from the append-only result log if present
+    finished_hgvs = set()
+    if output_json:
+        log_path, index_path = checkpoint_paths(output_json, compress)
+        if not os.path.exists(index_path) and os.path.exists(output_json):
+            # Seed the log from an output written by a previous (compacted) run
+            with open(output_json, 'r') as json_file:
+                try:
+                    previous_rows = json.load(json_file)
+                except json.JSONDecodeError:
+                    print("Warning: Corrupted JSON detected. Starting fresh.")
+                    previous_rows = []
+            if os.path.exists(log_path):
+                os.remove(log_path)
+            if previous_rows:
+                append_checkpoint(log_path, index_path, previous_rows, compress)
+        finished_hgvs = load_checkpoint(log_path, index_path)
+
+    if raw_archive and not finished_hgvs and os.path.exists(raw_archive):
+        os.remove(raw_archive)  # Fresh run: do not append to responses archived for other inputs
+
+    unique_hgvs = list(hgvs_to_row.keys())  # Get unique HGVS
+
+    # Step 2: Remove already processed HGVS and query clinically relevant variants first
+    pending_hgvs = [hgvs for hgvs in unique_hgvs if hgvs not in finished_hgvs]
+    pending_hgvs = sort_by_priority(pending_hgvs, key_row=hgvs_to_row.get)
+    print_priority_summary(hgvs_to_row[hgvs] for hgvs in pending_hgvs)
 
     print(f"Total unique HGVS: {len(unique_hgvs)}, Pending queries: {len(pending_hgvs)}")
 
-    # Step 3: Process HGVS in batches of 100
+    # Step 3: Process HGVS in batches of 100 over one pooled session
     batch_size = 100
+    http_stats = HttpStats("auto-acmg")
+    if balancer is not None:
+        # Enough threads to fill the balancer; it caps the requests in flight across all its users
+        max_workers = max(max_workers, balancer.max_in_flight)
+    session = create_session(max_workers, http_stats=http_stats, archive=http_archive,
+                             num_hosts=len(balancer.urls) if balancer is not None else 1)
+    cache = VariantCache() if use_cache else None
+    version = detect_auto_acmg_version()
+    errors = []
+    results = []
+    query_start = time.time()
     for i in range(0, len(pending_hgvs), batch_size):
         batch = pending_hgvs[i:i + batch_size]
         print(f"Processing batch {i // batch_size + 1}/{(len(pending_hgvs) + batch_size - 1) // batch_size}...")
 
         # Fetch JSON data for batch
-        json_results = fetch_json_batch(batch)
+        json_results = fetch_json_batch(batch, session=session, max_workers=max_workers, timeout=timeout, errors=errors,
+                                        cache=cache, version=version, balancer=balancer)
 
-        # Update results and existing data
+        # Update results for this batch
+        batch_rows = []
         for hgvs, json_data in json_results.items():
             row_data = hgvs_to_row[hgvs]
             if json_data:
-                flattened_json = flatten_json(json_data)
-                row_data.update(flattened_json)
+                row_data.update(extract_fields(json_data))
 
-            existing_data[hgvs] = row_data
+            batch_rows.append(row_data)
 
-        # Save progress after every batch
-        save_results(output_json, list(existing_data.values()))
+        if raw_archive:
+            archive_responses(raw_archive, json_results)
 
-        print(f"Saved {len(existing_data)} entries to {output_json}")
-
-    print(f"Processing complete. All data saved as {output_json}.")
+        # Append progress after every batch (constant cost per batch)
+        finished_hgvs.update(json_results)
+        if output_json:
+            append_checkpoint(log_path, index_path, batch_rows, compress)
+            print(f"Saved {len(finished_hgvs)} entries to {log_path}")
+        else:
+            results.extend(batch_rows)
+        if on_batch is not None:
+            on_batch(batch_rows)
+
+    session.close()
+    if stats is not None:
+        stats.update(cache_hits=cache.hits if cache is not None else 0,
+                     remote_calls=cache.misses if cache is not None else len(pending_hgvs), http=http_stats.summary())
+    if cache is not None:
+        cache.report()
+        cache.close()
+
+    query_time = time.time() - query_start
+    if pending_hgvs:
+        print(f"Queried {len(pending_hgvs)} variants in {query_time:.2f} seconds "
+              f"({len(pending_hgvs) / max(query_time, 1e-9):.1f} variants/sec, {max_workers} workers)")
+
+    if not output_json:
+        if errors:
+            print(f"{len(errors)} lookups failed.")
+        print(f"Processing complete. {len(results)} entries classified.")
+        return results
+
+    if errors:
+        save_errors(output_json, errors)
+
+    # Compact the log into the final JSON list and drop the checkpoint files
+    count = compact_checkpoint(log_path, output_json, compress, records=results)
+    for checkpoint_file in [index_path, log_path]:
+        if os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+
+    print(f"Processing complete. {count} entries saved as {output_json}.")
+    return results
 
 # Entry point for running the script
 if __name__ == "__main__":
     start_time = time.time()
 
-    if len(sys.argv) != 3:
-        print("Usage: python auto-acmg-query.py <input_tsv> <output_json>")
+    # Optional flags: gzip-compress the checkpoint log, bypass the cross-run variant cache,
+    # keep the complete responses in <output>_raw.jsonl.gz; --http=record|replay records the HTTP
+    # responses into (or replays them from) --http-archive=<path>, <output>_http.sqlite by default;
+    # --instances=N spreads the queries over a pool of N servers on the ports from 8080
+    compress = "--compress" in sys.argv
+    archive_raw = "--archive-raw" in sys.argv
+    option_flags = [arg for arg in sys.argv if arg.startswith(("--http=", "--http-archive=", "--instances="))]
+    options = dict(arg[2:].split("=", 1) for arg in option_flags)
+    http_mode = options.get("http", "passthrough")
+    use_cache = "--no-cache" not in sys.argv and http_mode == "passthrough"
+    args = [arg for arg in sys.argv if arg not in ["--compress", "--no-cache", "--archive-raw"] + option_flags]
+
+    if len(args) not in [3, 4] or http_mode not in HTTP_MODES:
+        print("Usage: python auto-acmg-query.py <input_tsv> <output_json> [<max_workers>] [--compress] [--no-cache] "
+              "[--archive-raw] [--http=passthrough|record|replay] [--http-archive=<path>] [--instances=<n>]")
         sys.exit(1)
 
-    input_tsv = sys.argv[1]  # Get input file name from command line
-    output_json = sys.argv[2]  # Get output file name from command line
+    input_tsv = args[1]  # Get input file name from command line
+    output_json = args[2]  # Get output file name from command line
+    max_workers = int(args[3]) if len(args) == 4 else DEFAULT_MAX_WORKERS
 
     if not os.path.exists(input_tsv):
         print(f"Error: Input file {input_tsv} not found. Please provide a valid TSV file.")
         sys.exit(1)
 
-    process_tsv(input_tsv, output_json)
+    http_archive = None
+    if http_mode != "passthrough":
+        try:
+            http_archive = HttpArchive(options.get("http-archive", archive_path(output_json)), http_mode)
+        except FileNotFoundError as error:
+            print(f"Error: {error}")
+            sys.exit(1)
+
+    raw_archive = raw_archive_path(output_json) if archive_raw else None
+    instances = int(options.get("instances", 1))
+    balancer = LeastOutstandingBalancer(instance_urls(instances)) if instances > 1 else None
+    process_tsv(input_tsv, output_json, max_workers, compress=compress, use_cache=use_cache, raw_archive=raw_archive,
+                http_archive=http_archive, balancer=balancer)
+    if balancer is not None:
+        balancer.report()
+    if http_archive is not None:
+        http_archive.report()
+        http_archive.close()
 
     end_time = time.time()
     elapsed_time = end_time - start_time
@@ -0,0 +1,261 @@
+import hashlib
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import requests
+
+# Auto-ACMG checkout (set up by auto-acmg.py) and the port the query client uses; a pool
+# of N instances listens on the N consecutive ports from AUTO_ACMG_PORT
+AUTO_ACMG_DIR = "auto-acmg"
+AUTO_ACMG_PORT = 8080
+PROBE_URL = f"http://localhost:{AUTO_ACMG_PORT}/api/v1/predict/seqvar"
+DEFAULT_STARTUP_TIMEOUT = 30
+PROBE_INTERVAL = 0.25
+HEALTH_CHECK_INTERVAL = 5.0  # Seconds between pool health checks
+MAX_FAILED_PROBES = 3  # Consecutive failed health checks before an instance is restarted
+LOG_FILE = "auto_acmg.log"
+PID_FILE = "auto_acmg.pid"
+LOCK_STAMP_FILE = ".pipfile_lock.sha256"  # Hash of the Pipfile.lock last installed
+
+class ServerStartError(RuntimeError):
+    """An Auto-ACMG instance could not be started."""
+
+def server_url(port):
+    return f"http://localhost:{port}/api/v1/predict/seqvar"
+
+def instance_urls(instances):
+    """Prediction URLs of a pool of the given size."""
+    return [server_url(AUTO_ACMG_PORT + i) for i in range(instances)]
+
+def instance_file(name, port):
+    """The log or PID file of the instance on port (the first instance keeps the plain names)."""
+    if port == AUTO_ACMG_PORT:
+        return name
+    stem, extension = os.path.splitext(name)
+    return f"{stem}_{port}{extension}"
+
+def probe_server(url=PROBE_URL, timeout=2):
+    """
+    True if an Auto-ACMG server answers at url. The prediction endpoint rejects a request
+    without variant_name during validation (422), so the probe runs no prediction.
+    """
+    try:
+        response = requests.get(url, timeout=timeout)
+    except requests.exceptions.RequestException:
+        return False
+    return response.status_code in [200, 422]
+
+def pipenv_environment(auto_acmg_dir):
+    env = os.environ.copy()
+    env["PIPENV_PIPFILE"] = os.path.abspath(os.path.join(auto_acmg_dir, "Pipfile"))
+    return env
+
+def lockfile_digest(auto_acmg_dir):
+    lock_path = os.path.join(auto_acmg_dir, "Pipfile.lock")
+    if not os.path.exists(lock_path):
+        return None
+    with open(lock_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def ensure_dependencies(auto_acmg_dir, env):
+    """Runs pipenv install only if Pipfile.lock changed since the last install or the virtualenv is gone."""
+    stamp_path = os.path.join(auto_acmg_dir, LOCK_STAMP_FILE)
+    digest = lockfile_digest(auto_acmg_dir)
+    if digest and os.path.exists(stamp_path):
+        with open(stamp_path, "r") as f:
+            installed = f.read().strip()
+        venv = subprocess.run(["pipenv", "--venv"], cwd=auto_acmg_dir, env=env, capture_output=True)
+        if installed == digest and venv.returncode == 0:
+            print("Auto-ACMG dependencies match Pipfile.lock, skipping pipenv install.")
+            return
+
+    subprocess.run(["pipenv", "install"], cwd=auto_acmg_dir, env=env, check=True)
+
+    digest = lockfile_digest(auto_acmg_dir)  # pipenv install may have (re)locked
+    if digest:
+        with open(stamp_path, "w") as f:
+            f.write(digest + "\n")
+
+def stop_server(process_group, timeout=10):
+    """Stops a server process group started by start_auto_acmg_server (SIGTERM, then SIGKILL)."""
+    try:
+        os.killpg(process_group, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        return
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            os.killpg(process_group, 0)
+        except (ProcessLookupError, PermissionError):
+            return
+        time.sleep(PROBE_INTERVAL)
+    try:
+        os.killpg(process_group, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def stop_previous_server(auto_acmg_dir, port=AUTO_ACMG_PORT):
+    """Stops a server this module started earlier on port (recorded in its PID file) that no longer answers."""
+    pid_path = os.path.join(auto_acmg_dir, instance_file(PID_FILE, port))
+    if not os.path.exists(pid_path):
+        return
+    with open(pid_path, "r") as f:
+        pid = f.read().strip()
+    os.remove(pid_path)
+    if pid.isdigit():
+        print(f"Stopping unresponsive Auto-ACMG server on port {port} (process group {pid})...")
+        stop_server(int(pid))
+
+def read_log_tail(log_path, size=4096):
+    try:
+        with open(log_path, "rb") as log_file:
+            log_file.seek(max(0, os.path.getsize(log_path) - size))
+            return log_file.read().decode("utf-8", errors="ignore")
+    except OSError:
+        return ""
+
+def launch_servers(ports, auto_acmg_dir=AUTO_ACMG_DIR, timeout=DEFAULT_STARTUP_TIMEOUT):
+    """
+    Makes sure an Auto-ACMG server answers on every port. Healthy running servers are
+    reused; the others are started together (without the reloader), each in its own
+    process group. Returns {port: process} of the started servers once all answer the
+    HTTP probe; raises ServerStartError if one exits or the timeout passes.
+    """
+    missing = []
+    for port in ports:
+        if probe_server(server_url(port)):
+            print(f"Auto-ACMG Server already running on port {port}, reusing it.")
+        else:
+            missing.append(port)
+    if not missing:
+        return {}
+
+    print(f"Starting Auto-ACMG Server on port{'s' if len(missing) > 1 else ''} {', '.join(map(str, missing))}...")
+    if not os.path.exists(auto_acmg_dir):
+        raise ServerStartError("auto-acmg directory not found.")
+
+    env = pipenv_environment(auto_acmg_dir)
+    try:
+        ensure_dependencies(auto_acmg_dir, env)
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise ServerStartError(f"Could not install Auto-ACMG dependencies: {e}")
+
+    # The timeout covers the server startup only, not the dependency install before it
+    start = time.monotonic()
+    processes = {}
+    for port in missing:
+        stop_previous_server(auto_acmg_dir, port)
+        command = ["pipenv", "run", "uvicorn", "src.main:app", "--host", "0.0.0.0", "--port", str(port)]
+        with open(os.path.join(auto_acmg_dir, instance_file(LOG_FILE, port)), "w") as log_file:
+            processes[port] = subprocess.Popen(command, cwd=auto_acmg_dir, env=env, stdout=log_file,
+                                               stderr=subprocess.STDOUT, start_new_session=True)
+        with open(os.path.join(auto_acmg_dir, instance_file(PID_FILE, port)), "w") as f:
+            f.write(f"{processes[port].pid}\n")
+
+    pending = set(missing)
+    deadline = start + timeout
+    while time.monotonic() < deadline:
+        for port in sorted(pending):
+            if probe_server(server_url(port), timeout=PROBE_INTERVAL * 4):
+                print(f"Auto-ACMG Server is running on port {port} (ready after {time.monotonic() - start:.1f} seconds).")
+                pending.discard(port)
+                continue
+
+            process = processes[port]
+            if process.poll() is not None:
+                log_path = os.path.join(auto_acmg_dir, instance_file(LOG_FILE, port))
+                for other in pending - {port}:
+                    stop_server(processes[other].pid)
+                if "Address already in use" in read_log_tail(log_path):
+                    raise ServerStartError(
+                        f"Port {port} is held by another process that is not a healthy Auto-ACMG server.\n"
+                        f"Find it with 'lsof -i :{port}' and stop it, then rerun the pipeline.")
+                raise ServerStartError(f"Auto-ACMG Server exited with code {process.returncode}. Check {log_path} for details.")
+        if not pending:
+            return processes
+        time.sleep(PROBE_INTERVAL)
+
+    for port in pending:
+        stop_server(processes[port].pid)
+    log_paths = ", ".join(os.path.join(auto_acmg_dir, instance_file(LOG_FILE, port)) for port in sorted(pending))
+    raise ServerStartError(f"Auto-ACMG Server did not become ready within {timeout} seconds. Check {log_paths} for details.")
+
+def start_auto_acmg_server(auto_acmg_dir=AUTO_ACMG_DIR, timeout=DEFAULT_STARTUP_TIMEOUT):
+    """
+    Makes sure an Auto-ACMG server answers on AUTO_ACMG_PORT. A healthy running server is
+    reused; otherwise one is started (without the reloader) in its own process group and
+    reported ready as soon as the HTTP probe succeeds.
+    """
+    try:
+        launch_servers([AUTO_ACMG_PORT], auto_acmg_dir, timeout)
+    except ServerStartError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+class AutoACMGPool:
+    """
+    A pool of Auto-ACMG instances on consecutive ports from AUTO_ACMG_PORT. A background
+    thread probes every instance and restarts one that exited or failed MAX_FAILED_PROBES
+    checks in a row. Instances keep running after stop(), so the next run reuses them.
+    """
+
+    def __init__(self, instances, auto_acmg_dir=AUTO_ACMG_DIR, timeout=DEFAULT_STARTUP_TIMEOUT):
+        self.ports = [AUTO_ACMG_PORT + i for i in range(instances)]
+        self.auto_acmg_dir = auto_acmg_dir
+        self.timeout = timeout
+        self.processes = {}
+        self.restarts = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def urls(self):
+        return [server_url(port) for port in self.ports]
+
+    def start(self):
+        self.processes = launch_servers(self.ports, self.auto_acmg_dir, self.timeout)
+        self._thread = threading.Thread(target=self._monitor, daemon=True)
+        self._thread.start()
+        return self
+
+    def _monitor(self):
+        failed_probes = {port: 0 for port in self.ports}
+        while not self._stopped.wait(HEALTH_CHECK_INTERVAL):
+            for port in self.ports:
+                if probe_server(server_url(port)):
+                    failed_probes[port] = 0
+                    continue
+                failed_probes[port] += 1
+                process = self.processes.get(port)
+                exited = process is not None and process.poll() is not None
+                if not exited and failed_probes[port] < MAX_FAILED_PROBES:
+                    continue  # Possibly just busy
+
+                print(f"Auto-ACMG instance on port {port} is not answering, restarting it...")
+                if process is not None and not exited:
+                    stop_server(process.pid)
+                try:
+                    self.processes.update(launch_servers([port], self.auto_acmg_dir, self.timeout))
+                    self.restarts += 1
+                except ServerStartError as e:
+                    print(f"Error: Could not restart the Auto-ACMG instance on port {port}: {e}")
+                failed_probes[port] = 0
+
+    def stop(self):
+        """Stops health checking (the instances keep running)."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.restarts:
+            print(f"Auto-ACMG pool: {self.restarts} instance restarts")
+
+def start_auto_acmg_pool(instances, auto_acmg_dir=AUTO_ACMG_DIR, timeout=DEFAULT_STARTUP_TIMEOUT):
+    """Starts (or reuses) a pool of Auto-ACMG instances and returns it once every instance answers."""
+    try:
+        return AutoACMGPool(instances, auto_acmg_dir, timeout).start()
+    except ServerStartError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,178 @@
+import sys
+import time
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from tsv_io import frame_to_text_records
+from merge_files import LEFT_KEYS, RIGHT_KEYS
+from intervar import query_wintervar, RateLimiter, DEFAULT_RATE_LIMIT, DEFAULT_BURST
+from json_to_csv_intervar import intervar_records_to_frame, merge_intervar_frames
+from final_acmg_classifier import records_to_classifier_frame, classify_sets
+from variant_keys import VariantKeyEncoder
+from stage_manifest import StageManifest
+from auto_acmg_server import start_auto_acmg_server
+from PIPELINE import TEST_DIR, MANIFEST_PATH, ensure_file_exists, load_auto_acmg_query, sample_set_stages
+
+# Columns the queries identify a variant by: Set 1 rows by the annotated VCF key, Set 2 rows by the Diablo key
+SET_KEYS = {"set1": LEFT_KEYS, "set2": RIGHT_KEYS}
+
+def sample_name(input_vcf):
+    return os.path.splitext(os.path.basename(input_vcf))[0]
+
+def read_sample_manifest(manifest_path):
+    """
+    Reads a batch manifest: one sample per line, "<input_vcf> [<annotated_vcf>]" separated
+    by tabs or spaces. Blank lines and lines starting with "#" are skipped.
+    """
+    samples = []
+    with open(manifest_path, "r") as f:
+        for line_number, line in enumerate(f, 1):
+            fields = line.split()
+            if not fields or fields[0].startswith("#"):
+                continue
+            if len(fields) > 2:
+                raise ValueError(f"{manifest_path} line {line_number}: expected <input_vcf> [<annotated_vcf>]")
+            samples.append((fields[0], fields[1] if len(fields) == 2 else None))
+
+    # Per-sample files in test/ and the output directory are named after the VCF
+    base_names = [sample_name(input_vcf) for input_vcf, _ in samples]
+    duplicates = sorted({name for name in base_names if base_names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"{manifest_path}: several samples are named {', '.join(duplicates)}")
+    return samples
+
+def load_sample_sets(input_vcf, annotated_vcf, manifest):
+    """
+    Returns the Set 1 (if the sample has an annotated VCF) and Set 2 frames of a sample, as
+    PIPELINE.main builds them (see sample_set_stages). Large Diablo outputs are merged to
+    files in TEST_DIR, which later calls read back while the manifest shows them up to date.
+    """
+    base_name = sample_name(input_vcf)
+    annotated_diablo = os.path.join(TEST_DIR, f"{base_name}_diablo.tsv")
+    _, merge_stages = sample_set_stages(base_name, annotated_vcf, annotated_diablo, manifest)
+    return {set_name: merge_stage() for set_name, merge_stage in merge_stages.items()}
+
+class UniqueVariants:
+    """
+    Collects the rows of one set across samples, keeping the first row seen for every
+    variant. Variants are compared by packed variant key, so the set of keys seen so far
+    is a sorted int64 array.
+    """
+
+    def __init__(self, key_columns):
+        self.key_columns = key_columns
+        self.encoder = VariantKeyEncoder()
+        self.keys = np.empty(0, dtype=np.int64)
+        self.frames = []
+        self.total_rows = 0
+
+    def add(self, df):
+        if df.empty:
+            return
+        self.total_rows += len(df)
+        keys = self.encoder.encode(*(df[col] for col in self.key_columns))
+        new = ~pd.Series(keys).duplicated().to_numpy() & ~np.isin(keys, self.keys)
+        if new.any():
+            self.frames.append(df[new])
+            self.keys = np.union1d(self.keys, keys[new])
+
+    def frame(self):
+        return pd.concat(self.frames, ignore_index=True) if self.frames else pd.DataFrame()
+
+def main(manifest_path, output_dir, wintervar_rate=DEFAULT_RATE_LIMIT):
+    """
+    Runs the pipeline for every sample in a batch manifest, querying WinterVar and
+    Auto-ACMG once per unique variant of the batch instead of once per sample.
+    Diablo runs per sample (skipped when its output in TEST_DIR is up to date); the
+    Set 1 and Set 2 rows of all samples are deduplicated on their variant key and
+    queried; each sample's rows then get the results of their variants and are
+    classified into <output_dir>/<sample>_final.tsv.
+    """
+    print("Starting batch pipeline...")
+    start_time = time.time()
+    samples = read_sample_manifest(manifest_path)
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"{len(samples)} samples in {manifest_path}")
+
+    manifest = StageManifest(MANIFEST_PATH)
+    auto_acmg_query = load_auto_acmg_query()
+    wintervar_limiter = RateLimiter(wintervar_rate, DEFAULT_BURST)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        server_ready = executor.submit(start_auto_acmg_server)
+
+        # Pass 1: annotate every sample and collect the unique variants of each set.
+        # Sample frames are not kept; pass 2 reads them again, so memory follows the unique variants.
+        unique_variants = {set_name: UniqueVariants(keys) for set_name, keys in SET_KEYS.items()}
+        for input_vcf, annotated_vcf in samples:
+            annotated_diablo = os.path.join(TEST_DIR, f"{sample_name(input_vcf)}_diablo.tsv")
+            ensure_file_exists(annotated_diablo, f"time python Diablo_annotate.py -i {input_vcf} -o {annotated_diablo}",
+                               manifest=manifest, inputs=[input_vcf, "Diablo_annotate.py"])
+            for set_name, set_df in load_sample_sets(input_vcf, annotated_vcf, manifest).items():
+                unique_variants[set_name].add(set_df)
+
+        # Query each unique variant once
+        intervar_frames = {}
+        response_fields = {}
+        for set_name, variants in unique_variants.items():
+            unique_df = variants.frame()
+            print(f"{set_name}: {variants.total_rows} rows across the samples, {len(unique_df)} unique variants to query")
+            if unique_df.empty:
+                intervar_frames[set_name] = intervar_records_to_frame([])
+                response_fields[set_name] = {}
+                continue
+
+            stage_start = time.time()
+            intervar_frames[set_name] = intervar_records_to_frame(query_wintervar(unique_df, set_name, limiter=wintervar_limiter))
+            merged_df = merge_intervar_frames(intervar_frames[set_name], unique_df, set_name)
+            print(f"WinterVar ({set_name}) finished in {time.time() - stage_start:.2f} seconds.")
+
+            server_ready.result()
+            stage_start = time.time()
+            header = list(merged_df.columns)
+            records = auto_acmg_query.process_rows(header, frame_to_text_records(merged_df), source=f"{set_name} batch")
+            response_fields[set_name] = auto_acmg_query.response_fields_by_hgvs(header, records)
+            print(f"Auto-ACMG ({set_name}) finished in {time.time() - stage_start:.2f} seconds.")
+        wintervar_limiter.report()
+
+    # Pass 2: give every sample's rows the results of their variants and classify them
+    for input_vcf, annotated_vcf in samples:
+        base_name = sample_name(input_vcf)
+        classifier_inputs = {}
+        for set_name, set_df in load_sample_sets(input_vcf, annotated_vcf, manifest).items():
+            merged_df = merge_intervar_frames(intervar_frames[set_name], set_df, set_name)
+            records = auto_acmg_query.attach_response_fields(list(merged_df.columns), frame_to_text_records(merged_df),
+                                                             response_fields[set_name])
+            classifier_inputs[set_name] = records_to_classifier_frame(records)
+
+        df_final = classify_sets(classifier_inputs.get("set1", pd.DataFrame()), classifier_inputs["set2"])
+        final_output = os.path.join(output_dir, f"{base_name}_final.tsv")
+        df_final.to_csv(final_output, sep='\t', index=False)
+        print(f"Final output saved as {final_output}")
+
+    elapsed_time = time.time() - start_time
+    print(f"Batch pipeline completed in {elapsed_time:.2f} seconds! {len(samples)} final outputs in {output_dir}")
+
+if __name__ == "__main__":
+    # Optional flag: --wintervar-rate=N caps the WinterVar queries at N per second (no cap by default)
+    rate_flags = [arg for arg in sys.argv if arg.startswith("--wintervar-rate=")]
+    wintervar_rate = float(rate_flags[-1].partition("=")[2]) if rate_flags else DEFAULT_RATE_LIMIT
+    args = [arg for arg in sys.argv if arg not in rate_flags]
+    if len(args) != 3 or (wintervar_rate is not None and wintervar_rate <= 0):
+        print("Usage: python batch_pipeline.py <sample_manifest> <output_dir> [--wintervar-rate=<n>]")
+        sys.exit(1)
+
+    manifest_path = args[1]
+    output_dir = args[2]
+    if not os.path.exists(manifest_path):
+        print(f"Error: Sample manifest {manifest_path} not found.")
+        sys.exit(1)
+
+    try:
+        read_sample_manifest(manifest_path)
+    except ValueError as error:
+        print(f"Error: {error}")
+        sys.exit(1)
+
+    main(manifest_path, output_dir, wintervar_rate)
@@ -0,0 +1,83 @@
+import io
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_DIR)
+import final_acmg_classifier
+
+# Row-wise implementations replaced by the vectorized helpers, kept for comparison
+def legacy_binarize_applicable(values):
+    return values.apply(lambda x: 1 if isinstance(x, str) and x.strip().casefold() == "applicable" else 0)
+
+def legacy_flag_pathogenicity(acmg):
+    return acmg.apply(
+        lambda x: "0" if pd.isna(x) or str(x).strip() == "" or "benign" in str(x).casefold() or "vus" in str(x).casefold()
+        else "1"
+    )
+
+def legacy_flag_phenotype(phenotype_ids):
+    return phenotype_ids.fillna("").apply(lambda x: 1 if str(x).strip() not in ["", "-"] else 0)
+
+def legacy_combine_acmg(acmg, intervar):
+    return pd.concat([acmg.rename("ACMG"), intervar.rename("Intervar")], axis=1).apply(
+        lambda x: "/".join(x.dropna().astype(str)).strip("/") if x.notna().any() else "", axis=1
+    )
+
+def make_frame(num_rows, seed=0):
+    """Synthetic columns with the value mix seen in real classifier inputs (NaN, blanks, padding, case)."""
+    rng = np.random.default_rng(seed)
+    predictions = np.array(["Applicable", "NotApplicable", " applicable ", "APPLICABLE", "Failed", "", None], dtype=object)
+    acmg_calls = np.array(["Pathogenic", "Likely pathogenic", "Benign", "Likely benign", "VUS", "", " ", None], dtype=object)
+    intervar_calls = np.array(["Likely pathogenic", "Uncertain significance", "Benign", "auto/", "", None], dtype=object)
+    phenotypes = np.array(["HP:0001250", "-", " - ", "", "OMIM:1234", None], dtype=object)
+    return pd.DataFrame({
+        "prediction": rng.choice(predictions, num_rows),
+        "ACMG": rng.choice(acmg_calls, num_rows),
+        "Intervar": rng.choice(intervar_calls, num_rows),
+        "PHENOTYPEIDS": rng.choice(phenotypes, num_rows),
+    })
+
+def to_tsv(series):
+    buffer = io.StringIO()
+    series.to_csv(buffer, sep='\t', index=False, header=False)
+    return buffer.getvalue()
+
+def run_step(name, legacy, vectorized, args):
+    start_time = time.perf_counter()
+    expected = legacy(*args)
+    legacy_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    result = vectorized(*args)
+    vectorized_time = time.perf_counter() - start_time
+
+    identical = to_tsv(expected) == to_tsv(result)
+    print(f"  {name:<20} legacy {legacy_time:8.3f} s   vectorized {vectorized_time:8.3f} s   "
+          f"{legacy_time / max(vectorized_time, 1e-9):7.1f}x   identical output: {identical}")
+    return identical
+
+def main(sizes):
+    all_identical = True
+    for num_rows in sizes:
+        df = make_frame(num_rows)
+        print(f"{num_rows} rows")
+        steps = [
+            ("binarize_applicable", legacy_binarize_applicable, final_acmg_classifier.binarize_applicable, (df["prediction"],)),
+            ("flag_pathogenicity", legacy_flag_pathogenicity, final_acmg_classifier.flag_pathogenicity, (df["ACMG"],)),
+            ("flag_phenotype", legacy_flag_phenotype, final_acmg_classifier.flag_phenotype, (df["PHENOTYPEIDS"],)),
+            ("combine_acmg", legacy_combine_acmg, final_acmg_classifier.combine_acmg, (df["ACMG"], df["Intervar"])),
+        ]
+        for name, legacy, vectorized, args in steps:
+            all_identical &= run_step(name, legacy, vectorized, args)
+
+    if not all_identical:
+        print("Error: vectorized output differs from the row-wise implementation.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    main(sizes)
@@ -0,0 +1,66 @@
+import importlib.util
+import os
+import subprocess
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_DIR)
+
+# Load auto-acmg-query.py (hyphenated name, not importable with a plain import)
+spec = importlib.util.spec_from_file_location("auto_acmg_query", os.path.join(PROJECT_DIR, "auto-acmg-query.py"))
+auto_acmg_query = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(auto_acmg_query)
+
+# Previous client: one shell + curl process per HGVS, run sequentially
+def fetch_json_batch_curl(hgvs_list):
+    results = {}
+    for hgvs in hgvs_list:
+        command = f"curl -s -X GET '{auto_acmg_query.AUTO_ACMG_URL}?variant_name={hgvs}'"
+        result = subprocess.run(command, shell=True, text=True, capture_output=True)
+        results[hgvs] = result.stdout or None
+    return results
+
+def read_hgvs(input_tsv, limit):
+    """Reads HGVS notations from a set 1 or set 2 TSV, as process_tsv does."""
+    import csv
+    hgvs_list = []
+    with open(input_tsv, 'r') as tsv_file:
+        reader = csv.DictReader(tsv_file, delimiter='\t')
+        set_type = auto_acmg_query.determine_set_type(reader.fieldnames or [])
+        for row in reader:
+            if set_type == "set1":
+                hgvs = auto_acmg_query.generate_hgvs(row['CHROMOSOME'], row['CHROMOSOME_POSITION_HG38'], row['REFERENCE_ALLELE'], row['RISK_ALLELE'])
+            else:
+                hgvs = auto_acmg_query.generate_hgvs(row['chrom'], row['pos'], row['ref_base'], row['alt_base'])
+            hgvs_list.append(hgvs)
+            if len(hgvs_list) >= limit:
+                break
+    return hgvs_list
+
+def main(input_tsv, limit=500, max_workers=auto_acmg_query.DEFAULT_MAX_WORKERS):
+    hgvs_list = read_hgvs(input_tsv, limit)
+    print(f"Benchmarking {len(hgvs_list)} variants against {auto_acmg_query.AUTO_ACMG_URL}")
+
+    start_time = time.time()
+    fetch_json_batch_curl(hgvs_list)
+    curl_time = time.time() - start_time
+    print(f"curl per variant:     {len(hgvs_list) / curl_time:8.1f} variants/sec ({curl_time:.2f} s)")
+
+    start_time = time.time()
+    auto_acmg_query.fetch_json_batch(hgvs_list, max_workers=max_workers)
+    pooled_time = time.time() - start_time
+    print(f"pooled ({max_workers} workers): {len(hgvs_list) / pooled_time:8.1f} variants/sec ({pooled_time:.2f} s)")
+
+    print(f"Speedup: {curl_time / pooled_time:.1f}x")
+
+if __name__ == "__main__":
+    if len(sys.argv) not in [2, 3, 4]:
+        print("Usage: python benchmarks/bench_auto_acmg_client.py <input_tsv> [<limit>] [<max_workers>]")
+        sys.exit(1)
+
+    input_tsv = sys.argv[1]
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    max_workers = int(sys.argv[3]) if len(sys.argv) > 3 else auto_acmg_query.DEFAULT_MAX_WORKERS
+
+    main(input_tsv, limit, max_workers)
@@ -0,0 +1,79 @@
+import importlib.util
+import itertools
+import os
+import sys
+import threading
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_DIR)
+from stub_services import StubServer, StubConfig
+
+# Load auto-acmg-query.py (hyphenated name, not importable with a plain import)
+spec = importlib.util.spec_from_file_location("auto_acmg_query", os.path.join(PROJECT_DIR, "auto-acmg-query.py"))
+auto_acmg_query = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(auto_acmg_query)
+
+# Seconds one single-worker instance spends on a prediction
+SERVICE_TIME = 0.01
+
+# Dispatch without load information, kept for comparison
+class RoundRobinBalancer:
+    def __init__(self, urls):
+        self.urls = list(urls)
+        self._cycle = itertools.cycle(self.urls)
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            return next(self._cycle)
+
+    def release(self, url, unreachable=False):
+        pass
+
+def run(urls, balancer_class, num_variants):
+    hgvs_list = [f"chr1:{100000 + i}:A:G" for i in range(num_variants)]
+    max_workers = auto_acmg_query.WORKERS_PER_INSTANCE * len(urls)
+    session = auto_acmg_query.create_session(max_workers, num_hosts=len(urls))
+    balancer = balancer_class(urls) if len(urls) > 1 else None
+    if balancer is None:
+        auto_acmg_query.AUTO_ACMG_URL = urls[0]
+    start_time = time.perf_counter()
+    errors = []
+    results = auto_acmg_query.fetch_json_batch(hgvs_list, session=session, max_workers=max_workers, errors=errors,
+                                               balancer=balancer)
+    elapsed = time.perf_counter() - start_time
+    session.close()
+    if errors or not all(results.values()):
+        print(f"  {len(errors)} lookups failed")
+        sys.exit(1)
+    return num_variants / elapsed
+
+def start_stubs(service_times):
+    return [StubServer("auto-acmg", config=StubConfig(latency=seconds, concurrency=1)).start() for seconds in service_times]
+
+def main(num_variants=400):
+    print(f"Single-worker stub instances, {SERVICE_TIME * 1000:.0f} ms per prediction, {num_variants} variants")
+    single = None
+    for instances in [1, 2, 4, 8]:
+        stubs = start_stubs([SERVICE_TIME] * instances)
+        throughput = run([stub.url for stub in stubs], auto_acmg_query.LeastOutstandingBalancer, num_variants)
+        single = single or throughput
+        print(f"  {instances} instances: {throughput:8.1f} variants/sec ({throughput / single:4.1f}x)")
+        for stub in stubs:
+            stub.stop()
+
+    # One instance four times slower (e.g. sharing its core with Diablo)
+    service_times = [SERVICE_TIME] * 3 + [SERVICE_TIME * 4]
+    print("4 instances, one 4x slower:")
+    for name, balancer_class in [("round robin", RoundRobinBalancer),
+                                 ("least outstanding requests", auto_acmg_query.LeastOutstandingBalancer)]:
+        stubs = start_stubs(service_times)
+        throughput = run([stub.url for stub in stubs], balancer_class, num_variants)
+        print(f"  {name:<28} {throughput:8.1f} variants/sec")
+        for stub in stubs:
+            stub.stop()
+
+if __name__ == "__main__":
+    num_variants = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    main(num_variants)
@@ -0,0 +1,119 @@
+import gc
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_DIR)
+from json_to_csv_intervar import merge_intervar_frames
+from tsv_io import frame_to_text_records
+
+INTERVAR_KEYS = ['Chromosome', 'Position', 'Ref_allele', 'Risk_allele']
+CRITERIA = ['PVS1', 'PS1', 'PM1', 'PM2', 'PP3', 'BA1', 'BP4', 'BS1']
+
+# Previous merge: every column of both frames cast to text before a four-column text join
+def legacy_merge_intervar_frames(intervar_df, original_df):
+    intervar_df = intervar_df.astype(str)
+    original_df = original_df.astype(str)
+    original_df['chrom'] = original_df['chrom'].astype(str).str.replace(r'^(chr)', '', regex=True)
+    return pd.merge(original_df, intervar_df, left_on=['chrom', 'pos', 'ref_base', 'alt_base'],
+                    right_on=INTERVAR_KEYS, how="left")
+
+def make_frames(num_rows, seed=0):
+    """Synthetic Set 2 frame (typed as read_tsv reads it, with missing values) and InterVar results for 80% of it."""
+    rng = np.random.default_rng(seed)
+    chroms = np.array([f"chr{n}" for n in range(1, 23)] + ["chrX"], dtype=object)
+    bases = np.array(["A", "C", "G", "T", "AT", "-"], dtype=object)
+    scores = rng.random(num_rows)
+    scores[rng.random(num_rows) < 0.3] = np.nan
+    original_df = pd.DataFrame({
+        "chrom": rng.choice(chroms, num_rows),
+        "pos": rng.integers(1, 250_000_000, num_rows),
+        "ref_base": rng.choice(bases, num_rows),
+        "alt_base": rng.choice(bases, num_rows),
+        "hugo": pd.Categorical(rng.choice(np.array(["BRCA1", "TP53", "CFTR", None], dtype=object), num_rows)),
+        "ACMG": rng.choice(np.array(["pathogenic", "likely pathogenic", None], dtype=object), num_rows),
+        "gnomad3.af": scores,
+        "sift.score": rng.random(num_rows),
+        "clinvar.id": rng.integers(1, 2_000_000, num_rows),
+        "PHENOTYPEIDS": rng.choice(np.array(["HP:0001250", "-", None], dtype=object), num_rows),
+    })
+
+    found = original_df.sample(frac=0.8, random_state=seed)
+    intervar_df = pd.DataFrame({
+        "Chromosome": found["chrom"].str.replace(r'^(chr)', '', regex=True).to_numpy(),
+        "Position": found["pos"].to_numpy(),
+        "Ref_allele": found["ref_base"].to_numpy(),
+        "Risk_allele": found["alt_base"].to_numpy(),
+        "Intervar": rng.choice(np.array(["Benign", "Likely pathogenic", "Uncertain significance"], dtype=object), len(found)),
+    })
+    for criterion in CRITERIA:
+        intervar_df[f"{criterion}_intervar"] = rng.integers(0, 2, len(found))
+    return intervar_df, original_df
+
+def _status_bytes(field):
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(field):
+                return int(line.split()[1]) * 1024
+    return 0
+
+def peak_memory(merge):
+    """
+    Peak resident memory merge adds (Linux). Unlike tracemalloc this includes the Arrow
+    buffers of pandas string columns.
+    """
+    gc.collect()
+    with open("/proc/self/clear_refs", "w") as clear_refs:
+        clear_refs.write("5")  # Reset the peak RSS (VmHWM) to the current RSS
+    start_rss = _status_bytes("VmRSS:")
+    result = merge()
+    peak = _status_bytes("VmHWM:") - start_rss
+    del result
+    return peak
+
+def measure(merge):
+    """Returns the result, the run time and the peak memory of a second run."""
+    start_time = time.perf_counter()
+    result = merge()
+    elapsed = time.perf_counter() - start_time
+    return result, elapsed, peak_memory(merge)
+
+def same_text(expected, result):
+    """
+    True if both frames give the Auto-ACMG stage the same text (frame_to_text_records),
+    reading the literal "nan" of the text-cast merge as empty. Compared column by column
+    to keep memory bounded.
+    """
+    if list(expected.columns) != list(result.columns):
+        return False
+    for col in expected.columns:
+        legacy = frame_to_text_records(expected[[col]])
+        typed = frame_to_text_records(result[[col]])
+        if ["" if row[col] == "nan" else row[col] for row in legacy] != [row[col] for row in typed]:
+            return False
+    return True
+
+def main(sizes):
+    all_identical = True
+    for num_rows in sizes:
+        intervar_df, original_df = make_frames(num_rows)
+        expected, legacy_time, legacy_peak = measure(lambda: legacy_merge_intervar_frames(intervar_df, original_df))
+        result, typed_time, typed_peak = measure(lambda: merge_intervar_frames(intervar_df, original_df, "set2"))
+
+        identical = same_text(expected, result)
+        all_identical &= identical
+        print(f"{num_rows} rows   text-cast {legacy_time:7.3f} s {legacy_peak / 1e6:8.1f} MB peak   "
+              f"typed {typed_time:7.3f} s {typed_peak / 1e6:8.1f} MB peak   "
+              f"result {expected.memory_usage(deep=True).sum() / 1e6:.1f} MB -> {result.memory_usage(deep=True).sum() / 1e6:.1f} MB   "
+              f"identical output: {identical}")
+
+    if not all_identical:
+        print("Error: the typed merge differs from the text-cast merge.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    main(sizes)
@@ -0,0 +1,84 @@
+import os
+import sys
+import numpy as np
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_DIR)
+from runtime_model import RuntimeModel
+
+# Synthetic stage costs: (fixed seconds, seconds per input row, seconds per remote call, rows_in / VCF rows)
+STAGES = {
+    "Diablo": (20.0, 0.004, 0.0, 1.0),
+    "merge_files (Set 1)": (0.5, 0.00002, 0.0, 1.0),
+    "merge_files (Set 2)": (0.2, 0.00001, 0.0, 1.0),
+    "WinterVar (set1)": (0.1, 0.0, 0.2, 0.3),
+    "WinterVar (set2)": (0.1, 0.0, 0.2, 0.02),
+    "Auto-ACMG (set1)": (0.5, 0.0, 0.05, 0.3),
+    "Auto-ACMG (set2)": (0.5, 0.0, 0.05, 0.02),
+    "final ACMG classification": (0.3, 0.00001, 0.0, 0.32),
+}
+REMOTE_STAGES = ("WinterVar", "Auto-ACMG")
+
+# Previous estimate: 0.05 s per line of the VCF (headers included), blended with a past run of the same line count
+def legacy_estimate(history, input_rows):
+    estimated_time = input_rows * 0.05
+    if input_rows in history:
+        estimated_time = estimated_time * 0.7 + history[input_rows] * 0.3
+    return max(10.0, estimated_time)
+
+def simulate_run(rng, input_rows, miss_rate):
+    """One run's stage records and total, with 10% noise and the set branches overlapping."""
+    stages = {}
+    for stage, (fixed, per_row, per_call, ratio) in STAGES.items():
+        rows_in = int(input_rows * ratio)
+        record = {"rows_in": rows_in}
+        seconds = fixed + per_row * rows_in
+        if stage.startswith(REMOTE_STAGES):
+            record["remote_calls"] = remote_calls = int(rows_in * miss_rate)
+            record["cache_hits"] = rows_in - remote_calls
+            seconds += per_call * remote_calls
+        record["seconds"] = seconds * rng.normal(1.0, 0.1)
+        stages[stage] = record
+
+    branch = {set_name: sum(record["seconds"] for stage, record in stages.items() if set_name in stage.casefold().replace(" ", ""))
+              for set_name in ["set1", "set2"]}
+    total = (stages["Diablo"]["seconds"] + max(branch.values())
+             + stages["final ACMG classification"]["seconds"] + 2.0)
+    return {"input_rows": input_rows, "total_seconds": total, "stages": stages}
+
+def main(num_runs, seed=0):
+    rng = np.random.default_rng(seed)
+    runs = []
+    legacy_history = {}
+    legacy_errors = []
+    history_errors = []
+    model_errors = []
+    for _ in range(num_runs):
+        input_rows = int(rng.integers(5_000, 500_000))
+        # The cache warms up over the history
+        miss_rate = max(0.1, 1.0 - len(runs) / num_runs)
+        run = simulate_run(rng, input_rows, miss_rate)
+        actual = run["total_seconds"]
+
+        header_lines = 200
+        legacy = legacy_estimate(legacy_history, input_rows + header_lines)
+        if len(runs) >= 5:
+            model = RuntimeModel(runs)
+            from_history, _ = model.predict(input_rows)
+            # As if probe_miss_rates had found the cache's share of this input
+            predicted, _ = model.predict(input_rows, miss_rates={tool: miss_rate for tool in ["wintervar", "auto-acmg"]})
+            legacy_errors.append(abs(legacy - actual) / actual * 100)
+            history_errors.append(abs(from_history - actual) / actual * 100)
+            model_errors.append(abs(predicted - actual) / actual * 100)
+
+        legacy_history[input_rows + header_lines] = actual
+        runs.append(run)
+
+    print(f"{len(model_errors)} predicted runs (after 5 runs of history)")
+    print(f"  {'flat 0.05 s/row estimate':<32} median error {np.median(legacy_errors):7.1f}%   90th percentile {np.percentile(legacy_errors, 90):7.1f}%")
+    for name, errors in [("per-stage model, past miss rate", history_errors), ("per-stage model, probed cache", model_errors)]:
+        print(f"  {name:<32} median error {np.median(errors):7.1f}%   90th percentile {np.percentile(errors, 90):7.1f}%")
+
+if __name__ == "__main__":
+    num_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    main(num_runs)
@@ -0,0 +1,216 @@
+import contextlib
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import time
+import pandas as pd
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_DIR)
+import intervar
+import json_csv_auto_cmg
+import final_acmg_classifier
+from merge_files import merge_files, merge_files_streaming
+from json_to_csv_intervar import json_to_csv, merge_csv_files
+from stage_metrics import StageMeter
+from synthetic_variants import generate, wintervar_response, auto_acmg_response
+from stub_services import StubServer, StubConfig
+
+# Load auto-acmg-query.py (hyphenated name, not importable with a plain import)
+spec = importlib.util.spec_from_file_location("auto_acmg_query", os.path.join(PROJECT_DIR, "auto-acmg-query.py"))
+auto_acmg_query = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(auto_acmg_query)
+
+# Variants sent to each stub service: the remote stages are bound by latency, not input size
+DEFAULT_REMOTE_ROWS = 500
+# A stage regresses when it is this much slower than the baseline...
+DEFAULT_THRESHOLD = 0.10
+# ...and by more than this many seconds (timer noise on short stages)
+NOISE_FLOOR_SECONDS = 0.05
+SIZE_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+
+def parse_size(text):
+    """Reads a variant count such as 1000, 100k or 1M."""
+    suffix = text[-1].casefold()
+    return int(float(text[:-1]) * SIZE_SUFFIXES[suffix]) if suffix in SIZE_SUFFIXES else int(text)
+
+def count_rows(path):
+    with open(path, "r") as f:
+        return max(sum(1 for _ in f) - 1, 0)
+
+def head_tsv(input_tsv, output_tsv, num_rows):
+    """Copies the header and first num_rows rows of a TSV."""
+    with open(input_tsv, "r") as src, open(output_tsv, "w") as dst:
+        for line_number, line in enumerate(src):
+            if line_number > num_rows:
+                break
+            dst.write(line)
+
+def write_wintervar_json(set_tsv, dataset, output_json):
+    """The WinterVar JSON intervar.py would save for every row of a set TSV, built from the stub's answers."""
+    df = pd.read_csv(set_tsv, sep="\t", dtype=str, keep_default_na=False)
+    columns = (["CHROMOSOME", "CHROMOSOME_POSITION_HG38", "REFERENCE_ALLELE", "RISK_ALLELE"] if dataset == "set1"
+               else ["chrom", "pos", "ref_base", "alt_base"])
+    records = [wintervar_response(chrom.replace("chr", ""), pos, ref, alt) for chrom, pos, ref, alt in zip(*(df[col] for col in columns))]
+    with open(output_json, "w") as f:
+        json.dump(records, f, indent=4)
+
+def write_auto_acmg_json(merged_tsv, output_json):
+    """The Auto-ACMG result JSON auto-acmg-query.py would save for a merged InterVar TSV, built from the stub's answers."""
+    df = pd.read_csv(merged_tsv, sep="\t", dtype=str, keep_default_na=False)
+    header = list(df.columns)
+    set_type = auto_acmg_query.determine_set_type(header)
+    rows = auto_acmg_query.rows_by_hgvs(df.to_dict("records"), set_type)
+    with open(output_json, "w") as f:
+        f.write("[")
+        for i, (hgvs, row) in enumerate(rows.items()):
+            row.update(auto_acmg_query.extract_fields(auto_acmg_response(hgvs)))
+            f.write(("\n" if i == 0 else ",\n") + json.dumps(row))
+        f.write("\n]\n")
+
+class StageRunner:
+    """Runs stages with their output silenced and records a StageMeter reading for each."""
+
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self.stages = {}
+
+    def run(self, name, rows, func, *args, **kwargs):
+        meter = StageMeter()
+        if self.verbose:
+            func(*args, **kwargs)
+        else:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                func(*args, **kwargs)
+        metrics = meter.stop()
+        metrics["rows"] = rows
+        metrics["rows_per_second"] = round(rows / max(metrics["wall_seconds"], 1e-6), 1)
+        self.stages[name] = metrics
+        print(f"  {name:<34} {metrics['wall_seconds']:9.3f} s  {metrics['rows_per_second']:12.1f} rows/s  "
+              f"peak RSS {metrics['peak_rss_bytes'] / 2 ** 20:8.1f} MiB")
+
+def run_benchmarks(num_variants, work_dir, remote_rows=DEFAULT_REMOTE_ROWS, stub_config=None, verbose=False):
+    """
+    Generates (or reuses) a synthetic sample of num_variants variants in work_dir and runs
+    every stage on it the way the stage scripts chain through files. WinterVar and
+    Auto-ACMG are queried for the first remote_rows rows of each set against local stubs.
+    Returns the results record.
+    """
+    data_dir = os.path.join(work_dir, f"data_{num_variants}")
+    run_dir = os.path.join(work_dir, "run")
+    if not os.path.exists(os.path.join(data_dir, "synthetic_annotated.tsv")):
+        print(f"Generating {num_variants} synthetic variants in {data_dir}...")
+        generate(data_dir, num_variants)
+    shutil.rmtree(run_dir, ignore_errors=True)
+    os.makedirs(run_dir)
+
+    diablo = os.path.join(data_dir, "synthetic_diablo.tsv")
+    annotated = os.path.join(data_dir, "synthetic_annotated.tsv")
+    path = lambda name: os.path.join(run_dir, name)
+
+    wintervar_stub = StubServer("wintervar", config=stub_config or StubConfig()).start()
+    auto_acmg_stub = StubServer("auto-acmg", config=stub_config or StubConfig()).start()
+    intervar.WINTERVAR_URL = wintervar_stub.url
+    auto_acmg_query.AUTO_ACMG_URL = auto_acmg_stub.url
+
+    runner = StageRunner(verbose)
+    print(f"Stages on {num_variants} variants ({remote_rows} remote rows per set):")
+    try:
+        runner.run("merge_files", num_variants, merge_files, annotated, diablo, path("merged_set1.tsv"), path("pathogenic_set2.tsv"))
+        runner.run("merge_files (streaming)", num_variants, merge_files_streaming, annotated, diablo,
+                   path("streamed_set1.tsv"), path("streamed_set2.tsv"))
+        set_tsvs = {"set1": path("merged_set1.tsv"), "set2": path("pathogenic_set2.tsv")}
+
+        for set_name, set_tsv in set_tsvs.items():
+            # The dataset is detected from the file name
+            head_tsv(set_tsv, path(f"remote_{set_name}.tsv"), remote_rows)
+            runner.run(f"intervar ({set_name})", count_rows(path(f"remote_{set_name}.tsv")), intervar.run_wintervar,
+                       path(f"remote_{set_name}.tsv"), path(f"remote_wintervar_{set_name}.json"), 10, False, 1e6)
+
+        for set_name, set_tsv in set_tsvs.items():
+            write_wintervar_json(set_tsv, set_name, path(f"wintervar_{set_name}.json"))
+            runner.run(f"json_to_csv_intervar ({set_name})", count_rows(set_tsv), lambda: (
+                json_to_csv(path(f"wintervar_{set_name}.json"), path(f"intervar_{set_name}.tsv")),
+                merge_csv_files(path(f"intervar_{set_name}.tsv"), set_tsv, path(f"intervar_merged_{set_name}.tsv"), set_name)))
+
+        for set_name in set_tsvs:
+            head_tsv(path(f"intervar_merged_{set_name}.tsv"), path(f"remote_merged_{set_name}.tsv"), remote_rows)
+            runner.run(f"auto-acmg-query ({set_name})", count_rows(path(f"remote_merged_{set_name}.tsv")), auto_acmg_query.process_tsv,
+                       path(f"remote_merged_{set_name}.tsv"), path(f"remote_auto_acmg_{set_name}.json"), use_cache=False)
+
+        for set_name in set_tsvs:
+            write_auto_acmg_json(path(f"intervar_merged_{set_name}.tsv"), path(f"auto_acmg_{set_name}.json"))
+            runner.run(f"json_csv_auto_cmg ({set_name})", count_rows(path(f"intervar_merged_{set_name}.tsv")),
+                       json_csv_auto_cmg.json_to_csv, path(f"auto_acmg_{set_name}.json"), path(f"auto_acmg_{set_name}.tsv"))
+
+        classifier_rows = sum(count_rows(path(f"auto_acmg_{set_name}.tsv")) for set_name in set_tsvs)
+        runner.run("final_acmg_classifier", classifier_rows, final_acmg_classifier.main,
+                   path("auto_acmg_set1.tsv"), path("auto_acmg_set2.tsv"), path("final.tsv"))
+    finally:
+        wintervar_stub.stop()
+        auto_acmg_stub.stop()
+
+    return {
+        "num_variants": num_variants,
+        "remote_rows": remote_rows,
+        "started": round(time.time(), 3),
+        "stages": runner.stages,
+        "stubs": {"wintervar": wintervar_stub.config.summary(), "auto-acmg": auto_acmg_stub.config.summary()},
+    }
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Prints every stage's wall time against the baseline; returns the stages that regressed."""
+    if baseline["num_variants"] != results["num_variants"] or baseline["remote_rows"] != results["remote_rows"]:
+        print(f"Warning: baseline ran {baseline['num_variants']} variants ({baseline['remote_rows']} remote rows), "
+              f"this run {results['num_variants']} ({results['remote_rows']}); times are not comparable")
+
+    regressions = []
+    print(f"  {'stage':<34} {'baseline':>10} {'current':>10} {'change':>8}")
+    for stage, metrics in results["stages"].items():
+        if stage not in baseline["stages"]:
+            print(f"  {stage:<34} {'-':>10} {metrics['wall_seconds']:9.3f}s {'new':>8}")
+            continue
+        before = baseline["stages"][stage]["wall_seconds"]
+        after = metrics["wall_seconds"]
+        change = (after - before) / before if before else 0.0
+        regressed = after > before * (1 + threshold) and after - before > NOISE_FLOOR_SECONDS
+        if regressed:
+            regressions.append(stage)
+        print(f"  {stage:<34} {before:9.3f}s {after:9.3f}s {change:+7.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+if __name__ == "__main__":
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("--") and "=" in arg)
+    verbose = "--verbose" in sys.argv
+    args = [arg for arg in sys.argv if not arg.startswith("--")]
+
+    if len(args) not in [2, 3]:
+        print("Usage: python benchmarks/bench_stages.py <num_variants (1k, 100k, 1M)> [<work_dir>] [--remote-rows=<n>] "
+              "[--latency=<s>] [--jitter=<s>] [--error-rate=<p>] [--throttle-rate=<p>] [--output=<results.json>] "
+              "[--baseline=<results.json>] [--threshold=<fraction>] [--verbose]")
+        sys.exit(1)
+
+    num_variants = parse_size(args[1])
+    work_dir = args[2] if len(args) == 3 else os.path.join(PROJECT_DIR, "benchmarks", "work")
+    stub_config = StubConfig(latency=float(options.get("latency", 0.005)), jitter=float(options.get("jitter", 0.0)),
+                             error_rate=float(options.get("error-rate", 0.0)),
+                             throttle_rate=float(options.get("throttle-rate", 0.0)))
+    results = run_benchmarks(num_variants, work_dir, int(options.get("remote-rows", DEFAULT_REMOTE_ROWS)), stub_config, verbose)
+
+    if "output" in options:
+        with open(options["output"], "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {options['output']}")
+
+    if "baseline" in options:
+        with open(options["baseline"], "r") as f:
+            baseline = json.load(f)
+        threshold = float(options.get("threshold", DEFAULT_THRESHOLD))
+        print(f"Compared with {options['baseline']} (regression: over {threshold:.0%} slower):")
+        regressions = compare(results, baseline, threshold)
+        if regressions:
+            print(f"{len(regressions)} stages regressed: {', '.join(regressions)}")
+            sys.exit(1)
+        print("No regressions.")
@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_DIR)
+from variant_keys import merge_on_variant_keys
+
+LEFT_KEYS = ["CHROMOSOME", "CHROMOSOME_POSITION_HG38", "REFERENCE_ALLELE", "RISK_ALLELE"]
+RIGHT_KEYS = ["chrom", "pos", "ref_base", "alt_base"]
+
+def make_frames(num_rows, seed=0):
+    """
+    Synthetic annotated VCF and Diablo frames with text keys, as read from the stage TSVs:
+    mostly SNVs, some short indels and a few long indels that go to the overflow table.
+    """
+    rng = np.random.default_rng(seed)
+    chroms = np.array([str(n) for n in range(1, 23)] + ["X", "Y", "MT"], dtype=object)
+    alleles = np.array(["A", "C", "G", "T"] * 20 + ["AT", "GCA", "TTTA", "-", "ACGTACGTACGTACGT"], dtype=object)
+
+    def keys(n):
+        return pd.DataFrame({
+            "chrom": rng.choice(chroms, n),
+            "pos": rng.integers(1, 250_000_000, n),
+            "ref_base": rng.choice(alleles, n),
+            "alt_base": rng.choice(alleles, n),
+        })
+
+    diablo = keys(num_rows)
+    diablo["ACMG"] = rng.choice(np.array(["benign", "uncertain significance", "pathogenic"], dtype=object), num_rows)
+    # Half the annotated variants are also in the Diablo output
+    annotated = pd.concat([diablo[RIGHT_KEYS].sample(frac=0.5, random_state=seed), keys(num_rows // 2)], ignore_index=True)
+    annotated.columns = LEFT_KEYS
+    annotated["PHENOTYPEIDS"] = "-"
+    annotated["CADD"] = rng.random(len(annotated))
+    annotated["CHROMOSOME_POSITION_HG38"] = annotated["CHROMOSOME_POSITION_HG38"].astype(str)
+    diablo["pos"] = diablo["pos"].astype(str)
+    return annotated, diablo
+
+def measure(merge):
+    """Returns the result, the run time and (from a second, traced run) the peak allocated memory."""
+    start_time = time.perf_counter()
+    result = merge()
+    elapsed = time.perf_counter() - start_time
+
+    tracemalloc.start()
+    merge()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def main(sizes):
+    all_identical = True
+    for num_rows in sizes:
+        frames = make_frames(num_rows)
+        print(f"{num_rows} rows")
+        # Text keys as pandas reads them: string dtype, or object dtype without pyarrow / before pandas 3
+        for key_dtype, how in [("str", "inner"), ("str", "left"), ("object", "inner"), ("object", "left")]:
+            annotated, diablo = (df.astype({col: key_dtype for col in df.columns if df[col].dtype != "float64"})
+                                 for df in frames)
+            expected, text_time, text_peak = measure(
+                lambda: annotated.merge(diablo, how=how, left_on=LEFT_KEYS, right_on=RIGHT_KEYS)
+            )
+            result, key_time, key_peak = measure(lambda: merge_on_variant_keys(annotated, diablo, LEFT_KEYS, RIGHT_KEYS, how=how))
+            identical = expected.equals(result)
+            all_identical &= identical
+            print(f"  {key_dtype:<6} {how:<6} text keys {text_time:7.3f} s {text_peak / 1e6:8.1f} MB peak   "
+                  f"packed keys {key_time:7.3f} s {key_peak / 1e6:8.1f} MB peak   "
+                  f"{text_time / max(key_time, 1e-9):5.1f}x   identical output: {identical}")
+
+    if not all_identical:
+        print("Error: the packed-key merge differs from the text-keyed merge.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000, 3_000_000]
+    main(sizes)
@@ -0,0 +1,137 @@
+import json
+import random
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from synthetic_variants import wintervar_response, auto_acmg_response
+
+# Paths the pipeline's clients request
+WINTERVAR_PATH = "/api_new.php"
+AUTO_ACMG_PATH = "/api/v1/predict/seqvar"
+# Port auto-acmg-query.py's AUTO_ACMG_URL points at
+AUTO_ACMG_PORT = 8080
+
+class StubConfig:
+    """
+    Behaviour of a stub service: mean latency and jitter (seconds), the share of requests
+    answered with a 500 (error_rate) or a 429 with Retry-After (throttle_rate). With
+    concurrency, at most that many requests are served at a time (a single-worker server
+    is concurrency=1); the others queue.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0, retry_after=0.1, seed=0,
+                 concurrency=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.slots = threading.BoundedSemaphore(concurrency) if concurrency else None
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+
+    def draw(self):
+        """Returns (delay, status) for the next request: status 500, 429 or 200."""
+        with self.lock:
+            self.requests += 1
+            delay = max(0.0, self.random.gauss(self.latency, self.jitter)) if self.jitter else self.latency
+            roll = self.random.random()
+            if roll < self.error_rate:
+                self.errors += 1
+                return delay, 500
+            if roll < self.error_rate + self.throttle_rate:
+                self.throttled += 1
+                return delay, 429
+            return delay, 200
+
+    def summary(self):
+        with self.lock:
+            return {"requests": self.requests, "errors": self.errors, "throttled": self.throttled}
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        delay, status = self.server.config.draw()
+        if self.server.config.slots is not None:
+            with self.server.config.slots:
+                time.sleep(delay)
+        elif delay:
+            time.sleep(delay)
+
+        if url.path == WINTERVAR_PATH and self.server.service == "wintervar":
+            if status == 429:
+                return self.send_body(429, b"", {"Retry-After": str(self.server.config.retry_after)})
+            if status != 200:
+                return self.send_body(status, b"")
+            body = wintervar_response(query.get("chr", ""), query.get("pos", ""), query.get("ref", ""), query.get("alt", ""))
+        elif url.path == AUTO_ACMG_PATH and self.server.service == "auto-acmg":
+            if status != 200:
+                return self.send_body(500, json.dumps({"detail": "synthetic failure"}).encode())
+            body = auto_acmg_response(query.get("variant_name", ""))
+        else:
+            return self.send_body(404, b"")
+        self.send_body(200, json.dumps(body).encode(), {"Content-Type": "application/json"})
+
+    def send_body(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # Quiet: one line per request would dominate the benchmark output
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, service, port=0, config=None):
+        super().__init__(("127.0.0.1", port), StubHandler)
+        self.service = service
+        self.config = config or StubConfig()
+        self.thread = None
+
+    @property
+    def url(self):
+        path = WINTERVAR_PATH if self.service == "wintervar" else AUTO_ACMG_PATH
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+    def start(self):
+        """Serves in a background thread; returns self."""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+if __name__ == "__main__":
+    # Usage: python benchmarks/stub_services.py <wintervar|auto-acmg> [<port>] [--latency=s] [--jitter=s] [--error-rate=p] [--throttle-rate=p]
+    options = {arg[2:].split("=", 1)[0]: float(arg.split("=", 1)[1]) for arg in sys.argv[1:] if arg.startswith("--") and "=" in arg}
+    args = [arg for arg in sys.argv if not arg.startswith("--")]
+    if len(args) not in [2, 3] or args[1] not in ["wintervar", "auto-acmg"]:
+        print("Usage: python benchmarks/stub_services.py <wintervar|auto-acmg> [<port>] [--latency=<s>] [--jitter=<s>] "
+              "[--error-rate=<p>] [--throttle-rate=<p>]")
+        sys.exit(1)
+
+    service = args[1]
+    port = int(args[2]) if len(args) == 3 else (AUTO_ACMG_PORT if service == "auto-acmg" else 8090)
+    config = StubConfig(latency=options.get("latency", 0.0), jitter=options.get("jitter", 0.0),
+                        error_rate=options.get("error-rate", 0.0), throttle_rate=options.get("throttle-rate", 0.0))
+    server = StubServer(service, port, config)
+    print(f"Serving a stub {service} at {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Stopped: {server.config.summary()}")
@@ -0,0 +1,174 @@
+import hashlib
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_DIR)
+from final_acmg_classifier import ACMG_CRITERIA
+
+CHROMOSOMES = [str(n) for n in range(1, 23)] + ["X", "Y"]
+BASES = np.array(list("ACGT"), dtype=object)
+INDELS = np.array(["AT", "GCA", "TTTA", "CAG", "-", "GGCCT"], dtype=object)
+GENES = np.array(["BRCA1", "BRCA2", "TP53", "CFTR", "MLH1", "MSH2", "APC", "PTEN", "RB1", "NF1"], dtype=object)
+CONSEQUENCES = np.array(["missense_variant", "synonymous_variant", "stop_gained", "frameshift_variant",
+                         "splice_region_variant", "intron_variant"], dtype=object)
+# Share of Diablo calls per ACMG class (pathogenic and likely pathogenic rows make Set 2)
+ACMG_CLASSES = np.array(["Pathogenic", "Likely pathogenic", "Uncertain significance", "Likely benign", "Benign"], dtype=object)
+ACMG_WEIGHTS = [0.05, 0.1, 0.35, 0.2, 0.3]
+# Diablo outputs carry many annotation columns the pipeline does not read
+FILLER_COLUMNS = 40
+# Criteria the Auto-ACMG stub predicts
+AUTO_ACMG_CRITERIA = ["pvs1", "ps1", "ps2", "ps3", "ps4", "pm1", "pm2", "pm3", "pm4", "pm5", "pm6", "pp1", "pp2", "pp3",
+                      "pp4", "pp5", "ba1", "bs1", "bs2", "bs3", "bs4", "bp1", "bp2", "bp3", "bp4", "bp5", "bp6", "bp7"]
+WINTERVAR_CRITERIA = ["PVS1", "PS1", "PS2", "PS3", "PS4", "PM1", "PM2", "PM3", "PM4", "PM5", "PM6", "PP1", "PP2", "PP3",
+                      "PP4", "PP5", "BA1", "BS1", "BS2", "BS3", "BS4", "BP1", "BP2", "BP3", "BP4", "BP5", "BP6", "BP7"]
+
+def variant_keys(num_variants, rng):
+    """Distinct (chrom, pos, ref, alt) columns: mostly SNVs, 10% short indels, in coordinate order."""
+    chroms = np.sort(rng.choice(len(CHROMOSOMES), num_variants))
+    positions = np.empty(num_variants, dtype=np.int64)
+    for code in np.unique(chroms):
+        in_chrom = chroms == code
+        positions[in_chrom] = np.sort(rng.choice(np.arange(10_000, 200_000_000), in_chrom.sum(), replace=False))
+    ref = rng.choice(BASES, num_variants)
+    alt = rng.choice(BASES, num_variants)
+    same = ref == alt
+    alt[same] = np.where(ref[same] == "A", "G", "A")
+    indel = rng.random(num_variants) < 0.1
+    alt[indel] = rng.choice(INDELS, indel.sum())
+    return np.array(CHROMOSOMES, dtype=object)[chroms], positions, ref, alt
+
+def diablo_frame(chroms, positions, ref, alt, rng):
+    """A Diablo output: variant key, the annotations the classifier reads, criteria flags and filler columns."""
+    n = len(chroms)
+    af = np.round(rng.random(n) * rng.choice([1.0, 0.01, 0.0001], n), 6)
+    df = pd.DataFrame({
+        "chrom": "chr" + pd.Series(chroms, dtype=object),
+        "pos": positions,
+        "ref_base": ref,
+        "alt_base": alt,
+        "hugo": rng.choice(GENES, n),
+        "so": rng.choice(CONSEQUENCES, n),
+        "cchange": [f"c.{p % 5000}A>G" for p in positions],
+        "achange": rng.choice(np.array(["p.Arg12His", "p.Gly45Ser", "", "p.Leu100fs"], dtype=object), n),
+        "clinvar.sig": rng.choice(np.array(["Pathogenic", "Benign", "Uncertain significance", ""], dtype=object), n),
+        "clinvar.rev_stat": rng.choice(np.array(["criteria provided, single submitter", ""], dtype=object), n),
+        "clinvar.id": rng.integers(1, 3_000_000, n),
+        "extra_vcf_info.AC": rng.integers(1, 3, n),
+        "extra_vcf_info.AF": np.round(rng.random(n), 3),
+        "extra_vcf_info.AN": 2,
+        "extra_vcf_info.DP": rng.integers(5, 200, n),
+        "sift.score": np.round(rng.random(n), 3),
+        "dbsnp.rsid": [f"rs{p}" for p in positions],
+        "gnomad3.af": af,
+        "ACMG": rng.choice(ACMG_CLASSES, n, p=ACMG_WEIGHTS),
+    })
+    for criterion in ACMG_CRITERIA:
+        df[f"{criterion}_diablo_acmg"] = (rng.random(n) < 0.1).astype(int)
+    for i in range(FILLER_COLUMNS):
+        df[f"annotation_{i}"] = np.round(rng.random(n), 4)
+    return df
+
+def annotated_frame(chroms, positions, ref, alt, rng):
+    """A pre-annotated VCF table (Set 1 input) for a random half of the variants, plus some it alone has."""
+    n = len(chroms)
+    picked = np.sort(rng.choice(n, n // 2, replace=False))
+    df = pd.DataFrame({
+        "CHROMOSOME": "chr" + pd.Series(chroms[picked], dtype=object),
+        "CHROMOSOME_POSITION_HG38": positions[picked],
+        "REFERENCE_ALLELE": ref[picked],
+        "RISK_ALLELE": alt[picked],
+        "PHENOTYPEIDS": rng.choice(np.array(["HP:0001250", "HP:0000707", "-", ""], dtype=object), len(picked)),
+        "PHENOTYPELIST": rng.choice(np.array(["Seizure", "Abnormality of the nervous system", ""], dtype=object), len(picked)),
+    })
+    return df
+
+def write_vcf(path, chroms, positions, ref, alt):
+    vcf_alt = np.where(alt == "-", ref, alt)
+    with open(path, "w") as f:
+        f.write("##fileformat=VCFv4.2\n##source=synthetic_variants.py\n")
+        f.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n")
+        for chrom, pos, ref_allele, alt_allele in zip(chroms, positions, ref, vcf_alt):
+            f.write(f"chr{chrom}\t{pos}\t.\t{ref_allele}\t{alt_allele}\t50\tPASS\tDP=30\n")
+
+def generate(out_dir, num_variants, seed=0, name="synthetic"):
+    """
+    Writes a VCF, its Diablo output and a pre-annotated table for num_variants synthetic
+    variants into out_dir and returns their paths.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    chroms, positions, ref, alt = variant_keys(num_variants, rng)
+    paths = {
+        "vcf": os.path.join(out_dir, f"{name}.vcf"),
+        "diablo": os.path.join(out_dir, f"{name}_diablo.tsv"),
+        "annotated": os.path.join(out_dir, f"{name}_annotated.tsv"),
+    }
+    write_vcf(paths["vcf"], chroms, positions, ref, alt)
+    diablo_frame(chroms, positions, ref, alt, rng).to_csv(paths["diablo"], sep="\t", index=False)
+    annotated_frame(chroms, positions, ref, alt, rng).to_csv(paths["annotated"], sep="\t", index=False)
+    return paths
+
+def _variant_seed(*fields):
+    """Stable per-variant number, so the stubs answer the same way in every run."""
+    return int.from_bytes(hashlib.blake2b(":".join(map(str, fields)).encode(), digest_size=8).digest(), "little")
+
+def wintervar_response(chromosome, position, ref_allele, alt_allele):
+    """A WinterVar api_new.php answer for one variant."""
+    seed = _variant_seed("wintervar", chromosome, position, ref_allele, alt_allele)
+    response = {
+        "Chromosome": str(chromosome).replace("chr", ""),
+        "Position": int(position) if str(position).isdigit() else position,
+        "Ref_allele": ref_allele,
+        "Alt_allele": alt_allele,
+        "Build": "hg38",
+        "Gene": GENES[seed % len(GENES)],
+        "Intervar": ["Pathogenic", "Likely pathogenic", "Uncertain significance", "Likely benign", "Benign"][seed % 5],
+    }
+    for i, criterion in enumerate(WINTERVAR_CRITERIA):
+        response[criterion] = (seed >> i) & 1 if (seed >> (i + 28)) % 4 == 0 else 0
+    return response
+
+def auto_acmg_response(hgvs):
+    """An Auto-ACMG /api/v1/predict/seqvar answer for one HGVS notation, with criteria and nested data."""
+    seed = _variant_seed("auto-acmg", hgvs)
+    chromosome, position, ref_allele, alt_allele = (hgvs.split(":") + ["", "", "", ""])[:4]
+    criteria = {
+        criterion: {
+            "name": criterion.upper(),
+            "prediction": "Applicable" if (seed >> i) % 5 == 0 else "NotApplicable",
+            "strength": "Supporting",
+            "summary": f"Synthetic evaluation of {criterion.upper()} for {hgvs}.",
+            "description": "Criterion evaluated on synthetic data.",
+        }
+        for i, criterion in enumerate(AUTO_ACMG_CRITERIA)
+    }
+    return {
+        "prediction": {
+            "seqvar": {"genome_release": "GRCh38", "chrom": chromosome, "pos": position, "delete": ref_allele,
+                       "insert": alt_allele, "user_repr": hgvs},
+            "data": {
+                "gene_symbol": GENES[seed % len(GENES)],
+                "hgnc_id": f"HGNC:{seed % 50000}",
+                "transcript_id": f"NM_{seed % 1000000:06d}.1",
+                "consequence": {"mehari": ["missense_variant"], "cadd": "NON_SYNONYMOUS", "cadd_consequence": "missense"},
+                "scores": {
+                    "cadd": {"phyloP100": round((seed % 1000) / 100, 2), "gerp": round((seed % 600) / 100, 2)},
+                    "dbnsfp": {"revel": round((seed % 997) / 997, 3), "sift": round((seed % 991) / 991, 3)},
+                },
+                "thresholds": {"phyloP100": 7.367, "revel_pathogenic": 0.773, "revel_benign": 0.016},
+            },
+            "criteria": criteria,
+        }
+    }
+
+if __name__ == "__main__":
+    if len(sys.argv) not in [3, 4]:
+        print("Usage: python benchmarks/synthetic_variants.py <output_dir> <num_variants> [<seed>]")
+        sys.exit(1)
+
+    paths = generate(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]) if len(sys.argv) == 4 else 0)
+    for kind, path in paths.items():
+        print(f"{kind}: {path}")
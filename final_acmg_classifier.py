@@ -1,25 +1,19 @@
 
 import pandas as pd
+import numpy as np
+import gzip
+import json
 import os
 import sys
+from tsv_io import read_tsv, downcast_flags, records_to_frame
 
-def process_acmg_classifier(file_path):
-    """Process the Auto ACMG classifier output file and return a cleaned dataframe."""
-    print(f"Processing file: {file_path}")
-    
-    df = pd.read_csv(file_path, sep='\t',low_memory=False)
-    
-    df.replace(["nan", "NaN"], "", inplace=True)
-    # Ensure case-insensitive column matching
-    df_columns_lower = df.columns.str.casefold()
+# ACMG criteria combined from Auto-ACMG, InterVar and Diablo
+ACMG_CRITERIA = ["pvs1", "ps1", "ps3", "pm1", "pm2", "pm4", "bp3", "pm5", 
+                 "pp2", "pp3", "bp4", "pp5", "ba1", "bs2", "bs3", "bp1", 
+                 "bp6", "bp7", "bs1"]
 
-    # Define ACMG criteria
-    acmg_criteria = ["pvs1", "ps1", "ps3", "pm1", "pm2", "pm4", "bp3", "pm5", 
-                     "pp2", "pp3", "bp4", "pp5", "ba1", "bs2", "bs3", "bp1", 
-                     "bp6", "bp7", "bs1"]
-
-    # Identify relevant base columns
-    base_columns_raw = [
+# Base columns carried through to the final output
+BASE_COLUMNS = [
     "chrom",
     "pos",
     "ref_base",
@@ -167,14 +161,95 @@ def process_acmg_classifier(file_path):
     "Score", "Intervar",
     "ACMG"
 ]
+_BASE_COLUMNS_FOLDED = {col.casefold() for col in BASE_COLUMNS}
+
+# Variant key columns read by the stages before the classifier
+KEY_COLUMNS = [
+    "CHROMOSOME", "CHROMOSOME_POSITION_HG38", "REFERENCE_ALLELE", "RISK_ALLELE",
+    "Chromosome", "Position", "Ref_allele", "Risk_allele", "HGVS",
+]
+_KEY_COLUMNS_FOLDED = {col.casefold() for col in KEY_COLUMNS}
+
+def is_classifier_column(col):
+    """True for the columns process_acmg_dataframe reads; everything else can be skipped when parsing."""
+    folded = col.casefold()
+    return (
+        folded in _BASE_COLUMNS_FOLDED
+        or folded.endswith("_intervar")
+        or folded.endswith("_diablo_acmg")
+        or (folded.startswith("prediction_criteria_") and folded.endswith("_prediction"))
+    )
+
+def is_pipeline_column(col):
+    """True for the columns any stage up to and including the classifier reads."""
+    return is_classifier_column(col) or col.casefold() in _KEY_COLUMNS_FOLDED
+
+def binarize_applicable(values):
+    """1 where an Auto ACMG prediction reads "Applicable" (any case/padding), else 0."""
+    text = values.astype(str).str.strip().str.casefold()
+    return (text == "applicable").astype(int)
+
+def flag_pathogenicity(acmg):
+    """"0" for empty, benign or VUS ACMG calls, "1" otherwise."""
+    text = acmg.astype(str)
+    folded = text.str.casefold()
+    not_pathogenic = (
+        acmg.isna()
+        | (text.str.strip() == "").fillna(False).astype(bool)
+        | folded.str.contains("benign", regex=False, na=False).astype(bool)
+        | folded.str.contains("vus", regex=False, na=False).astype(bool)
+    )
+    return pd.Series(np.where(not_pathogenic, "0", "1"), index=acmg.index, dtype=object)
+
+def flag_phenotype(phenotype_ids):
+    """1 where a phenotype ID is present (not empty or "-"), else 0."""
+    text = phenotype_ids.fillna("").astype(str).str.strip()
+    return (~text.isin(["", "-"])).astype(int)
+
+def combine_acmg(acmg, intervar):
+    """Joins the non-missing ACMG and InterVar calls with "/", e.g. "Pathogenic/Likely pathogenic"."""
+    acmg_present = acmg.notna().to_numpy()
+    intervar_present = intervar.notna().to_numpy()
+    acmg_text = acmg.fillna("").astype(str).to_numpy(dtype=object)
+    intervar_text = intervar.fillna("").astype(str).to_numpy(dtype=object)
+
+    combined = np.where(
+        acmg_present & intervar_present,
+        acmg_text + "/" + intervar_text,
+        np.where(acmg_present, acmg_text, np.where(intervar_present, intervar_text, "")),
+    )
+    return pd.Series(combined, index=acmg.index, dtype=object).str.strip("/")
+
+def process_acmg_classifier(file_path):
+    """Process the Auto ACMG classifier output file and return a cleaned dataframe."""
+    print(f"Processing file: {file_path}")
+    
+    # Parse only the columns the classifier uses
+    df = read_tsv(file_path, keep=is_classifier_column)
+    
+    return process_acmg_dataframe(downcast_criteria_flags(df))
+
+def downcast_criteria_flags(df):
+    """Stores the InterVar and Diablo criteria flags as int8."""
+    return downcast_flags(df, [col for col in df.columns if col.lower().endswith(("_intervar", "_diablo_acmg"))])
+
+def records_to_classifier_frame(records):
+    """Builds the classifier input from Auto ACMG result rows held in memory, typed as if read from the TSV."""
+    return downcast_criteria_flags(records_to_frame(records, keep=is_classifier_column))
+
+def process_acmg_dataframe(df):
+    """Apply the ACMG classification to an Auto ACMG result dataframe and return a cleaned dataframe."""
+    df.replace(["nan", "NaN"], "", inplace=True)
+    # Ensure case-insensitive column matching
+    df_columns_lower = df.columns.str.casefold()
 
     # Ensure all base columns are present, even if they are empty
-    for col in base_columns_raw:
+    for col in BASE_COLUMNS:
      if col.casefold() not in df_columns_lower:
         df[col] = ""
 
 # Match base columns case-insensitively
-    base_columns = [col for col in base_columns_raw if col in df.columns]
+    base_columns = [col for col in BASE_COLUMNS if col in df.columns]
 # Strictly filter prediction columns
     prediction_columns = [col for col in df.columns if col.lower().startswith("prediction_criteria_") and col.lower().endswith("_prediction")]
 
@@ -184,10 +259,10 @@ def process_acmg_classifier(file_path):
 
 # Convert applicable Auto ACMG prediction columns to binary
     for col in renamed_columns.values():
-     df[col] = df[col].apply(lambda x: 1 if isinstance(x, str) and x.strip().casefold() == "applicable" else 0)
+     df[col] = binarize_applicable(df[col])
 
 # Ensure all required Diablo ACMG columns exist
-    for criteria in acmg_criteria:
+    for criteria in ACMG_CRITERIA:
      col_name = f"{criteria}_diablo_acmg"
      if col_name.casefold() not in df_columns_lower:
         df[col_name] = 0  # Default to 0 if the column does not exist
@@ -198,7 +273,7 @@ def process_acmg_classifier(file_path):
 
 # Create final ACMG classifier columns
     final_acmg_columns = {}
-    for criteria in acmg_criteria:
+    for criteria in ACMG_CRITERIA:
         auto_col = f"{criteria}_auto_acmg"
         intervar_col = intervar_columns.get(f"{criteria}_intervar")
         diablo_col = diablo_columns.get(f"{criteria}_diablo_acmg")
@@ -213,10 +288,7 @@ def process_acmg_classifier(file_path):
     df_filtered = pd.concat([df[base_columns], df_final_classifiers], axis=1)
     
 # Add Flag_Pathogenicity column
-    df_filtered["Flag_Pathogenicity"] = df_filtered.get("ACMG", "").apply(
-    lambda x: "0" if pd.isna(x) or str(x).strip() == "" or "benign" in str(x).casefold() or "vus" in str(x).casefold() 
-    else "1"
-)
+    df_filtered["Flag_Pathogenicity"] = flag_pathogenicity(df_filtered["ACMG"])
 
 # Add Flag_Phenotype column
     # Identify the 'PhenotypeIDs' column (case insensitive)
@@ -224,14 +296,12 @@ def process_acmg_classifier(file_path):
 
 # Add 'Flag_Phenotype' column and ensure empty values default to 0
     if phenotype_col:
-     df_filtered["Flag_Phenotype"] = df_filtered[phenotype_col].fillna("").apply(lambda x: 1 if str(x).strip() not in ["", "-"] else 0)
+     df_filtered["Flag_Phenotype"] = flag_phenotype(df_filtered[phenotype_col])
     else:
      df_filtered["Flag_Phenotype"] = 0  # If column is missing, assign 0 to all rows
 
     # Create Final_ACMG column by combining ACMG and Intervar
-    df_filtered["Final_ACMG"] = df_filtered[["ACMG", "Intervar"]].apply(
-    lambda x: "/".join(x.dropna().astype(str)).strip("/") if x.notna().any() else "", axis=1
-)
+    df_filtered["Final_ACMG"] = combine_acmg(df_filtered["ACMG"], df_filtered["Intervar"])
 
     # Remove the word "auto" from Final_ACMG column values
     df_filtered["Final_ACMG"] = df_filtered["Final_ACMG"].str.replace("auto", "", case=False)
@@ -298,6 +368,76 @@ def merge_sets(set1_file, set2_file, output_file):
     df_merged.to_csv(output_file, sep='\t', index=False)
     print(f"Final merged file saved as {output_file}")
 
+def read_checkpoint_records(log_path):
+    """Reads the rows saved so far in an Auto-ACMG JSONL checkpoint log (plain or gzip)."""
+    records = []
+    opener = gzip.open if log_path.endswith(".gz") else open
+    try:
+        with opener(log_path, 'rt') as log_file:
+            for line in log_file:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break  # Batch still being written
+    except (OSError, EOFError):
+        pass  # Log compacted away or gzip member still being written
+    return records
+
+def write_partial_output(log_paths, partial_output):
+    """Classifies the Auto-ACMG results saved so far and writes them as a partial final output."""
+    df_partial = classify_partial_records(
+        read_checkpoint_records(log_path) if os.path.exists(log_path) else [] for log_path in log_paths
+    )
+    if df_partial.empty:
+        return 0
+
+    temp_output = f"{partial_output}.tmp"
+    df_partial.to_csv(temp_output, sep='\t', index=False)
+    os.replace(temp_output, partial_output)
+    return len(df_partial)
+
+def classify_partial_records(record_sets):
+    """Classifies the Auto-ACMG result rows available so far, one list of rows per set."""
+    frames = [process_acmg_dataframe(records_to_classifier_frame(records)) for records in record_sets if records]
+    if not frames:
+        return pd.DataFrame()
+
+    df_partial = pd.concat(frames, ignore_index=True)
+    df_partial.fillna("", inplace=True)
+    df_partial.replace(["nan", "NaN"], "", inplace=True)
+    return df_partial
+
+def classify_sets(df_set1, df_set2):
+    """
+    Classifies the Set 1 and Set 2 Auto ACMG dataframes and stacks them. An empty set is
+    skipped; if both are empty an empty dataframe is returned.
+    """
+    if df_set1.empty and df_set2.empty:
+        print("Warning: Both Set 1 and Set 2 are empty. Creating an empty output file.")
+        return pd.DataFrame()
+
+    if not df_set1.empty and df_set2.empty:
+        print("Set 2 is empty. Processing only Set 1.")
+        return process_acmg_dataframe(df_set1)
+
+    if not df_set2.empty and df_set1.empty:
+        print("Set 1 is empty. Processing only Set 2.")
+        return process_acmg_dataframe(df_set2)
+
+    print("Both Set 1 and Set 2 contain data. Proceeding with merging.")
+    return stack_classified_sets(process_acmg_dataframe(df_set1), process_acmg_dataframe(df_set2))
+
+def stack_classified_sets(df_set1, df_set2):
+    """Stacks classified Set 1 and Set 2 dataframes, Set 1 first. An empty set is skipped."""
+    if df_set1.empty or df_set2.empty:
+        return df_set2 if df_set1.empty else df_set1
+    df_merged = pd.concat([df_set1, df_set2], ignore_index=True)
+
+    # Replace NaN with empty string
+    df_merged.fillna("", inplace=True)
+    df_merged.replace(["nan", "NaN"], "", inplace=True)
+    return df_merged
+
 def main(set1_file, set2_file, final_output_file):
     """Main function to process ACMG classification and merge sets."""
 
@@ -327,8 +467,14 @@ def main(set1_file, set2_file, final_output_file):
     merge_sets(set1_file, set2_file, final_output_file)
 
 if __name__ == "__main__":
+    if len(sys.argv) >= 4 and sys.argv[1] == "--partial":
+        count = write_partial_output(sys.argv[3:], sys.argv[2])
+        print(f"Partial output saved as {sys.argv[2]} ({count} variants)")
+        sys.exit(0)
+
     if len(sys.argv) != 4:
         print("Usage: python final_classifier.py <set1_file> <set2_file> <final_output_file>")
+        print("       python final_classifier.py --partial <partial_output_file> <auto_acmg_log> [<auto_acmg_log> ...]")
         sys.exit(1)
 
     main(sys.argv[1], sys.argv[2], sys.argv[3])
@@ -0,0 +1,159 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from datetime import timedelta
+from urllib.parse import urlsplit, parse_qsl, urlencode
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from stage_metrics import TimedHTTPAdapter
+
+# passthrough: plain network requests; record: network requests saved to the archive;
+# replay: responses served from the archive without touching the network
+HTTP_MODES = ["passthrough", "record", "replay"]
+
+class ReplayMissError(requests.exceptions.ConnectionError):
+    """A request in replay mode that the archive has no response for."""
+
+def archive_path(output_path):
+    """Default archive of a stage script, next to its output."""
+    return f"{os.path.splitext(output_path)[0]}_http.sqlite"
+
+def request_key(request):
+    """
+    Method, path and sorted query string of a request. The host is left out, so an
+    archive replays against any WinterVar URL or Auto-ACMG port.
+    """
+    url = urlsplit(request.url)
+    query = urlencode(sorted(parse_qsl(url.query, keep_blank_values=True)))
+    return f"{request.method} {url.path}?{query}"
+
+class HttpArchive:
+    """
+    SQLite archive of HTTP responses, one per request key, with zlib-compressed bodies.
+    In record mode every response except a 429 (a rate-limit answer, retried by the
+    client) replaces the one stored for its request; in replay mode responses are read
+    back. The clients bypass the variant cache in both modes, so a recorded archive holds
+    every response a replay needs. Safe to share between threads.
+    """
+
+    def __init__(self, path, mode="record"):
+        if mode not in HTTP_MODES:
+            raise ValueError(f"Unknown HTTP mode {mode!r}; expected one of {', '.join(HTTP_MODES)}")
+        if mode == "replay" and not os.path.exists(path):
+            raise FileNotFoundError(f"HTTP archive {path} not found; record one first")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.mode = mode
+        self.recorded = 0
+        self.replayed = 0
+        self.missing = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS exchanges ("
+            "request TEXT PRIMARY KEY, status INTEGER, reason TEXT, headers TEXT, body BLOB, "
+            "elapsed REAL, recorded REAL)"
+        )
+        self._conn.commit()
+
+    def record(self, request, response):
+        if self.mode != "record" or response.status_code == 429:
+            return
+        headers = json.dumps(dict(response.headers), separators=(",", ":"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO exchanges VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (request_key(request), response.status_code, response.reason, headers,
+                 zlib.compress(response.content), response.elapsed.total_seconds(), time.time()),
+            )
+            self._conn.commit()
+            self.recorded += 1
+
+    def replay(self, request, connection=None):
+        """Returns the archived response for request; raises ReplayMissError if there is none."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, reason, headers, body, elapsed FROM exchanges WHERE request = ?", (request_key(request),)
+            ).fetchone()
+            if row is None:
+                self.missing += 1
+            else:
+                self.replayed += 1
+        if row is None:
+            raise ReplayMissError(f"No archived response for {request_key(request)} in {self.path}", request=request)
+
+        status, reason, headers, body, elapsed = row
+        response = requests.Response()
+        response.status_code = status
+        response.reason = reason
+        response.headers = CaseInsensitiveDict(json.loads(headers))
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = zlib.decompress(body)
+        response.url = request.url
+        response.request = request
+        response.connection = connection
+        response.elapsed = timedelta(seconds=elapsed)
+        return response
+
+    def report(self):
+        if self.mode == "record":
+            print(f"HTTP archive {self.path}: {self.recorded} responses recorded")
+        elif self.mode == "replay":
+            print(f"HTTP archive {self.path}: {self.replayed} responses replayed, {self.missing} requests not in the archive")
+
+    def stats(self):
+        """Number of archived responses and their compressed body bytes."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(body)), 0) FROM exchanges").fetchone()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class ArchiveHTTPAdapter(TimedHTTPAdapter):
+    """
+    HTTPAdapter that records responses into an HttpArchive or replays them from it, and
+    records latency and failures in an HttpStats if one is given.
+    """
+
+    def __init__(self, archive, http_stats=None, *args, **kwargs):
+        self.archive = archive
+        super().__init__(http_stats, *args, **kwargs)
+
+    def send(self, request, *args, **kwargs):
+        if self.archive.mode != "replay":
+            response = super().send(request, *args, **kwargs)
+            self.archive.record(request, response)
+            return response
+
+        start = time.perf_counter()
+        try:
+            response = self.archive.replay(request, self)
+        except ReplayMissError:
+            if self.http_stats is not None:
+                self.http_stats.record(time.perf_counter() - start, True)
+            raise
+        if self.http_stats is not None:
+            self.http_stats.record(time.perf_counter() - start, response.status_code >= 400)
+        return response
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python http_archive.py <archive>")
+        sys.exit(1)
+
+    if not os.path.exists(sys.argv[1]):
+        print(f"Error: HTTP archive {sys.argv[1]} not found.")
+        sys.exit(1)
+
+    archive = HttpArchive(sys.argv[1], mode="passthrough")
+    count, body_bytes = archive.stats()
+    print(f"{sys.argv[1]}: {count} archived responses, {body_bytes / 2 ** 20:.1f} MiB of compressed bodies")
+    archive.close()
@@ -4,9 +4,118 @@ import json
 import sys
 import time
 import re
+import threading
+from email.utils import parsedate_to_datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
+from variant_cache import VariantCache
+from variant_priority import sort_by_priority, print_priority_summary
+from stage_metrics import HttpStats, TimedHTTPAdapter
+from http_archive import HttpArchive, ArchiveHTTPAdapter, HTTP_MODES, archive_path
+
+# WinterVar endpoint and tool version recorded with cached responses
+WINTERVAR_URL = "http://wintervar.wglab.org/api_new.php"
+WINTERVAR_VERSION = "api_new-hg38"
+# Sustained requests per second against the public API; None (or 0) sends them as fast as the
+# workers go (10 by default, as before the limiter) and only pauses on a 429
+DEFAULT_RATE_LIMIT = None
+DEFAULT_BURST = 10
+
+class RateLimiter:
+    """
+    Token bucket shared by all query threads. acquire() blocks until a token is
+    free (never, with no rate); pause() stops every thread until a server-requested
+    Retry-After expires.
+    Tracks queue depth and wait times for the end-of-run log.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE_LIMIT, burst=DEFAULT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+        self.waiting = 0
+        self.max_waiting = 0
+        self.requests = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.throttled = 0
+
+    def acquire(self):
+        start = time.monotonic()
+        with self.lock:
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if not self.rate:
+                    self.tokens = self.burst
+                else:
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.waiting -= 1
+                    self.requests += 1
+                    waited = now - start
+                    self.total_wait += waited
+                    self.max_wait = max(self.max_wait, waited)
+                    return waited
+                delay = max(self.paused_until - now, (1 - self.tokens) / self.rate if self.rate else 0.0)
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.throttled += 1
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+            waiting = self.waiting
+        print(f"WinterVar returned 429: pausing all requests for {seconds:.1f} seconds (queue depth {waiting})")
+
+    def report(self):
+        mean_wait = self.total_wait / self.requests if self.requests else 0.0
+        rate = f"{self.rate:g}/s" if self.rate else "no limit"
+        print(f"Rate limiter: {self.requests} requests at {rate}, mean wait {mean_wait:.2f} s, "
+              f"max wait {self.max_wait:.2f} s, max queue depth {self.max_waiting}, {self.throttled} throttled (429)")
+
+# Function to read a Retry-After header (seconds or HTTP date)
+def parse_retry_after(value, default=5.0):
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+# Function to create the keep-alive session shared by all query threads
+def create_session(max_workers=10, max_retries=3, backoff_factor=0.3, http_stats=None, archive=None):
+    session = requests.Session()
+    # 429 is handled by the rate limiter, so it is not retried here
+    retry_strategy = Retry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=[500, 502, 503, 504],
+        respect_retry_after_header=False,
+    )
+    # With http_stats, every request's latency and failure is recorded in it; with an
+    # HttpArchive, responses are recorded into it or replayed from it
+    adapter_args = dict(pool_connections=1, pool_maxsize=max_workers, max_retries=retry_strategy)
+    if archive is not None:
+        adapter = ArchiveHTTPAdapter(archive, http_stats, **adapter_args)
+    else:
+        adapter = TimedHTTPAdapter(http_stats, **adapter_args) if http_stats is not None else HTTPAdapter(**adapter_args)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
 # Detect dataset type based on filename
 def detect_dataset_from_filename(filename):
@@ -14,7 +123,8 @@ def detect_dataset_from_filename(filename):
     return match.group(0).lower() if match else "set1"
 
 # Function to query WinterVar API
-def get_variant_json(row, dataset="set1", max_retries=3, backoff_factor=0.3, timeout=5):
+def get_variant_json(row, dataset="set1", max_retries=3, backoff_factor=0.3, timeout=5, cache=None,
+                     session=None, limiter=None, archive=None):
     if dataset == "set1":
         chromosome = str(row.get('CHROMOSOME', '')).strip()
         position = str(row.get('CHROMOSOME_POSITION_HG38', '')).strip()
@@ -33,34 +143,100 @@ def get_variant_json(row, dataset="set1", max_retries=3, backoff_factor=0.3, tim
     # Format chromosome
     chromosome = chromosome.replace('chr', '')
 
+    # Serve from the cross-run cache when possible
+    if cache is not None:
+        cached = cache.get("wintervar", WINTERVAR_VERSION, chromosome, position, ref_allele, alt_allele)
+        if cached is not None:
+            return cached
+
     # Construct API URL
-    url = f"http://wintervar.wglab.org/api_new.php?queryType=position&chr={chromosome}&pos={position}&ref={ref_allele}&alt={alt_allele}&build=hg38"
+    url = f"{WINTERVAR_URL}?queryType=position&chr={chromosome}&pos={position}&ref={ref_allele}&alt={alt_allele}&build=hg38"
 
-    # Setup a session with retry strategy
-    session = requests.Session()
-    retry_strategy = Retry(
-        total=max_retries,
-        backoff_factor=backoff_factor,
-        status_forcelist=[429, 500, 502, 503, 504],
-    )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
+    # Fall back to a private session when called without the shared one, closed when done
+    own_session = session is None
+    if own_session:
+        session = create_session(1, max_retries, backoff_factor, archive=archive)
 
     try:
-        response = session.get(url, timeout=timeout)
-        response.raise_for_status()  
+        for _ in range(max_retries + 1):
+            if limiter is not None:
+                limiter.acquire()
+            response = session.get(url, timeout=timeout)
+            if response.status_code != 429:
+                break
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if limiter is not None:
+                limiter.pause(retry_after)
+            else:
+                time.sleep(retry_after)
+        response.raise_for_status()
         
         if not response.text.strip():
             return {}
 
         json_data = response.json()
+        if json_data and cache is not None:
+            cache.put("wintervar", WINTERVAR_VERSION, chromosome, position, ref_allele, alt_allele, json_data)
         return json_data if json_data else {}
     except (requests.exceptions.JSONDecodeError, requests.exceptions.RequestException):
         return {}
+    finally:
+        if own_session:
+            session.close()
+
+# Function to query WinterVar for every row of a Set 1 or Set 2 dataframe
+def query_wintervar(df, dataset, max_workers=10, use_cache=True, rate_limit=DEFAULT_RATE_LIMIT, limiter=None,
+                    stats=None, archive=None):
+    """
+    Returns the WinterVar responses for the rows of df, in query (priority) order.
+    Pass a shared limiter to keep concurrent calls under one rate limit. If a stats dict
+    is given, the number of cache hits and remote calls and the HTTP request statistics
+    are stored in it. With an HttpArchive, responses are recorded into it or, in replay
+    mode, served from it without a rate limit.
+    """
+    print("Querying WinterVar API using multi-threading...")
+
+    cache = VariantCache() if use_cache else None
+    http_stats = HttpStats("wintervar")
+    session = create_session(max_workers, http_stats=http_stats, archive=archive)
+    replaying = archive is not None and archive.mode == "replay"
+    own_limiter = limiter is None and not replaying
+    if own_limiter:
+        limiter = RateLimiter(rate_limit, max(DEFAULT_BURST, max_workers))
+    elif replaying:
+        limiter = None  # Nothing reaches WinterVar
+
+    # Submit clinically relevant variants first; the pool runs them in submission order
+    rows = sort_by_priority([row for _, row in df.iterrows()])
+    print_priority_summary(rows)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_to_order = {
+            executor.submit(get_variant_json, row, dataset, cache=cache, session=session, limiter=limiter): order
+            for order, row in enumerate(rows)
+        }
+        for future in as_completed(future_to_order):
+            result = future.result()
+            if result:
+                results[future_to_order[future]] = result
+    results = [results[order] for order in sorted(results)]
+
+    session.close()
+    if own_limiter:
+        limiter.report()
+
+    if stats is not None:
+        stats.update(cache_hits=cache.hits if cache is not None else 0,
+                     remote_calls=cache.misses if cache is not None else len(rows), http=http_stats.summary())
+    if cache is not None:
+        cache.report()
+        cache.close()
+
+    return results
 
 # Function to run API queries in parallel
-def run_wintervar(input_csv, output_json, max_workers=10):
+def run_wintervar(input_csv, output_json, max_workers=10, use_cache=True, rate_limit=DEFAULT_RATE_LIMIT, archive=None):
     print(f"Reading input file: {input_csv}")
 
     # Detect dataset type from filename
@@ -78,16 +254,8 @@ def run_wintervar(input_csv, output_json, max_workers=10):
         print(f"Skipping {input_csv}: File contains no data.")
         return
 
-    print("Querying WinterVar API using multi-threading...")
     start_time = time.time()
-
-    results = []
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_row = {executor.submit(get_variant_json, row, dataset): row for _, row in df.iterrows()}
-        for future in as_completed(future_to_row):
-            result = future.result()
-            if result:
-                results.append(result)
+    results = query_wintervar(df, dataset, max_workers, use_cache, rate_limit, archive=archive)
 
     # Save JSON output
     with open(output_json, 'w') as json_file:
@@ -99,11 +267,32 @@ def run_wintervar(input_csv, output_json, max_workers=10):
 
 # Main execution
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python intervar.py <input_csv> <output_json>")
+    # Optional flags: bypass the cross-run variant cache; --http=record|replay records the
+    # responses into (or replays them from) --http-archive=<path>, <output>_http.sqlite by default
+    http_flags = [arg for arg in sys.argv if arg.startswith(("--http=", "--http-archive="))]
+    options = dict(arg[2:].split("=", 1) for arg in http_flags)
+    http_mode = options.get("http", "passthrough")
+    use_cache = "--no-cache" not in sys.argv and http_mode == "passthrough"
+    args = [arg for arg in sys.argv if arg != "--no-cache" and arg not in http_flags]
+
+    if len(args) not in [3, 4] or http_mode not in HTTP_MODES:
+        print("Usage: python intervar.py <input_csv> <output_json> [<requests_per_sec>] [--no-cache] "
+              "[--http=passthrough|record|replay] [--http-archive=<path>]")
         sys.exit(1)
 
-    input_csv = sys.argv[1]
-    output_json = sys.argv[2]
+    input_csv = args[1]
+    output_json = args[2]
+    rate_limit = float(args[3]) if len(args) == 4 else DEFAULT_RATE_LIMIT
+
+    archive = None
+    if http_mode != "passthrough":
+        try:
+            archive = HttpArchive(options.get("http-archive", archive_path(output_json)), http_mode)
+        except FileNotFoundError as error:
+            print(f"Error: {error}")
+            sys.exit(1)
 
-    run_wintervar(input_csv, output_json)
+    run_wintervar(input_csv, output_json, use_cache=use_cache, rate_limit=rate_limit, archive=archive)
+    if archive is not None:
+        archive.report()
+        archive.close()
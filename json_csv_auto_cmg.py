@@ -1,64 +1,149 @@
 import json
 import csv
+import gzip
 import os
 import sys
+import tempfile
+
+# Characters read from the JSON file at a time
+READ_CHUNK_CHARS = 1024 * 1024
+
+def write_empty_csv(output_file_path):
+    with open(output_file_path, 'w', newline='', encoding='utf-8') as tsv_file:
+        writer = csv.writer(tsv_file, delimiter='\t')
+        writer.writerow([])  # Write an empty file with no headers
+
+def iter_json_records(input_file_path):
+    """
+    Yields the items of a JSON array, or the values of a JSON Lines file (named .jsonl),
+    one at a time without loading the whole file (gzip-compressed if the name ends in .gz).
+    Raises json.JSONDecodeError for malformed JSON and ValueError if a file not named
+    .jsonl does not hold an array.
+    """
+    decoder = json.JSONDecoder()
+    json_lines = input_file_path.endswith((".jsonl", ".jsonl.gz"))
+    opener = gzip.open if input_file_path.endswith(".gz") else open
+    with opener(input_file_path, 'rt', encoding='utf-8') as json_file:
+        buffer = ""
+        position = 0
+        at_end = False
+        in_array = None  # Unknown until the first character
+        expect_comma = False
+
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position == len(buffer):
+                if at_end:
+                    break
+                buffer = json_file.read(READ_CHUNK_CHARS)
+                position = 0
+                at_end = not buffer
+                continue
+
+            char = buffer[position]
+            if in_array is None:
+                in_array = char == '['
+                if not in_array and not json_lines:
+                    raise ValueError("not a JSON array")
+                position += in_array
+                continue
+            if in_array and char == ']':
+                return
+            if in_array and expect_comma:
+                if char != ',':
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buffer, position)
+                position += 1
+                expect_comma = False
+                continue
+
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+                complete = end < len(buffer) or at_end  # A number at the buffer end may continue
+            except json.JSONDecodeError:
+                if at_end:
+                    raise
+                complete = False
+            if not complete:
+                # Item continues past the buffer: drop what was consumed and read more
+                chunk = json_file.read(READ_CHUNK_CHARS)
+                buffer = buffer[position:] + chunk
+                position = 0
+                at_end = not chunk
+                continue
+
+            yield item
+            position = end
+            expect_comma = in_array
+
+        if in_array:
+            raise json.JSONDecodeError("Expecting ']'", buffer, position)
+
+def spill_records(records, spill_file):
+    """
+    Writes each record's values (as the TSV will show them) to spill_file in the order
+    its columns were first seen, and returns that column order and the record count.
+    Raises ValueError for an item that is not a dictionary.
+    """
+    writer = csv.writer(spill_file, delimiter='\t')
+    columns = {}
+    count = 0
+    for item in records:
+        if not isinstance(item, dict):
+            raise ValueError(f"item {count} is not a dictionary")
+        for key in item:
+            if key not in columns:
+                columns[key] = len(columns)
+        values = [''] * len(columns)
+        for key, value in item.items():
+            values[columns[key]] = '' if value is None else value
+        writer.writerow(values)
+        count += 1
+    return list(columns), count
 
 def json_to_csv(input_file_path, output_file_path):
-    """Converts a JSON file containing a list of dictionaries into a CSV file."""
-    
+    """
+    Converts a JSON file containing a list of dictionaries (or a JSON Lines file) into a
+    TSV with the sorted union of their keys as columns. Records are streamed: the first
+    pass discovers the columns while spilling the values to a temporary file, the second
+    writes the TSV from it, so memory does not grow with the number of records.
+    """
+
     # Ensure the input JSON file exists and is not empty
     if not os.path.exists(input_file_path) or os.stat(input_file_path).st_size == 0:
         print(f"Warning: Input JSON file '{input_file_path}' is empty or missing. Creating an empty CSV file.")
-        with open(output_file_path, 'w', newline='', encoding='utf-8') as tsv_file:
-            writer = csv.writer(tsv_file, delimiter='\t')
-            writer.writerow([])  # Write an empty file with no headers
+        write_empty_csv(output_file_path)
         return  # Exit normally
 
-    # Read the JSON file
-    try:
-        with open(input_file_path, 'r', encoding='utf-8') as json_file:
-            data = json.load(json_file)
-    except json.JSONDecodeError:
-        print(f"Error: Unable to parse JSON file '{input_file_path}'. Creating an empty CSV file.")
-        with open(output_file_path, 'w', newline='', encoding='utf-8') as tsv_file:
-            writer = csv.writer(tsv_file, delimiter='\t')
-            writer.writerow([])  # Write empty file
-        return  # Exit normally
+    spill_dir = os.path.dirname(os.path.abspath(output_file_path))
+    with tempfile.TemporaryFile('w+', newline='', encoding='utf-8', dir=spill_dir) as spill_file:
+        try:
+            columns, count = spill_records(iter_json_records(input_file_path), spill_file)
+        except json.JSONDecodeError:
+            print(f"Error: Unable to parse JSON file '{input_file_path}'. Creating an empty CSV file.")
+            write_empty_csv(output_file_path)
+            return  # Exit normally
+        except ValueError:
+            print(f"Error: JSON file '{input_file_path}' is not a valid list of dictionaries. Creating an empty CSV file.")
+            write_empty_csv(output_file_path)
+            return  # Exit normally
 
-    # Ensure the JSON data is a list of dictionaries
-    if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
-        print(f"Error: JSON file '{input_file_path}' is not a valid list of dictionaries. Creating an empty CSV file.")
-        with open(output_file_path, 'w', newline='', encoding='utf-8') as tsv_file:
-            writer = csv.writer(tsv_file, delimiter='\t')
-            writer.writerow([])  # Write empty file
-        return  # Exit normally
+        # Handle empty JSON lists
+        if count == 0:
+            print(f"Warning: JSON file '{input_file_path}' is empty. Creating an empty CSV file.")
+            write_empty_csv(output_file_path)
+            return  # Exit normally
 
-    # Handle empty JSON lists
-    if not data:
-        print(f"Warning: JSON file '{input_file_path}' is empty. Creating an empty CSV file.")
+        # Sorted header for consistency; spilled rows only hold the columns seen up to them
+        final_headers = sorted(columns)
+        order = [columns.index(key) for key in final_headers]
+
+        spill_file.seek(0)
         with open(output_file_path, 'w', newline='', encoding='utf-8') as tsv_file:
             writer = csv.writer(tsv_file, delimiter='\t')
-            writer.writerow([])  # Write empty file
-        return  # Exit normally
-
-    # Extract all unique keys from the data (ensuring all columns are included)
-    unique_headers = set()
-    for item in data:
-        unique_headers.update(item.keys())
-
-    # Convert to a sorted list for consistency
-    final_headers = sorted(unique_headers)
-
-    # Write to the output CSV file
-    with open(output_file_path, 'w', newline='', encoding='utf-8') as tsv_file:
-        writer = csv.DictWriter(tsv_file, fieldnames=final_headers, delimiter='\t')
-        
-        # Write the header row
-        writer.writeheader()
-        
-        # Write each row of data
-        for item in data:
-            writer.writerow({key: item.get(key, '') for key in final_headers})
+            writer.writerow(final_headers)
+            for values in csv.reader(spill_file, delimiter='\t'):
+                writer.writerow([values[index] if index < len(values) else '' for index in order])
 
     print(f"CSV file saved successfully: {output_file_path}")
 
@@ -1,37 +1,16 @@
 import json
 import pandas as pd
 import sys
+from tsv_io import read_tsv
+from final_acmg_classifier import is_pipeline_column
+from variant_keys import merge_on_variant_keys
 
 import pandas as pd
 import json
 import os
 
-def json_to_csv(json_file, output_csv):
-    """
-    Converts a JSON file to a CSV file while flattening the data.
-    If the JSON file is empty or missing, an empty CSV file is created.
-    """
-    # Check if JSON file is empty or missing
-    if not os.path.exists(json_file) or os.stat(json_file).st_size == 0:
-        print(f"Warning: {json_file} is empty or missing. Creating an empty CSV file.")
-        pd.DataFrame().to_csv(output_csv, sep="\t", index=False)
-        return
-
-    # Read the JSON file
-    with open(json_file, 'r') as file:
-        try:
-            data = json.load(file)
-        except json.JSONDecodeError:
-            print(f"Error: {json_file} is not a valid JSON file. Creating an empty CSV file.")
-            pd.DataFrame().to_csv(output_csv, sep="\t", index=False)
-            return
-
-    # If JSON data is empty, save an empty CSV
-    if not data:
-        print(f"Warning: {json_file} contains no data. Creating an empty CSV file.")
-        pd.DataFrame().to_csv(output_csv, sep="\t", index=False)
-        return
-
+def intervar_records_to_frame(data):
+    """Flattens WinterVar JSON records into a DataFrame with suffixed InterVar criteria columns."""
     # Flatten the JSON and extract the relevant columns for each row
     flat_data = []
     for item in data:
@@ -60,6 +39,35 @@ def json_to_csv(json_file, output_csv):
         'BP6', 'BP7', 'BS1', 'BS2', 'BS3', 'BS4'
     ]
     df = df.rename(columns={col: col + suffix for col in classification_columns if col in df.columns})
+    return df
+
+def json_to_csv(json_file, output_csv):
+    """
+    Converts a JSON file to a CSV file while flattening the data.
+    If the JSON file is empty or missing, an empty CSV file is created.
+    """
+    # Check if JSON file is empty or missing
+    if not os.path.exists(json_file) or os.stat(json_file).st_size == 0:
+        print(f"Warning: {json_file} is empty or missing. Creating an empty CSV file.")
+        pd.DataFrame().to_csv(output_csv, sep="\t", index=False)
+        return
+
+    # Read the JSON file
+    with open(json_file, 'r') as file:
+        try:
+            data = json.load(file)
+        except json.JSONDecodeError:
+            print(f"Error: {json_file} is not a valid JSON file. Creating an empty CSV file.")
+            pd.DataFrame().to_csv(output_csv, sep="\t", index=False)
+            return
+
+    # If JSON data is empty, save an empty CSV
+    if not data:
+        print(f"Warning: {json_file} contains no data. Creating an empty CSV file.")
+        pd.DataFrame().to_csv(output_csv, sep="\t", index=False)
+        return
+
+    df = intervar_records_to_frame(data)
 
     # Save to CSV
     df.to_csv(output_csv, sep="\t", index=False)
@@ -73,13 +81,14 @@ def merge_csv_files(intervar_csv, original_set_csv, output_csv, merge_type):
     If both files are empty, an empty file is created.
     """
     try:
-        intervar_df = pd.read_csv(intervar_csv, sep="\t", low_memory=False)
+        # Only the join keys and the columns later stages read are parsed
+        intervar_df = read_tsv(intervar_csv, keep=is_pipeline_column)
     except (pd.errors.EmptyDataError, FileNotFoundError):
         print(f"Warning: {intervar_csv} is empty or missing. Proceeding with available data.")
         intervar_df = pd.DataFrame()  # Create an empty dataframe
 
     try:
-        original_df = pd.read_csv(original_set_csv, sep="\t", low_memory=False)
+        original_df = read_tsv(original_set_csv, keep=is_pipeline_column)
     except (pd.errors.EmptyDataError, FileNotFoundError):
         print(f"Warning: {original_set_csv} is empty or missing. Proceeding with available data.")
         original_df = pd.DataFrame()  # Create an empty dataframe
@@ -90,22 +99,37 @@ def merge_csv_files(intervar_csv, original_set_csv, output_csv, merge_type):
         pd.DataFrame().to_csv(output_csv, sep="\t", index=False)
         return
 
-    # Convert all columns to string to avoid type mismatches
-    intervar_df = intervar_df.astype(str)
-    original_df = original_df.astype(str)
+    merged_df = merge_intervar_frames(intervar_df, original_df, merge_type)
+
+    # Save final merged output
+    merged_df.to_csv(output_csv, sep='\t', index=False)
+    print(f"Merged CSV file saved as {output_csv}")
+
+def merge_intervar_frames(intervar_df, original_df, merge_type):
+    """
+    Left-joins the InterVar results onto the original Set 1 or Set 2 dataframe.
+    If either dataframe is empty, the non-empty one is returned.
+    """
+    # Only the join keys and the columns later stages read are carried forward
+    intervar_df = intervar_df[[col for col in intervar_df.columns if is_pipeline_column(col.strip())]]
+    original_df = original_df[[col for col in original_df.columns if is_pipeline_column(col.strip())]]
+
+    if intervar_df.empty and original_df.empty:
+        return pd.DataFrame()
 
+    # The variant-key join compares positions as numbers and chromosomes and alleles as
+    # text, so the columns keep their types (and missing values stay missing). Integer
+    # InterVar columns become nullable, so variants without a result do not turn them into floats.
+    intervar_df = intervar_df.astype({col: "Int64" for col in intervar_df.columns
+                                      if pd.api.types.is_integer_dtype(intervar_df[col])})
     if merge_type == "set1":
-        # Ensure 'CHROMOSOME_POSITION_HG38' is a string (fixing the merge issue)
-        if 'CHROMOSOME_POSITION_HG38' in original_df.columns:
-            original_df['CHROMOSOME_POSITION_HG38'] = original_df['CHROMOSOME_POSITION_HG38'].astype(str)
-        
         # Merge if both files are not empty
         if not intervar_df.empty and not original_df.empty:
-            merged_df = pd.merge(
+            merged_df = merge_on_variant_keys(
                 original_df,
                 intervar_df,
-                left_on=['CHROMOSOME', 'CHROMOSOME_POSITION_HG38', 'REFERENCE_ALLELE', 'RISK_ALLELE'],
-                right_on=['Chromosome', 'Position', 'Ref_allele', 'Risk_allele'],
+                ['CHROMOSOME', 'CHROMOSOME_POSITION_HG38', 'REFERENCE_ALLELE', 'RISK_ALLELE'],
+                ['Chromosome', 'Position', 'Ref_allele', 'Risk_allele'],
                 how="left"
             )
         else:
@@ -120,15 +144,16 @@ def merge_csv_files(intervar_csv, original_set_csv, output_csv, merge_type):
 
         # Convert 'chrom' column and remove 'chr' prefix if present
         if 'chrom' in original_df.columns:
-            original_df['chrom'] = original_df['chrom'].astype(str).str.replace(r'^(chr)', '', regex=True)
+            chrom = original_df['chrom']
+            original_df = original_df.assign(chrom=chrom.astype(str).str.replace(r'^(chr)', '', regex=True).where(chrom.notna()))
 
         # Merge if both files are not empty
         if not intervar_df.empty and not original_df.empty:
-            merged_df = pd.merge(
+            merged_df = merge_on_variant_keys(
                 original_df,
                 intervar_df,
-                left_on=['chrom', 'pos', 'ref_base', 'alt_base'],
-                right_on=['Chromosome', 'Position', 'Ref_allele', 'Risk_allele'],
+                ['chrom', 'pos', 'ref_base', 'alt_base'],
+                ['Chromosome', 'Position', 'Ref_allele', 'Risk_allele'],
                 how="left"
             )
         else:
@@ -137,9 +162,7 @@ def merge_csv_files(intervar_csv, original_set_csv, output_csv, merge_type):
     else:
         raise ValueError("Invalid merge type. Use 'set1' or 'set2'.")
 
-    # Save final merged output
-    merged_df.to_csv(output_csv, sep='\t', index=False)
-    print(f"Merged CSV file saved as {output_csv}")
+    return merged_df
 
 
 if __name__ == "__main__":
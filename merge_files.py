@@ -1,6 +1,12 @@
 import pandas as pd
+import numpy as np
+import heapq
 import sys
 import os
+import tempfile
+from tsv_io import read_tsv, read_tsv_header
+from final_acmg_classifier import is_pipeline_column
+from variant_keys import VariantKeyEncoder, merge_on_variant_keys
 
 def merge_files(file1_path, file2_path, output_merged=None, output_pathogenic=None):
     """
@@ -20,25 +26,16 @@ def merge_files(file1_path, file2_path, output_merged=None, output_pathogenic=No
 
     # Read Diablo file (file2) - Required
     print(f"Reading {file2_path} (Diablo output)...")
-    df2 = pd.read_csv(file2_path, sep='\t', low_memory=False)
+    # Only the columns later stages read are parsed and carried forward
+    df2 = read_tsv(file2_path, keep=is_pipeline_column, categorical=True)
     df2.columns = df2.columns.str.strip()
 
     # Debugging: Print available columns in Diablo output
     print(f"Available columns in {file2_path}: {df2.columns.tolist()}")
 
-    # Check for ACMG column in Diablo output
-    if "ACMG" in df2.columns:
-        df2["ACMG"] = df2["ACMG"].astype(str).str.lower()
-        pathogenic_df = df2[
-            (df2["ACMG"] == "pathogenic") | 
-            (df2["ACMG"] == "likely pathogenic")
-        ]
-        pathogenic_df.to_csv(output_pathogenic, sep='\t', index=False)
-        print(f"Set 2 (Pathogenic Variants) saved as {output_pathogenic}")
-    else:
-        print("Error: 'ACMG' column is missing in the Diablo output file!")
-        print("Available columns:", df2.columns.tolist())
-        sys.exit(1)
+    pathogenic_df = select_pathogenic(df2)
+    pathogenic_df.to_csv(output_pathogenic, sep='\t', index=False)
+    print(f"Set 2 (Pathogenic Variants) saved as {output_pathogenic}")
 
     # If file1 (Annotated VCF) is missing, stop here
     if not file1_path or not os.path.exists(file1_path):
@@ -47,41 +44,312 @@ def merge_files(file1_path, file2_path, output_merged=None, output_pathogenic=No
 
     # Read file1 (Annotated VCF) if it exists
     print(f"Reading {file1_path} (Annotated VCF)...")
-    df1 = pd.read_csv(file1_path, sep='\t', low_memory=False)
+    df1 = read_tsv(file1_path, keep=is_pipeline_column, categorical=True)
+
+    merged_df = merge_common(df1, df2)
+
+    # Save merged file
+    if output_merged:
+        merged_df.to_csv(output_merged, sep='\t', index=False)
+        print(f"Set 1 (Common Variants) saved as {output_merged}")
+
+def select_pathogenic(df2):
+    """Returns the pathogenic and likely pathogenic rows of the Diablo output (Set 2)."""
+    # Check for ACMG column in Diablo output
+    if "ACMG" in df2.columns:
+        df2["ACMG"] = df2["ACMG"].astype(str).str.lower()
+        return df2[
+            (df2["ACMG"] == "pathogenic") | 
+            (df2["ACMG"] == "likely pathogenic")
+        ]
+
+    print("Error: 'ACMG' column is missing in the Diablo output file!")
+    print("Available columns:", df2.columns.tolist())
+    sys.exit(1)
 
+def merge_common(df1, df2):
+    """Inner-joins the annotated VCF (df1) with the Diablo output (df2) on the variant key (Set 1)."""
 # Debugging: Print available columns in Annotated VCF
-    print(f"Available columns in {file1_path}: {df1.columns.tolist()}")
+    print(f"Available columns in Annotated VCF: {df1.columns.tolist()}")
 
 # Ensure required columns exist before merging
     required_columns = ["CHROMOSOME", "CHROMOSOME_POSITION_HG38", "REFERENCE_ALLELE", "RISK_ALLELE"]
     if not all(col in df1.columns for col in required_columns):
-     print(f"Error: Annotated VCF file {file1_path} is missing required columns {required_columns}.")
+     print(f"Error: Annotated VCF file is missing required columns {required_columns}.")
      sys.exit(1)
 
     required_columns_diablo = ["chrom", "pos", "ref_base", "alt_base"]
     if not all(col in df2.columns for col in required_columns_diablo):
-     print(f"Error: Diablo output file {file2_path} is missing required columns {required_columns_diablo}.")
+     print(f"Error: Diablo output file is missing required columns {required_columns_diablo}.")
      sys.exit(1)
 
-# Merge Set 1 (Common Variants) using filtered dataframe
-    merged_df = df1.merge(
+# Merge Set 1 (Common Variants) using filtered dataframe, joined on packed integer variant keys
+    return merge_on_variant_keys(
+    df1,
     df2,
-    how="inner",
-    left_on=["CHROMOSOME", "CHROMOSOME_POSITION_HG38", "REFERENCE_ALLELE", "RISK_ALLELE"],
-    right_on=["chrom", "pos", "ref_base", "alt_base"]
+    ["CHROMOSOME", "CHROMOSOME_POSITION_HG38", "REFERENCE_ALLELE", "RISK_ALLELE"],
+    ["chrom", "pos", "ref_base", "alt_base"],
+    how="inner"
 )
 
-    # Save merged file
-    if output_merged:
-        merged_df.to_csv(output_merged, sep='\t', index=False)
-        print(f"Set 1 (Common Variants) saved as {output_merged}")
+# Join keys of the annotated VCF (file1) and the Diablo output (file2)
+LEFT_KEYS = ["CHROMOSOME", "CHROMOSOME_POSITION_HG38", "REFERENCE_ALLELE", "RISK_ALLELE"]
+RIGHT_KEYS = ["chrom", "pos", "ref_base", "alt_base"]
+DEFAULT_CHUNKSIZE = 200_000
+DEFAULT_PARTITIONS = 64
 
-import sys
-import os
+def _projected_columns(file_path):
+    """Maps the raw header names of the columns later stages read to their stripped names."""
+    return {col: col.strip() for col in read_tsv_header(file_path) if is_pipeline_column(col.strip())}
+
+def _read_chunks(file_path, columns, chunksize):
+    """Yields string-typed chunks of the projected columns, with stripped column names."""
+    for chunk in pd.read_csv(file_path, sep='\t', usecols=list(columns), dtype=str, chunksize=chunksize):
+        yield chunk.rename(columns=columns)
+
+def _append_tsv(df, path, columns=None):
+    """Appends rows to a TSV, writing the header only when the file is new."""
+    write_header = not os.path.exists(path)
+    df.to_csv(path, sep='\t', index=False, mode='a', header=write_header, columns=columns)
+
+def _coordinate_order(chunks, chrom_col, pos_col):
+    """
+    Consumes all chunks and returns the chromosomes in file order if the file is
+    coordinate-sorted (each chromosome contiguous, positions ascending), else None.
+    """
+    order = []
+    is_sorted = True
+    last_chrom, last_pos = None, -1
+    for chunk in chunks:
+        if chunk.empty or not is_sorted:
+            continue
+        chroms = chunk[chrom_col].to_numpy(dtype=object)
+        positions = pd.to_numeric(chunk[pos_col], errors='coerce').to_numpy(dtype=float)
+
+        previous_chroms = np.concatenate([[last_chrom], chroms[:-1]])
+        previous_positions = np.concatenate([[last_pos], positions[:-1]])
+        same_chrom = chroms == previous_chroms
+        new_chroms = list(chroms[~same_chrom])
+        if (
+            np.isnan(positions).any()
+            or (positions[same_chrom] < previous_positions[same_chrom]).any()
+            or len(set(new_chroms)) < len(new_chroms)
+            or any(chrom in order for chrom in new_chroms)  # Chromosome split into several blocks
+        ):
+            is_sorted = False
+            continue
+        order.extend(new_chroms)
+        last_chrom, last_pos = chroms[-1], positions[-1]
+    return order if is_sorted else None
+
+def _sort_keys(chunk, chrom_col, pos_col, chrom_rank):
+    """(chromosome rank, position) packed into one sortable int64; -1 for chromosomes not in chrom_rank."""
+    rank = chunk[chrom_col].map(chrom_rank).fillna(-1).to_numpy(dtype=np.int64)
+    position = pd.to_numeric(chunk[pos_col], errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+    return np.where(rank >= 0, (rank << 32) + position, -1)
+
+def _sort_merge_join(left_chunks, right_chunks, chrom_rank, write):
+    """
+    Inner join of two coordinate-sorted chunk streams. Only right rows whose keys
+    occur in the current left chunk are kept, plus a lookahead from one right
+    chunk, so memory stays bounded by the chunk size. Rows come out in the same
+    order as DataFrame.merge(how="inner").
+    """
+    lookahead = None
+    right_iter = iter(right_chunks)
+    exhausted = False
+
+    for left in left_chunks:
+        if left.empty:
+            continue
+        left_keys = _sort_keys(left, LEFT_KEYS[0], LEFT_KEYS[1], chrom_rank)
+        max_key = left_keys[-1]
+        encoder = VariantKeyEncoder()
+        left_variants = encoder.encode(*(left[col] for col in LEFT_KEYS))
+        matches = []
+
+        def absorb(frame):
+            # Keep rows that can join this chunk; carry rows at or past max_key forward
+            keys = frame["_key"].to_numpy()
+            candidates = frame[keys <= max_key]
+            candidates = candidates[np.isin(encoder.encode(*(candidates[col] for col in RIGHT_KEYS)), left_variants)]
+            if not candidates.empty:
+                matches.append(candidates)
+            return frame[keys >= max_key]
+
+        if lookahead is not None:
+            lookahead = absorb(lookahead)
+        while not exhausted and (lookahead is None or lookahead.empty or lookahead["_key"].iloc[-1] <= max_key):
+            right = next(right_iter, None)
+            if right is None:
+                exhausted = True
+                break
+            right = right.assign(_key=_sort_keys(right, RIGHT_KEYS[0], RIGHT_KEYS[1], chrom_rank))
+            right = right[right["_key"] >= 0]
+            absorbed = absorb(right)
+            lookahead = absorbed if lookahead is None else pd.concat([lookahead, absorbed])
+
+        if matches:
+            right_matches = pd.concat(matches).drop(columns="_key")
+            write(merge_on_variant_keys(left, right_matches, LEFT_KEYS, RIGHT_KEYS))
+
+def _partition(chunks, keys, num_partitions, tmp_dir, prefix):
+    """Splits chunks into on-disk partitions by a hash of the join keys."""
+    for chunk in chunks:
+        hashes = pd.util.hash_pandas_object(chunk[keys].set_axis(range(len(keys)), axis=1), index=False)
+        for part, rows in chunk.groupby((hashes % num_partitions).to_numpy()):
+            _append_tsv(rows, os.path.join(tmp_dir, f"{prefix}_{part}.tsv"))
+
+def _hash_join(left_chunks, right_chunks, num_partitions, tmp_dir, write_lines):
+    """
+    Inner join through on-disk hash partitions. Each partition pair is joined in
+    memory, then the partition outputs are merged back into the left file's order.
+    """
+    _partition(left_chunks, LEFT_KEYS, num_partitions, tmp_dir, "left")
+    _partition(right_chunks, RIGHT_KEYS, num_partitions, tmp_dir, "right")
+
+    part_outputs = []
+    for part in range(num_partitions):
+        left_path = os.path.join(tmp_dir, f"left_{part}.tsv")
+        right_path = os.path.join(tmp_dir, f"right_{part}.tsv")
+        if not (os.path.exists(left_path) and os.path.exists(right_path)):
+            continue
+        left = pd.read_csv(left_path, sep='\t', dtype=str)
+        right = pd.read_csv(right_path, sep='\t', dtype=str)
+        merged = merge_on_variant_keys(left, right, LEFT_KEYS, RIGHT_KEYS)
+        merged["_row"] = merged["_row"].astype(np.int64)
+        merged = merged.sort_values("_row", kind="stable")
+        part_output = os.path.join(tmp_dir, f"joined_{part}.tsv")
+        merged.to_csv(part_output, sep='\t', index=False, header=False)
+        part_outputs.append(part_output)
+
+    # K-way merge of the sorted partition outputs on the leading row number
+    files = [open(path, 'r') for path in part_outputs]
+    try:
+        lines = heapq.merge(*files, key=lambda line: int(line.split('\t', 1)[0]))
+        write_lines(line.split('\t', 1)[1] for line in lines)
+    finally:
+        for part_file in files:
+            part_file.close()
+
+def merge_files_streaming(file1_path, file2_path, output_merged=None, output_pathogenic=None,
+                          chunksize=DEFAULT_CHUNKSIZE, num_partitions=DEFAULT_PARTITIONS):
+    """
+    Bounded-memory version of merge_files for whole-genome inputs. Set 2 is written
+    chunk by chunk. Set 1 is joined with a streaming sort-merge when both inputs are
+    coordinate-sorted in the same chromosome order, and with an on-disk hash join
+    otherwise. Values are carried as text, so numbers are written as they appear in
+    the inputs.
+    """
+    if not os.path.exists(file2_path):
+        print(f"Error: Diablo output file {file2_path} is missing. Cannot proceed.")
+        sys.exit(1)
+
+    right_columns = _projected_columns(file2_path)
+    if "ACMG" not in right_columns.values():
+        print("Error: 'ACMG' column is missing in the Diablo output file!")
+        sys.exit(1)
+
+    def diablo_chunks():
+        for chunk in _read_chunks(file2_path, right_columns, chunksize):
+            chunk["ACMG"] = chunk["ACMG"].astype(str).str.lower()
+            yield chunk
+
+    # Set 2: stream the pathogenic rows; check the Diablo sort order on the same pass
+    print(f"Streaming {file2_path} (Diablo output) in chunks of {chunksize} rows...")
+    if os.path.exists(output_pathogenic):
+        os.remove(output_pathogenic)
+    pathogenic_count = 0
+    has_right_keys = all(col in right_columns.values() for col in RIGHT_KEYS)
+
+    def pathogenic_pass():
+        nonlocal pathogenic_count
+        for chunk in diablo_chunks():
+            pathogenic = chunk[chunk["ACMG"].isin(["pathogenic", "likely pathogenic"])]
+            _append_tsv(pathogenic, output_pathogenic, columns=list(chunk.columns))
+            pathogenic_count += len(pathogenic)
+            yield chunk
+
+    if has_right_keys:
+        right_order = _coordinate_order(pathogenic_pass(), "chrom", "pos")
+    else:
+        right_order = None
+        for _ in pathogenic_pass():
+            pass
+    if pathogenic_count == 0:
+        pd.DataFrame(columns=list(right_columns.values())).to_csv(output_pathogenic, sep='\t', index=False)
+    print(f"Set 2 (Pathogenic Variants) saved as {output_pathogenic} ({pathogenic_count} rows)")
+
+    if not file1_path or not os.path.exists(file1_path):
+        print("Annotated VCF file is missing. Only Set 2 (Pathogenic Variants) was processed.")
+        return
+
+    left_columns = _projected_columns(file1_path)
+    if not all(col in left_columns.values() for col in LEFT_KEYS):
+        print(f"Error: Annotated VCF file {file1_path} is missing required columns {LEFT_KEYS}.")
+        sys.exit(1)
+    if not has_right_keys:
+        print(f"Error: Diablo output file {file2_path} is missing required columns {RIGHT_KEYS}.")
+        sys.exit(1)
+    if not output_merged:
+        return
+
+    # Output layout (column order, _x/_y suffixes) of the in-memory merge
+    merged_columns = list(pd.DataFrame(columns=list(left_columns.values())).merge(
+        pd.DataFrame(columns=list(right_columns.values())), how="inner", left_on=LEFT_KEYS, right_on=RIGHT_KEYS
+    ).columns)
+    with open(output_merged, 'w') as merged_file:
+        merged_file.write("\t".join(merged_columns) + "\n")
+
+    merged_count = 0
+
+    def write(merged):
+        nonlocal merged_count
+        merged.to_csv(output_merged, sep='\t', index=False, mode='a', header=False, columns=merged_columns)
+        merged_count += len(merged)
+
+    left_order = _coordinate_order(_read_chunks(file1_path, {raw: name for raw, name in left_columns.items()
+                                                             if name in LEFT_KEYS[:2]}, chunksize),
+                                   LEFT_KEYS[0], LEFT_KEYS[1])
+    chrom_rank = {chrom: rank for rank, chrom in enumerate(left_order or [])}
+    common_order = [chrom for chrom in (right_order or []) if chrom in chrom_rank]
+    sorted_inputs = (
+        left_order is not None and right_order is not None
+        and [chrom_rank[chrom] for chrom in common_order] == sorted(chrom_rank[chrom] for chrom in common_order)
+    )
+
+    if sorted_inputs:
+        print("Both inputs are coordinate-sorted. Joining Set 1 with a streaming sort-merge...")
+        _sort_merge_join(_read_chunks(file1_path, left_columns, chunksize), diablo_chunks(), chrom_rank, write)
+    else:
+        print(f"Inputs are not sorted in the same coordinate order. Joining Set 1 through {num_partitions} on-disk partitions...")
+
+        def numbered_left_chunks():
+            row = 0
+            for chunk in _read_chunks(file1_path, left_columns, chunksize):
+                chunk.insert(0, "_row", np.arange(row, row + len(chunk)))
+                row += len(chunk)
+                yield chunk
+
+        def write_lines(lines):
+            nonlocal merged_count
+            with open(output_merged, 'a') as merged_file:
+                for line in lines:
+                    merged_file.write(line)
+                    merged_count += 1
+
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_merged))) as tmp_dir:
+            _hash_join(numbered_left_chunks(), diablo_chunks(), num_partitions, tmp_dir, write_lines)
+
+    print(f"Set 1 (Common Variants) saved as {output_merged} ({merged_count} rows)")
 
 if __name__ == "__main__":
+    # Optional flag: bounded-memory streaming mode for whole-genome inputs
+    streaming = "--stream" in sys.argv
+    sys.argv = [arg for arg in sys.argv if arg != "--stream"]
+
     if len(sys.argv) < 3:
-        print("Usage: python merge_files.py [<file1>] <file2> <output_pathogenic> [<output_merged>]")
+        print("Usage: python merge_files.py [<file1>] <file2> <output_pathogenic> [<output_merged>] [--stream]")
         sys.exit(1)
 
     # If only three arguments are provided, assume no annotated VCF file
@@ -96,5 +364,8 @@ if __name__ == "__main__":
         output_pathogenic = sys.argv[3]  # Pathogenic variants output (Required)
         output_merged = sys.argv[4] if len(sys.argv) > 4 else None  # Optional merged output
 
-    merge_files(file1, file2, output_merged, output_pathogenic)
+    if streaming:
+        merge_files_streaming(file1, file2, output_merged, output_pathogenic)
+    else:
+        merge_files(file1, file2, output_merged, output_pathogenic)
 
@@ -0,0 +1,303 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+import numpy as np
+from variant_cache import VariantCache, DEFAULT_CACHE_PATH
+
+# Per-stage timing history of past pipeline runs
+TIMING_LOG = "pipeline_timing.json"
+MAX_HISTORY_RUNS = 200
+# Weight of a run relative to the next newer one, so the model follows recent hardware and cache state
+HISTORY_DECAY = 0.9
+# The cache miss rate of a run follows the cache more than the hardware: weigh recent runs more
+MISS_RATE_DECAY = 0.5
+# Used until there is any history: the old flat estimate
+DEFAULT_SECONDS_PER_ROW = 0.05
+# Stages that query a remote classifier, by stage name prefix, and their VariantCache tool
+REMOTE_TOOLS = {"WinterVar": "wintervar", "Auto-ACMG": "auto-acmg"}
+# VCF variants looked up in the cache to predict a run's remote calls
+PROBE_SAMPLE_SIZE = 2000
+
+def scan_vcf(path, sample_size=PROBE_SAMPLE_SIZE):
+    """
+    Returns the number of variant lines in a VCF (header lines starting with "#" are not
+    counted) and a uniform sample of up to sample_size of its (chrom, pos, ref, alt).
+    """
+    count = 0
+    sample = []
+    rng = random.Random(0)
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                count += 1
+                slot = count - 1 if count <= sample_size else rng.randrange(count)
+                if slot < sample_size:
+                    fields = line.split("\t", 5)
+                    if len(fields) >= 5:
+                        variant = (fields[0], fields[1], fields[3], fields[4].split(",")[0])
+                        if len(sample) < sample_size:
+                            sample.append(variant)
+                        else:
+                            sample[slot] = variant
+    except (OSError, UnicodeDecodeError):
+        return 0, []
+    return count, sample
+
+def count_vcf_records(path):
+    """Number of variant lines in a VCF (header lines starting with "#" are not counted)."""
+    return scan_vcf(path, sample_size=0)[0]
+
+def probe_miss_rates(variants, cache_path=DEFAULT_CACHE_PATH):
+    """Predicted cache miss rate of each remote tool: the share of variants with no cached response."""
+    if not variants or not os.path.exists(cache_path):
+        return {}
+    cache = VariantCache(cache_path)
+    try:
+        return {tool: sum(not cache.contains(tool, *variant) for variant in variants) / len(variants)
+                for tool in REMOTE_TOOLS.values()}
+    finally:
+        cache.close()
+
+def remote_tool(stage):
+    return next((tool for prefix, tool in REMOTE_TOOLS.items() if stage.startswith(prefix)), None)
+
+def count_table_rows(path):
+    """Number of data rows in a TSV with a header line."""
+    try:
+        with open(path, "rb") as f:
+            return max(sum(1 for _ in f) - 1, 0)
+    except OSError:
+        return 0
+
+class RunTimings:
+    """
+    Collects the timing record of every stage of one pipeline run: wall time, rows in and
+    out, the StageMeter metrics and, for the remote classifiers, cache hits, remote calls
+    and HTTP statistics. Safe to share between the set branches.
+    """
+
+    def __init__(self, input_rows):
+        self.input_rows = input_rows
+        self.started = time.time()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds, rows_in=None, rows_out=None, cache_hits=None, remote_calls=None, skipped=False,
+               metrics=None, http=None):
+        record = {"seconds": round(seconds, 3)}
+        for field, value in [("rows_in", rows_in), ("rows_out", rows_out), ("cache_hits", cache_hits),
+                             ("remote_calls", remote_calls)]:
+            if value is not None:
+                record[field] = int(value)
+        record.update((field, value) for field, value in (metrics or {}).items() if field != "wall_seconds")
+        if http:
+            record["http"] = http
+        if skipped:
+            record["skipped"] = True  # Reused a checkpoint; says nothing about the stage's cost
+        with self._lock:
+            self.stages[stage] = record
+
+    def as_dict(self, total_seconds):
+        return {
+            "started": round(self.started, 3),
+            "input_rows": self.input_rows,
+            "total_seconds": round(total_seconds, 3),
+            "stages": dict(self.stages),
+        }
+
+def load_history(path=TIMING_LOG):
+    """Returns the recorded runs, oldest first. Totals logged by older versions (row count -> seconds) are kept as runs without stages."""
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        print(f"Warning: Unable to read {path}. Starting a new timing history.")
+        return []
+    if isinstance(data, dict) and isinstance(data.get("runs"), list):
+        return data["runs"]
+    if isinstance(data, dict):
+        return [{"input_rows": int(rows), "total_seconds": seconds, "stages": {}}
+                for rows, seconds in data.items() if str(rows).lstrip("-").isdigit()]
+    return []
+
+def save_run(run, path=TIMING_LOG):
+    """Appends a run to the history, keeping the newest MAX_HISTORY_RUNS."""
+    runs = (load_history(path) + [run])[-MAX_HISTORY_RUNS:]
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump({"runs": runs}, f, indent=4)
+    os.replace(temp_path, path)
+
+def _weighted_median(values, weights):
+    order = np.argsort(values)
+    cumulative = np.cumsum(weights[order])
+    return float(values[order][np.searchsorted(cumulative, cumulative[-1] / 2)])
+
+def _fit_nonnegative(features, seconds, weights):
+    """Weighted least squares, dropping features whose coefficient comes out negative."""
+    active = list(range(features.shape[1]))
+    scale = np.sqrt(weights)
+    while active:
+        solution = np.linalg.lstsq(features[:, active] * scale[:, None], seconds * scale, rcond=None)[0]
+        if (solution >= 0).all():
+            coefficients = np.zeros(features.shape[1])
+            coefficients[active] = solution
+            return coefficients
+        active.pop(int(np.argmin(solution)))
+    return np.zeros(features.shape[1])
+
+class StageModel:
+    """
+    Cost model of one stage: seconds = fixed + per_row * rows_in + per_call * remote_calls,
+    fitted by recency-weighted least squares. For a new input, rows_in is predicted from the
+    input VCF rows by the stage's typical rows_in / input_rows ratio and remote_calls from a
+    probed cache miss rate, or else from the miss rate of recent runs.
+    """
+
+    def __init__(self, samples):
+        # samples: (weight, input_rows, stage record), newest last
+        weights = np.array([weight for weight, _, _ in samples])
+        input_rows = np.array([rows for _, rows, _ in samples], dtype=float)
+        rows_in = np.array([record.get("rows_in", rows) for _, rows, record in samples], dtype=float)
+        seconds = np.array([record["seconds"] for _, _, record in samples], dtype=float)
+
+        has_input = input_rows > 0
+        self.row_ratio = _weighted_median(rows_in[has_input] / input_rows[has_input], weights[has_input]) if has_input.any() else 1.0
+
+        calls = [record.get("remote_calls") for _, _, record in samples]
+        self.remote = any(value is not None for value in calls)
+        remote_calls = np.array([value or 0 for value in calls], dtype=float)
+        miss_weights = MISS_RATE_DECAY ** np.arange(len(samples))[::-1]
+        self.miss_rate = (float(np.sum(miss_weights * remote_calls) / max(np.sum(miss_weights * rows_in), 1e-9))
+                          if self.remote else 0.0)
+
+        features = [np.ones(len(samples)), rows_in] + ([remote_calls] if self.remote else [])
+        features = np.column_stack(features)
+        if len(samples) < features.shape[1]:
+            # Too few runs to separate fixed and per-row cost: scale the observed rate
+            rate = float(np.sum(weights * seconds) / max(np.sum(weights * rows_in), 1e-9))
+            self.coefficients = np.array([0.0, rate] + ([0.0] if self.remote else []))
+        else:
+            self.coefficients = _fit_nonnegative(features, seconds, weights)
+        self.runs = len(samples)
+
+    def predict(self, input_rows, miss_rate=None):
+        rows_in = self.row_ratio * input_rows
+        miss_rate = self.miss_rate if miss_rate is None else miss_rate
+        features = [1.0, rows_in] + ([rows_in * miss_rate] if self.remote else [])
+        return float(np.dot(self.coefficients, features))
+
+def _branch(stage):
+    """The set branch a stage runs in ("set1" for "WinterVar (set1)" or "merge_files (Set 1)"), or None."""
+    suffix = stage.rpartition("(")[2].rstrip(")").replace(" ", "").casefold()
+    return suffix if stage.endswith(")") and suffix in ("set1", "set2") else None
+
+def critical_path(stage_seconds):
+    """Seconds of the stages outside the set branches plus the slower branch (the branches run concurrently)."""
+    serial = sum(seconds for stage, seconds in stage_seconds.items() if _branch(stage) is None)
+    branches = {}
+    for stage, seconds in stage_seconds.items():
+        if _branch(stage) is not None:
+            branches[_branch(stage)] = branches.get(_branch(stage), 0.0) + seconds
+    return serial + max(branches.values(), default=0.0)
+
+class RuntimeModel:
+    """
+    Predicts the total and per-stage runtime of a run from its input VCF row count, from
+    the stage records of past runs. The total is the critical path of the stage
+    predictions plus the time outside stages typical of past runs (startup, waiting for
+    the Auto-ACMG server, writing the output).
+    """
+
+    def __init__(self, runs):
+        self.runs = runs
+        weights = HISTORY_DECAY ** np.arange(len(runs))[::-1]
+        samples = {}
+        overheads = []
+        for weight, run in zip(weights, runs):
+            stages = run.get("stages", {})
+            for stage, record in stages.items():
+                if not record.get("skipped"):
+                    samples.setdefault(stage, []).append((weight, run.get("input_rows", 0), record))
+            if stages and not any(record.get("skipped") for record in stages.values()):
+                path = critical_path({stage: record["seconds"] for stage, record in stages.items()})
+                overheads.append((max(run["total_seconds"] - path, 0.0), weight))
+        self.stages = {stage: StageModel(stage_samples) for stage, stage_samples in samples.items()}
+        self.overhead = (_weighted_median(np.array([o for o, _ in overheads]), np.array([w for _, w in overheads]))
+                         if overheads else 0.0)
+
+        totals = [(weight, run.get("input_rows", 0), run["total_seconds"]) for weight, run in zip(weights, runs)]
+        self.total_rate = (sum(w * s for w, _, s in totals) / max(sum(w * r for w, r, _ in totals), 1)
+                           if totals else DEFAULT_SECONDS_PER_ROW)
+
+    def predict(self, input_rows, include=None, miss_rates=None):
+        """
+        Returns the predicted total seconds and a dict of predicted seconds per stage.
+        include, if given, selects the stages the run will have by name; miss_rates maps
+        remote tools to the cache miss rate expected for this input (from probe_miss_rates).
+        """
+        miss_rates = miss_rates or {}
+        stages = {stage: max(model.predict(input_rows, miss_rates.get(remote_tool(stage))), 0.0)
+                  for stage, model in self.stages.items() if include is None or include(stage)}
+        if stages:
+            return critical_path(stages) + self.overhead, stages
+        return self.total_rate * input_rows, stages
+
+    def describe(self):
+        if self.stages:
+            return f"fitted on {len(self.runs)} runs"
+        if self.runs:
+            return f"total rate from {len(self.runs)} runs without stage records"
+        return "no history yet"
+
+def estimate_runtime(input_vcf, include=None, path=TIMING_LOG, cache_path=DEFAULT_CACHE_PATH):
+    """
+    Returns the number of variants in input_vcf, its predicted total seconds and the
+    predicted seconds per stage. The remote stages are predicted from the share of a
+    sample of its variants the variant cache already holds.
+    """
+    input_rows, variants = scan_vcf(input_vcf)
+    total, stages = RuntimeModel(load_history(path)).predict(input_rows, include, probe_miss_rates(variants, cache_path))
+    return input_rows, total, stages
+
+def evaluate(runs):
+    """Fits on the runs before each one and returns the absolute percentage errors of the total predictions."""
+    errors = []
+    for i in range(1, len(runs)):
+        if runs[i].get("stages") and any(record.get("skipped") for record in runs[i]["stages"].values()):
+            continue  # A resumed run is not a prediction target
+        predicted, _ = RuntimeModel(runs[:i]).predict(runs[i].get("input_rows", 0))
+        actual = runs[i]["total_seconds"]
+        if actual > 0:
+            errors.append(abs(predicted - actual) / actual * 100)
+    return errors
+
+if __name__ == "__main__":
+    # Prints the runtime prediction for a VCF; --evaluate also replays the history to show the model's error
+    evaluate_history = "--evaluate" in sys.argv
+    args = [arg for arg in sys.argv if arg != "--evaluate"]
+    if len(args) not in [2, 3]:
+        print("Usage: python runtime_model.py <input_vcf> [<timing_log>] [--evaluate]")
+        sys.exit(1)
+
+    timing_log = args[2] if len(args) == 3 else TIMING_LOG
+    input_rows, variants = scan_vcf(args[1])
+    model = RuntimeModel(load_history(timing_log))
+    total, stages = model.predict(input_rows, miss_rates=probe_miss_rates(variants))
+    print(f"{args[1]}: {input_rows} variants, estimated runtime {total:.1f} seconds ({model.describe()})")
+    for stage, seconds in stages.items():
+        print(f"  {stage}: {seconds:.1f} s")
+
+    if evaluate_history:
+        errors = evaluate(load_history(timing_log))
+        if errors:
+            print(f"Replayed {len(errors)} runs: median error {np.median(errors):.1f}%, worst {max(errors):.1f}%")
+        else:
+            print("Not enough history to evaluate.")
@@ -0,0 +1,209 @@
+import contextlib
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from tsv_io import frame_to_text_records
+from intervar import query_wintervar, RateLimiter, WINTERVAR_VERSION, DEFAULT_RATE_LIMIT, DEFAULT_BURST
+from json_to_csv_intervar import intervar_records_to_frame, merge_intervar_frames
+from final_acmg_classifier import records_to_classifier_frame, process_acmg_dataframe, stack_classified_sets
+from variant_keys import CHROMOSOME_CODES
+from stage_manifest import StageManifest
+from auto_acmg_server import start_auto_acmg_pool
+from variant_triage import load_triage_rules, triage_variants, classify_triaged, TRIAGE_COLUMN
+from batch_pipeline import SET_KEYS, sample_name, load_sample_sets
+from PIPELINE import TEST_DIR, MANIFEST_PATH, ensure_file_exists, load_tsv, load_auto_acmg_query, stage_code
+
+DEFAULT_WORKERS = 4
+
+def normalize_chromosome(values):
+    """Chromosome names without the "chr" prefix, upper-cased (chr1 -> 1, chrx -> X)."""
+    return values.astype(str).str.strip().str.replace(r"^chr", "", case=False, regex=True).str.upper()
+
+def shard_order(name):
+    """Sort key of a shard name: chromosomes 1-22, X, Y, M, MT, then other contigs by name; intervals by start."""
+    chromosome, _, start = name.partition(":")
+    return (CHROMOSOME_CODES.get(chromosome, len(CHROMOSOME_CODES) + 1), chromosome, int(start or 0))
+
+def shard_names(df, set_name, interval=None):
+    """The shard of every row of a set: its chromosome, or "<chromosome>:<start>" with an interval in bp."""
+    chrom_col, pos_col = SET_KEYS[set_name][:2]
+    chromosomes = normalize_chromosome(df[chrom_col])
+    if not interval:
+        return chromosomes
+    starts = pd.to_numeric(df[pos_col], errors="coerce").fillna(0).to_numpy(dtype=np.int64) // interval * interval
+    return chromosomes + ":" + pd.Series(starts, index=df.index).astype(str)
+
+def partition_sets(sets, interval=None):
+    """Splits the Set 1 / Set 2 frames into {shard: {set_name: frame}}, shards in genome order."""
+    shards = {}
+    for set_name in SET_KEYS:
+        df = sets.get(set_name, pd.DataFrame())
+        if df.empty:
+            continue
+        for name, shard_df in df.groupby(shard_names(df, set_name, interval), sort=False):
+            shards.setdefault(name, {})[set_name] = shard_df
+    return {name: shards[name] for name in sorted(shards, key=shard_order)}
+
+def run_shard(shard, input_paths, output_path, log_path, server_urls=None, rate_limit=DEFAULT_RATE_LIMIT,
+              max_in_flight=None):
+    """
+    Queries WinterVar and Auto-ACMG for one shard's Set 1 / Set 2 rows and classifies
+    them. Runs in a worker process with its output in log_path; with several server_urls,
+    one balancer spreads both sets over them with at most max_in_flight (the worker's
+    share of the pool) Auto-ACMG requests in flight. The classified frames
+    are pickled to output_path (column types kept, so the shards stack as one frame
+    would). Returns the shard name and its row count per set.
+    """
+    with open(log_path, "w") as log, contextlib.redirect_stdout(log):
+        auto_acmg_query = load_auto_acmg_query()
+        limiter = RateLimiter(rate_limit, DEFAULT_BURST)
+        balancer = (auto_acmg_query.LeastOutstandingBalancer(server_urls, max_in_flight)
+                    if server_urls and len(server_urls) > 1 else None)
+        classified = {}
+        for set_name, input_path in input_paths.items():
+            set_df = load_tsv(input_path)
+            intervar_df = intervar_records_to_frame(query_wintervar(set_df, set_name, limiter=limiter))
+            merged_df = merge_intervar_frames(intervar_df, set_df, set_name)
+            records = auto_acmg_query.process_rows(list(merged_df.columns), frame_to_text_records(merged_df),
+                                                   source=f"{shard} {set_name}", balancer=balancer)
+            classifier_df = records_to_classifier_frame(records)
+            classified[set_name] = process_acmg_dataframe(classifier_df) if not classifier_df.empty else pd.DataFrame()
+        limiter.report()
+        if balancer is not None:
+            balancer.report()
+
+    temp_path = f"{output_path}.tmp"
+    pd.to_pickle(classified, temp_path)
+    os.replace(temp_path, output_path)
+    return shard, {set_name: len(df) for set_name, df in classified.items()}
+
+def main(input_vcf, final_output, annotated_vcf=None, workers=DEFAULT_WORKERS, interval=None, auto_acmg_instances=1,
+         triage_rules=None, wintervar_rate=DEFAULT_RATE_LIMIT):
+    """
+    Runs the pipeline with the Set 1 / Set 2 rows split by chromosome (or into genomic
+    intervals of interval bp) after merge_files. Each shard is queried and classified
+    in a pool of worker processes, which share the WinterVar rate limit wintervar_rate
+    (None for no limit). Every finished
+    shard is recorded in the stage manifest, so a rerun after a crash only runs the
+    shards that did not finish. The shards are stacked in genome order (Set 1, then
+    Set 2, as the unsharded pipeline does) into final_output. With triage_rules, variants
+    a rule resolves are left out of the shards and follow them in the output, as in PIPELINE.main.
+    """
+    print("Starting sharded pipeline...")
+    start_time = time.time()
+    base_name = sample_name(input_vcf)
+    shard_dir = os.path.join(TEST_DIR, f"{base_name}_shards")
+    os.makedirs(shard_dir, exist_ok=True)
+    manifest = StageManifest(MANIFEST_PATH)
+    auto_acmg_query = load_auto_acmg_query()
+
+    annotated_diablo = os.path.join(TEST_DIR, f"{base_name}_diablo.tsv")
+    ensure_file_exists(annotated_diablo, f"time python Diablo_annotate.py -i {input_vcf} -o {annotated_diablo}",
+                       manifest=manifest, inputs=[input_vcf, "Diablo_annotate.py"])
+    if not (annotated_vcf and os.path.exists(annotated_vcf)):
+        print("Annotated VCF file is missing. Only Set 2 (Pathogenic Variants) will be processed.")
+
+    sets = load_sample_sets(input_vcf, annotated_vcf, manifest)
+    triaged = {}
+    if triage_rules is not None:
+        for set_name in [set_name for set_name in SET_KEYS if set_name in sets]:
+            sets[set_name], triaged[set_name] = triage_variants(sets[set_name], triage_rules, set_name)
+    shards = partition_sets(sets, interval)
+    print(f"{len(shards)} shards: {', '.join(f'{name} ({sum(len(df) for df in sets.values())})' for name, sets in shards.items())}")
+
+    # Shard inputs are written every run; a shard whose inputs, code and tools are unchanged is not rerun
+    code = stage_code("intervar", "json_to_csv_intervar", "final_acmg_classifier", "sharded_pipeline") + [auto_acmg_query.__file__]
+    version = f"{WINTERVAR_VERSION}/{auto_acmg_query.detect_auto_acmg_version()}"
+    pending = {}
+    outputs = {}
+    for name, sets in shards.items():
+        file_name = name.replace(":", "_")
+        input_paths = {set_name: os.path.join(shard_dir, f"{file_name}_{set_name}.tsv") for set_name in sets}
+        for set_name, df in sets.items():
+            df.to_csv(input_paths[set_name], sep='\t', index=False)
+        outputs[name] = os.path.join(shard_dir, f"{file_name}_classified.pkl")
+        signature = manifest.signature([*input_paths.values(), *code], {"interval": interval}, version)
+        if manifest.status(outputs[name], signature) == "current":
+            continue
+        manifest.start(outputs[name], signature)
+        pending[name] = (input_paths, signature)
+    print(f"{len(shards) - len(pending)} shards up to date, {len(pending)} to run with {workers} workers")
+
+    failed = []
+    if pending:
+        pool = start_auto_acmg_pool(auto_acmg_instances)
+        # Balancers cannot be shared between processes: each worker gets its share of the pool's requests in flight
+        concurrent_shards = min(workers, len(pending))
+        max_in_flight = max(1, auto_acmg_query.WORKERS_PER_INSTANCE * len(pool.urls) // concurrent_shards)
+        shard_rate = wintervar_rate / concurrent_shards if wintervar_rate else None
+        # Workers are spawned: forking would copy the pool's health-check thread and held locks
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = {
+                executor.submit(run_shard, name, input_paths, outputs[name], os.path.join(shard_dir, f"{name.replace(':', '_')}.log"),
+                                pool.urls, shard_rate, max_in_flight): name
+                for name, (input_paths, _) in pending.items()
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                name = futures[future]
+                try:
+                    _, rows = future.result()
+                except Exception as e:
+                    print(f"Shard {name} failed: {e!r} (see {shard_dir}/{name.replace(':', '_')}.log)")
+                    failed.append(name)
+                    continue
+                manifest.record(outputs[name], pending[name][1])
+                print(f"[{done}/{len(pending)}] shard {name} finished: "
+                      + ", ".join(f"{set_name} {count} rows" for set_name, count in rows.items()))
+        pool.stop()
+
+    if failed:
+        print(f"Error: {len(failed)} shards failed ({', '.join(failed)}). Rerun to retry them; finished shards are kept.")
+        sys.exit(1)
+
+    # Deterministic merge: Set 1 of every shard in genome order, then Set 2
+    classified = [pd.read_pickle(outputs[name]) for name in shards]
+    stacked = {}
+    for set_name in SET_KEYS:
+        frames = [sets[set_name] for sets in classified if not sets.get(set_name, pd.DataFrame()).empty]
+        stacked[set_name] = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    df_final = stack_classified_sets(stacked["set1"], stacked["set2"])
+    if triage_rules is not None:
+        triaged_frames = [df for df in triaged.values() if not df.empty]
+        triaged_df = classify_triaged(pd.concat(triaged_frames, ignore_index=True) if triaged_frames else pd.DataFrame(), triage_rules)
+        df_final = stack_classified_sets(df_final.assign(**{TRIAGE_COLUMN: ""}), triaged_df)
+    df_final.to_csv(final_output, sep='\t', index=False)
+
+    elapsed_time = time.time() - start_time
+    print(f"Sharded pipeline completed in {elapsed_time:.2f} seconds! Final output: {final_output}")
+
+if __name__ == "__main__":
+    # Optional flags: --workers=N worker processes, --interval=<bp> to split chromosomes into
+    # intervals of that size, --auto-acmg-instances=N Auto-ACMG servers, --triage[=<rules.json>] and
+    # --wintervar-rate=N as in PIPELINE.py
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("--") and "=" in arg)
+    triage = "--triage" in sys.argv or "triage" in options
+    args = [arg for arg in sys.argv if not arg.startswith("--")]
+
+    if len(args) not in [3, 4] or set(options) - {"workers", "interval", "auto-acmg-instances", "triage", "wintervar-rate"}:
+        print("Usage: python sharded_pipeline.py <input_vcf> [<annotated_vcf>] <final_output> [--workers=<n>] "
+              "[--interval=<bp>] [--auto-acmg-instances=<n>] [--triage[=<rules.json>]] [--wintervar-rate=<n>]")
+        sys.exit(1)
+
+    input_vcf = args[1]
+    final_output = args[-1]
+    annotated_vcf = args[2] if len(args) == 4 else None
+    triage_rules = None
+    if triage:
+        try:
+            triage_rules = load_triage_rules(options.get("triage"))
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+
+    main(input_vcf, final_output, annotated_vcf, int(options.get("workers", DEFAULT_WORKERS)),
+         int(options["interval"]) if "interval" in options else None, int(options.get("auto-acmg-instances", 1)), triage_rules,
+         float(options["wintervar-rate"]) if "wintervar-rate" in options else DEFAULT_RATE_LIMIT)
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import threading
+
+# Read size for streaming file digests
+DIGEST_CHUNK_BYTES = 1024 * 1024
+
+class StageManifest:
+    """
+    JSON manifest recording, for every stage output, a signature of what it was built
+    from: the content digests of its input files, its parameters and the tool version.
+    An output is up to date only while that signature and the output itself are
+    unchanged. File digests are cached by size and mtime, so unchanged files are not
+    re-read. Safe to share between threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self.files = {}
+        self.stages = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    data = json.load(f)
+                self.files = data.get("files", {})
+                self.stages = data.get("stages", {})
+            except (json.JSONDecodeError, AttributeError):
+                print(f"Warning: {path} is corrupted. Every stage will be rerun.")
+
+    def digest(self, path):
+        """Returns the SHA-256 of a file, reusing the cached one if its size and mtime are unchanged."""
+        key = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            cached = self.files.get(key)
+        if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return cached["sha256"]
+
+        sha256 = hashlib.sha256()
+        buffer = bytearray(DIGEST_CHUNK_BYTES)
+        view = memoryview(buffer)
+        with open(path, "rb", buffering=0) as f:
+            while True:
+                size = f.readinto(buffer)
+                if not size:
+                    break
+                sha256.update(view[:size])
+
+        with self._lock:
+            self.files[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256.hexdigest()}
+        return sha256.hexdigest()
+
+    def signature(self, inputs=(), params=None, version=None):
+        """Combines the input digests, parameters and tool version into one stage signature."""
+        description = {
+            "inputs": [[os.path.basename(path), self.digest(path) if os.path.exists(path) else None] for path in inputs],
+            "params": params or {},
+            "version": version,
+        }
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def status(self, output, signature):
+        """Returns "current", "pending" (started with this signature, not finished), "stale" or "missing"."""
+        with self._lock:
+            entry = self.stages.get(os.path.abspath(output))
+        if entry is None:
+            return "missing"
+        if entry["signature"] != signature:
+            return "stale"
+        if not entry["complete"]:
+            return "pending"
+        if not os.path.exists(output) or self.digest(output) != entry["output"]:
+            return "stale"  # Output changed or removed since it was recorded
+        return "current"
+
+    def start(self, output, signature):
+        """Marks a stage as started, so an interrupted run can be told apart from a finished one."""
+        with self._lock:
+            self.stages[os.path.abspath(output)] = {"signature": signature, "complete": False, "output": None}
+            self.save()
+
+    def record(self, output, signature):
+        """Records a finished stage output and the signature it was built from."""
+        output_digest = self.digest(output)
+        with self._lock:
+            self.stages[os.path.abspath(output)] = {"signature": signature, "complete": True, "output": output_digest}
+            self.save()
+
+    def save(self):
+        with self._lock:
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump({"files": self.files, "stages": self.stages}, f, indent=4)
+            os.replace(temp_path, self.path)
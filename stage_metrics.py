@@ -0,0 +1,215 @@
+import json
+import os
+import threading
+import time
+from requests.adapters import HTTPAdapter
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Per-stage metrics of every run, one JSON record per line
+METRICS_LOG = "pipeline_metrics.jsonl"
+# Latest run's metrics for the node_exporter textfile collector
+PROMETHEUS_TEXTFILE = "pipeline_metrics.prom"
+# Seconds between resident memory samples while a stage runs
+RSS_SAMPLE_INTERVAL = 0.05
+LATENCY_QUANTILES = [0.5, 0.9, 0.99]
+
+def _resident_bytes():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        # Peak so far (kilobytes on Linux) where /proc is missing
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 if resource else 0
+
+def _io_bytes():
+    """Bytes this process has read and written through read/write calls (files and sockets), or None."""
+    try:
+        with open("/proc/self/io") as io:
+            counters = dict(line.split(": ") for line in io.read().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+def _cpu_seconds():
+    """CPU time of this process and its finished child processes (Diablo runs as one)."""
+    cpu = time.process_time()
+    if resource:
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu += children.ru_utime + children.ru_stime
+    return cpu
+
+class _RssSampler:
+    """Background thread tracking the peak resident memory while any StageMeter is running."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._peaks = {}
+        self._thread = None
+
+    def start(self, meter):
+        with self._lock:
+            self._peaks[meter] = _resident_bytes()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def stop(self, meter):
+        resident = _resident_bytes()
+        with self._lock:
+            return max(self._peaks.pop(meter), resident)
+
+    def _run(self):
+        while True:
+            time.sleep(RSS_SAMPLE_INTERVAL)
+            resident = _resident_bytes()
+            with self._lock:
+                for meter, peak in self._peaks.items():
+                    if resident > peak:
+                        self._peaks[meter] = resident
+
+_rss_sampler = _RssSampler()
+
+class StageMeter:
+    """
+    Measures one stage: wall time, CPU time, peak resident memory and bytes read and
+    written. CPU, memory and bytes are process-wide, so stages running concurrently (the
+    set branches) include each other's use.
+    """
+
+    def __init__(self):
+        self.wall_start = time.time()
+        self.cpu_start = _cpu_seconds()
+        self.io_start = _io_bytes()
+        _rss_sampler.start(self)
+
+    def stop(self):
+        """Returns the stage's metrics as a dict."""
+        metrics = {
+            "wall_seconds": round(time.time() - self.wall_start, 3),
+            "cpu_seconds": round(_cpu_seconds() - self.cpu_start, 3),
+            "peak_rss_bytes": _rss_sampler.stop(self),
+        }
+        io_end = _io_bytes()
+        if self.io_start and io_end:
+            metrics["bytes_read"] = io_end[0] - self.io_start[0]
+            metrics["bytes_written"] = io_end[1] - self.io_start[1]
+        return metrics
+
+class HttpStats:
+    """Request count, failures and latencies of one HTTP client session. Safe to share between threads."""
+
+    def __init__(self, client):
+        self.client = client
+        self.latencies = []
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds, failed):
+        with self._lock:
+            self.latencies.append(seconds)
+            self.errors += failed
+
+    def summary(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            errors = self.errors
+        summary = {"client": self.client, "requests": len(latencies), "errors": errors}
+        if latencies:
+            summary["latency_seconds"] = {
+                **{f"p{round(q * 100)}": round(latencies[min(int(q * len(latencies)), len(latencies) - 1)], 4)
+                   for q in LATENCY_QUANTILES},
+                "max": round(latencies[-1], 4),
+            }
+        return summary
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that records every request's latency (retries included) and failure in an HttpStats, if given."""
+
+    def __init__(self, http_stats, *args, **kwargs):
+        self.http_stats = http_stats
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, *args, **kwargs):
+        if self.http_stats is None:
+            return super().send(request, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            response = super().send(request, *args, **kwargs)
+        except Exception:
+            self.http_stats.record(time.perf_counter() - start, True)
+            raise
+        self.http_stats.record(time.perf_counter() - start, response.status_code >= 400)
+        return response
+
+def append_metrics_log(run, input_name, path=METRICS_LOG):
+    """Appends one JSON line per stage of a run (a RunTimings.as_dict record)."""
+    with open(path, "a") as f:
+        for stage, record in run["stages"].items():
+            f.write(json.dumps({"run_started": run["started"], "input": input_name, "stage": stage, **record}) + "\n")
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def write_prometheus_textfile(run, input_name, path=PROMETHEUS_TEXTFILE):
+    """
+    Writes the run's stage metrics as Prometheus gauges for the node_exporter textfile
+    collector, replacing the previous run's file atomically.
+    """
+    gauges = {
+        "seconds": ("pipeline_stage_wall_seconds", "Wall time of the stage."),
+        "cpu_seconds": ("pipeline_stage_cpu_seconds", "Process CPU time while the stage ran."),
+        "peak_rss_bytes": ("pipeline_stage_peak_rss_bytes", "Peak resident memory while the stage ran."),
+        "rows_in": ("pipeline_stage_rows_in", "Rows the stage read."),
+        "rows_out": ("pipeline_stage_rows_out", "Rows the stage produced."),
+        "bytes_read": ("pipeline_stage_read_bytes", "Bytes read while the stage ran."),
+        "bytes_written": ("pipeline_stage_written_bytes", "Bytes written while the stage ran."),
+        "cache_hits": ("pipeline_stage_cache_hits", "Variant cache hits of the stage."),
+        "remote_calls": ("pipeline_stage_remote_calls", "Variants the stage queried remotely."),
+    }
+    samples = {name: [] for name, _ in gauges.values()}
+    http_samples = {"pipeline_http_requests": [], "pipeline_http_errors": [], "pipeline_http_latency_seconds": []}
+    for stage, record in run["stages"].items():
+        labels = f'input="{_label(input_name)}",stage="{_label(stage)}"'
+        for field, (name, _) in gauges.items():
+            if field in record:
+                samples[name].append(f"{name}{{{labels}}} {record[field]}")
+        http = record.get("http")
+        if http:
+            http_labels = f'{labels},client="{_label(http["client"])}"'
+            http_samples["pipeline_http_requests"].append(f"pipeline_http_requests{{{http_labels}}} {http['requests']}")
+            http_samples["pipeline_http_errors"].append(f"pipeline_http_errors{{{http_labels}}} {http['errors']}")
+            for quantile in LATENCY_QUANTILES:
+                latency = http.get("latency_seconds", {}).get(f"p{round(quantile * 100)}")
+                if latency is not None:
+                    http_samples["pipeline_http_latency_seconds"].append(
+                        f'pipeline_http_latency_seconds{{{http_labels},quantile="{quantile}"}} {latency}')
+
+    lines = []
+    for name, help_text in gauges.values():
+        if samples[name]:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", *samples[name]]
+    http_help = {
+        "pipeline_http_requests": "HTTP requests the stage sent.",
+        "pipeline_http_errors": "HTTP requests that failed or returned an error status.",
+        "pipeline_http_latency_seconds": "HTTP request latency quantiles.",
+    }
+    for name, name_samples in http_samples.items():
+        if name_samples:
+            lines += [f"# HELP {name} {http_help[name]}", f"# TYPE {name} gauge", *name_samples]
+    input_label = f'input="{_label(input_name)}"'
+    lines += [
+        "# HELP pipeline_run_wall_seconds Wall time of the whole run.", "# TYPE pipeline_run_wall_seconds gauge",
+        f"pipeline_run_wall_seconds{{{input_label}}} {run['total_seconds']}",
+        "# HELP pipeline_run_start_time_seconds Start of the run (Unix time).", "# TYPE pipeline_run_start_time_seconds gauge",
+        f"pipeline_run_start_time_seconds{{{input_label}}} {run['started']}",
+    ]
+
+    # The collector may read at any time: write next to the target and rename
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(temp_path, path)
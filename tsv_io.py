@@ -0,0 +1,137 @@
+import csv
+import io
+import pandas as pd
+
+# Arrow's multithreaded CSV parser is used when pyarrow is installed
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.ipc
+    import pyarrow.parquet
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Low-cardinality text columns stored as categoricals (gene symbols, consequences)
+CATEGORICAL_COLUMNS = ["hugo", "so", "Gene", "prediction_data_consequence_mehari", "prediction_data_gene_symbol"]
+
+# Columnar intermediate formats (file extension and compression), both need pyarrow
+FRAME_FORMATS = {
+    "parquet": (".parquet", "zstd"),
+    "arrow": (".arrow", "lz4"),  # Arrow IPC (Feather v2)
+}
+
+def read_tsv_header(file_path):
+    """Returns the column names of a TSV without reading its rows."""
+    header = list(pd.read_csv(file_path, sep='\t', nrows=0).columns)
+    if hasattr(file_path, "seek"):
+        file_path.seek(0)  # In-memory buffer: rewind for the full read
+    return header
+
+def read_tsv(file_path, keep=None, dtype=None, categorical=False):
+    """
+    Reads a TSV (path or binary buffer), parsing only the columns for which keep(name) is true (all columns
+    if keep is None). dtype maps column names to dtypes for the columns that are read;
+    with categorical=True the CATEGORICAL_COLUMNS present are read as categories.
+    Uses the pyarrow engine when available and falls back to the C parser.
+    Raises pd.errors.EmptyDataError for an empty file, like pd.read_csv.
+    """
+    header = read_tsv_header(file_path)
+    usecols = [col for col in header if keep(col.strip())] if keep else None
+    selected = set(usecols if usecols is not None else header)
+
+    dtypes = {col: value for col, value in (dtype or {}).items() if col in selected}
+    if categorical:
+        dtypes.update({col: "category" for col in CATEGORICAL_COLUMNS if col in selected and col not in dtypes})
+
+    if PYARROW_AVAILABLE:
+        try:
+            return pd.read_csv(file_path, sep='\t', usecols=usecols, dtype=dtypes or None, engine="pyarrow")
+        except (ValueError, TypeError, pyarrow.ArrowException) as e:
+            print(f"Warning: pyarrow could not parse {file_path} ({e}). Falling back to the default parser.")
+            if hasattr(file_path, "seek"):
+                file_path.seek(0)
+
+    return pd.read_csv(file_path, sep='\t', usecols=usecols, dtype=dtypes or None, low_memory=False)
+
+def downcast_flags(df, columns):
+    """
+    Stores integer 0/1 criteria flag columns as int8. Float columns (flags with
+    missing values) are left as they are so the written TSV does not change.
+    """
+    for col in columns:
+        if col in df.columns and pd.api.types.is_integer_dtype(df[col]) and df[col].between(-128, 127).all():
+            df[col] = df[col].astype("int8")
+    return df
+
+def records_to_frame(records, keep=None):
+    """
+    Returns the DataFrame that writing records (dicts) as a TSV with csv.DictWriter and
+    reading it back with read_tsv would give, without touching disk. Columns are sorted
+    as json_csv_auto_cmg.py writes them, and only those for which keep(name) is true are
+    kept. Values go through their text form so column types are inferred exactly as
+    when the stage output is read from a file.
+    """
+    headers = sorted({key for record in records for key in record})
+    if keep:
+        headers = [col for col in headers if keep(col.strip())]
+    if not records or not headers:
+        return pd.DataFrame()
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=headers, delimiter='\t', extrasaction='ignore')
+    writer.writeheader()
+    for record in records:
+        writer.writerow({key: record.get(key, '') for key in headers})
+    return read_tsv(io.BytesIO(buffer.getvalue().encode('utf-8')))
+
+def frame_to_text_records(df):
+    """
+    Returns the rows of df as dicts of strings, as csv.DictReader gives them for the TSV
+    df.to_csv would write: missing values become "".
+    """
+    text = df.astype(object).where(df.notna(), "")
+    return [{col: str(value) for col, value in zip(df.columns, row)} for row in text.itertuples(index=False, name=None)]
+
+def frame_format(path):
+    """Returns the columnar format of path from its extension, or None for text files."""
+    for name, (extension, _) in FRAME_FORMATS.items():
+        if path.endswith(extension):
+            return name
+    return None
+
+def write_frame(df, path):
+    """
+    Writes df as a compressed Parquet or Arrow IPC file, chosen by the extension of path,
+    keeping its column types. Object columns mixing Python types are stored as text.
+    """
+    df = df.copy(deep=False)
+    for col in df.columns:
+        if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True).startswith("mixed"):
+            df[col] = df[col].map(lambda value: value if value is None or value != value else str(value))
+
+    table = pyarrow.Table.from_pandas(df, preserve_index=False)
+    format_name = frame_format(path)
+    compression = FRAME_FORMATS[format_name][1]
+    if format_name == "parquet":
+        pyarrow.parquet.write_table(table, path, compression=compression)
+    else:
+        pyarrow.feather.write_feather(table, path, compression=compression)
+
+def read_frame(path, keep=None):
+    """
+    Reads a file written by write_frame through a memory map, decoding only the columns
+    for which keep(name) is true (all columns if keep is None).
+    """
+    if frame_format(path) == "parquet":
+        names = pyarrow.parquet.read_schema(path, memory_map=True).names
+        columns = [col for col in names if keep(col.strip())] if keep else None
+        table = pyarrow.parquet.read_table(path, columns=columns, memory_map=True)
+    else:
+        columns = None
+        if keep:
+            with pyarrow.memory_map(path) as source:
+                names = pyarrow.ipc.open_file(source).schema.names
+            columns = [col for col in names if keep(col.strip())]
+        table = pyarrow.feather.read_table(path, columns=columns, memory_map=True)
+    return table.to_pandas()
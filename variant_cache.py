@@ -0,0 +1,223 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Default on-disk cache shared by intervar.py and auto-acmg-query.py
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "variant_cache.sqlite")
+DEFAULT_TTL_DAYS = 90
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3  # 2 GB of cached responses
+EVICTION_CHECK_INTERVAL = 500  # Check the size cap every N writes
+
+def normalize_variant(chromosome, position, ref_allele, alt_allele):
+    """Returns a normalized (chrom, pos, ref, alt) tuple, or None if a field is missing."""
+    chromosome = str(chromosome).strip()
+    position = str(position).strip()
+    ref_allele = str(ref_allele).strip().upper()
+    alt_allele = str(alt_allele).strip().upper()
+
+    if chromosome.lower().startswith("chr"):
+        chromosome = chromosome[3:]
+    chromosome = chromosome.upper()
+    if chromosome == "M":
+        chromosome = "MT"
+
+    # Positions read as floats by pandas ("12345.0") map to the same key
+    if position.endswith(".0"):
+        position = position[:-2]
+
+    if not all([chromosome, position, ref_allele, alt_allele]) or "NAN" in (chromosome, ref_allele, alt_allele):
+        return None
+    return chromosome, position, ref_allele, alt_allele
+
+class VariantCache:
+    """
+    SQLite cache of remote classifier responses, keyed by tool, genome build and
+    normalized chrom/pos/ref/alt. Entries from another tool version or older than
+    the TTL count as misses; least recently used entries are evicted past max_bytes.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_days=DEFAULT_TTL_DAYS, max_bytes=DEFAULT_MAX_BYTES):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.ttl_seconds = ttl_days * 86400
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "tool TEXT, build TEXT, variant TEXT, version TEXT, response TEXT, "
+            "size INTEGER, created REAL, accessed REAL, "
+            "PRIMARY KEY (tool, build, variant))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS counters (tool TEXT PRIMARY KEY, hits INTEGER, misses INTEGER)")
+        self._conn.commit()
+        self._tool_counts = {}
+
+    def _count(self, tool, hit):
+        hits, misses = self._tool_counts.get(tool, (0, 0))
+        self._tool_counts[tool] = (hits + 1, misses) if hit else (hits, misses + 1)
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def get(self, tool, version, chromosome, position, ref_allele, alt_allele, build="hg38"):
+        """Returns the cached response, or None on a miss."""
+        variant = normalize_variant(chromosome, position, ref_allele, alt_allele)
+        if variant is None:
+            return None
+        key = ":".join(variant)
+        now = time.time()
+
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT version, response, created FROM responses WHERE tool = ? AND build = ? AND variant = ?",
+                    (tool, build, key),
+                ).fetchone()
+
+                if row is None or row[0] != version or now - row[2] > self.ttl_seconds:
+                    self._count(tool, hit=False)
+                    return None
+
+                # Committed right away: an open write transaction would lock out every other connection
+                self._conn.execute(
+                    "UPDATE responses SET accessed = ? WHERE tool = ? AND build = ? AND variant = ?",
+                    (now, tool, build, key),
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                # A busy or unreadable cache is a miss, not a failed stage
+                self._rollback()
+                print(f"Warning: variant cache lookup failed ({e}); querying instead.")
+                self._count(tool, hit=False)
+                return None
+            self._count(tool, hit=True)
+        return json.loads(row[1])
+
+    def _rollback(self):
+        try:
+            self._conn.rollback()
+        except sqlite3.Error:
+            pass
+
+    def contains(self, tool, chromosome, position, ref_allele, alt_allele, build="hg38"):
+        """True if an unexpired response of any tool version is cached; not counted as a hit or miss."""
+        variant = normalize_variant(chromosome, position, ref_allele, alt_allele)
+        if variant is None:
+            return False
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created FROM responses WHERE tool = ? AND build = ? AND variant = ?",
+                (tool, build, ":".join(variant)),
+            ).fetchone()
+        return row is not None and time.time() - row[0] <= self.ttl_seconds
+
+    def put(self, tool, version, chromosome, position, ref_allele, alt_allele, response, build="hg38"):
+        """Stores a response, replacing any entry for the same variant."""
+        variant = normalize_variant(chromosome, position, ref_allele, alt_allele)
+        if variant is None or not response:
+            return
+        payload = json.dumps(response, separators=(",", ":"))
+        now = time.time()
+
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (tool, build, ":".join(variant), version, payload, len(payload), now, now),
+                )
+                self._conn.commit()
+                self._writes += 1
+                if self._writes % EVICTION_CHECK_INTERVAL == 0:
+                    self._evict()
+            except sqlite3.Error as e:
+                # The response is still returned to the caller; it is just not cached
+                self._rollback()
+                print(f"Warning: could not write to the variant cache ({e}).")
+
+    def _evict(self):
+        """Deletes least recently used entries until the cache is under 90% of max_bytes."""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        target = total - int(self.max_bytes * 0.9)
+        removed = 0
+        evicted = 0
+        rows = self._conn.execute("SELECT tool, build, variant, size FROM responses ORDER BY accessed").fetchall()
+        for tool, build, variant, size in rows:
+            if removed >= target:
+                break
+            self._conn.execute(
+                "DELETE FROM responses WHERE tool = ? AND build = ? AND variant = ?", (tool, build, variant)
+            )
+            removed += size
+            evicted += 1
+        self._conn.commit()
+        print(f"Variant cache: evicted {evicted} entries ({removed} bytes) to stay under {self.max_bytes} bytes")
+
+    def purge_expired(self):
+        """Deletes entries older than the TTL."""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl_seconds,))
+            self._conn.commit()
+        return cursor.rowcount
+
+    def report(self):
+        total = self.hits + self.misses
+        hit_rate = 100.0 * self.hits / total if total else 0.0
+        print(f"Variant cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate) [{self.path}]")
+
+    def close(self):
+        """Adds this run's hit/miss counters to the persistent totals and closes the database."""
+        with self._lock:
+            if self._writes:
+                self._evict()
+            for tool, (hits, misses) in self._tool_counts.items():
+                self._conn.execute(
+                    "INSERT INTO counters VALUES (?, ?, ?) ON CONFLICT(tool) DO UPDATE SET "
+                    "hits = hits + excluded.hits, misses = misses + excluded.misses",
+                    (tool, hits, misses),
+                )
+            self._conn.commit()
+            self._conn.close()
+
+def print_cache_stats(path=DEFAULT_CACHE_PATH):
+    """Prints the size and cumulative hit/miss counters of a cache file."""
+    if not os.path.exists(path):
+        print(f"No variant cache at {path}")
+        return
+    conn = sqlite3.connect(path)
+    for tool, entries, size in conn.execute("SELECT tool, COUNT(*), SUM(size) FROM responses GROUP BY tool"):
+        print(f"{tool}: {entries} entries, {size / 1024 ** 2:.1f} MB")
+    for tool, hits, misses in conn.execute("SELECT tool, hits, misses FROM counters"):
+        total = hits + misses
+        print(f"{tool}: {hits} hits, {misses} misses ({100.0 * hits / total if total else 0.0:.1f}% hit rate)")
+    conn.close()
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) not in [1, 2, 3]:
+        print("Usage: python variant_cache.py [<cache_path>] [--purge-expired]")
+        sys.exit(1)
+
+    args = [arg for arg in sys.argv[1:] if arg != "--purge-expired"]
+    cache_path = args[0] if args else DEFAULT_CACHE_PATH
+
+    if "--purge-expired" in sys.argv:
+        cache = VariantCache(cache_path)
+        print(f"Removed {cache.purge_expired()} expired entries.")
+        cache.close()
+
+    print_cache_stats(cache_path)
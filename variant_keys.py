@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+
+# Arrow's compute kernels parse text positions when pyarrow is installed
+try:
+    import pyarrow
+    import pyarrow.compute
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Packed key layout (bit 63 stays clear, so packed keys are never negative):
+# chromosome code (5 bits) | position (28 bits) | ref length (4) | alt length (4) | ref and alt bases, 2 bits each (22)
+CHROMOSOME_CODES = {str(number): number for number in range(1, 23)}
+CHROMOSOME_CODES.update({"X": 23, "Y": 24, "M": 25, "MT": 26})
+BASE_CODES = {"A": 0, "C": 1, "G": 2, "T": 3}
+POSITION_BITS = 28  # Longest human chromosome (chr1) is 248,956,422 bp
+MAX_PACKED_BASES = 11  # ref + alt bases that fit in the allele field
+KEY_COLUMN = "_variant_key"
+MISSING = "\n"  # Missing key value in overflow entries (TSV fields never contain newlines)
+
+def _text(value):
+    """Key value as it appears in a TSV ("12345" for 12345.0); None for missing values."""
+    if pd.isna(value):
+        return None
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return str(int(value))
+    return str(value)
+
+def _encode_allele(allele):
+    """(length, 2-bit base codes) of an A/C/G/T allele, or None if it cannot be packed."""
+    if allele is None or len(allele) > MAX_PACKED_BASES or any(base not in BASE_CODES for base in allele):
+        return None
+    bits = 0
+    for base in allele:
+        bits = (bits << 2) | BASE_CODES[base]
+    return len(allele), bits
+
+def _numeric_positions(position):
+    """Positions as floats (NaN where not a number)."""
+    if pd.api.types.is_numeric_dtype(position):
+        return position.to_numpy(dtype=float, na_value=np.nan)
+    # Fast paths need every value to parse as a number
+    if PYARROW_AVAILABLE:
+        try:
+            parsed = pyarrow.compute.cast(pyarrow.array(position, from_pandas=True), pyarrow.float64())
+            return parsed.to_numpy(zero_copy_only=False)
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError, pyarrow.ArrowNotImplementedError):
+            pass
+    try:
+        return position.astype("float64").to_numpy(dtype=float, na_value=np.nan)
+    except (ValueError, TypeError):
+        return pd.to_numeric(position.astype(object), errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+
+def _unique_texts(values):
+    """Factorizes values; returns the per-row codes (-1 for missing) and the text of each unique value."""
+    codes, uniques = pd.factorize(values)
+    return codes, [_text(value) for value in uniques]
+
+def _take_texts(texts, codes):
+    """Per-row texts (object array) from unique texts and factorize codes; MISSING for code -1."""
+    return np.array(texts + [MISSING], dtype=object)[codes]
+
+class VariantKeyEncoder:
+    """
+    Encodes (chromosome, position, ref, alt) into int64 keys. Numbered, X, Y and M/MT
+    chromosomes, positions below 2**28 and A/C/G/T alleles of up to 11 bases together
+    are packed into one non-negative integer. Every other variant (long indels, contigs,
+    "-" alleles, missing values) gets a negative id from the overflow table, so two
+    variants share a key exactly when their chromosome and allele texts and their
+    positions are equal. Keys are only comparable between frames encoded by the same
+    encoder.
+    """
+
+    def __init__(self):
+        self.overflow = []  # Tab-joined chrom/pos/ref/alt texts; entry i has key -(i + 1)
+
+    def encode(self, chromosome, position, ref_allele, alt_allele):
+        """Returns the int64 keys of four aligned key columns (Series)."""
+        chrom_codes, chrom_texts = _unique_texts(chromosome)
+        chrom_values = np.array([CHROMOSOME_CODES.get(text, 0) for text in chrom_texts] + [0], dtype=np.int64)
+        chrom = chrom_values[chrom_codes]  # Code -1 (missing) picks the trailing 0
+
+        numeric = _numeric_positions(position)
+        with np.errstate(invalid="ignore"):
+            integral = np.isfinite(numeric) & (numeric % 1 == 0) & (np.abs(numeric) < 2 ** 53)
+        valid_position = integral & (numeric >= 0) & (numeric < 2 ** POSITION_BITS)
+        pos = np.where(valid_position, numeric, 0).astype(np.int64)
+
+        alleles = []
+        for values in [ref_allele, alt_allele]:
+            codes, texts = _unique_texts(values)
+            encoded = [_encode_allele(text) for text in texts] + [None]
+            lengths = np.array([item[0] if item else -1 for item in encoded], dtype=np.int64)[codes]
+            bits = np.array([item[1] if item else 0 for item in encoded], dtype=np.int64)[codes]
+            alleles.append((lengths, bits, codes, texts))
+        (ref_length, ref_bits, ref_codes, ref_texts), (alt_length, alt_bits, alt_codes, alt_texts) = alleles
+
+        packable = (
+            (chrom > 0) & valid_position & (ref_length >= 0) & (alt_length >= 0)
+            & (ref_length + alt_length <= MAX_PACKED_BASES)
+        )
+        alt_length = np.maximum(alt_length, 0)
+        keys = (
+            (chrom << 58) | (pos << 30) | (np.maximum(ref_length, 0) << 26) | (alt_length << 22)
+            | (ref_bits << (2 * alt_length)) | alt_bits
+        )
+
+        # Overflow ids for the variants that do not fit
+        rows = np.flatnonzero(~packable)
+        if len(rows):
+            positions = np.where(integral[rows], numeric[rows], 0).astype(np.int64).astype(str).astype(object)
+            for index in np.flatnonzero(~integral[rows]):
+                positions[index] = _text(position.iloc[rows[index]]) or MISSING  # Non-numeric position text
+            variants = (
+                _take_texts(chrom_texts, chrom_codes[rows]) + "\t" + positions + "\t"
+                + _take_texts(ref_texts, ref_codes[rows]) + "\t" + _take_texts(alt_texts, alt_codes[rows])
+            )
+            known = pd.Index(self.overflow).get_indexer(variants)
+            self.overflow.extend(pd.unique(variants[known < 0]))
+            known[known < 0] = pd.Index(self.overflow).get_indexer(variants[known < 0])
+            keys[rows] = -known - 1
+        return keys
+
+def merge_on_variant_keys(left, right, left_on, right_on, how="inner"):
+    """
+    left.merge(right, how, left_on, right_on) for the four chrom/pos/ref/alt columns,
+    joined on one int64 variant key instead of four text columns. The result has the
+    columns and row order of the text-keyed merge.
+    """
+    encoder = VariantKeyEncoder()
+    left_keys = encoder.encode(*(left[col] for col in left_on))
+    right_keys = encoder.encode(*(right[col] for col in right_on))
+    merged = left.assign(**{KEY_COLUMN: left_keys}).merge(right.assign(**{KEY_COLUMN: right_keys}), how=how, on=KEY_COLUMN)
+    return merged.drop(columns=KEY_COLUMN)
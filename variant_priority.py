@@ -0,0 +1,47 @@
+# Priority tiers, lowest value is queried first
+PRIORITY_DIABLO_PATHOGENIC = 0
+PRIORITY_CLINVAR_PATHOGENIC = 1
+PRIORITY_PHENOTYPE = 2
+PRIORITY_OTHER = 3
+
+PRIORITY_LABELS = {
+    PRIORITY_DIABLO_PATHOGENIC: "Diablo pathogenic/likely pathogenic",
+    PRIORITY_CLINVAR_PATHOGENIC: "ClinVar pathogenic/likely pathogenic",
+    PRIORITY_PHENOTYPE: "phenotype-linked",
+    PRIORITY_OTHER: "other",
+}
+
+def _text(value):
+    if value is None or value != value:  # None or NaN
+        return ""
+    return str(value).strip().casefold()
+
+def variant_priority(row):
+    """
+    Returns the priority tier of a variant row (dict or pandas Series) from its
+    Diablo ACMG call, ClinVar significance and PHENOTYPEIDS.
+    """
+    acmg = _text(row.get("ACMG"))
+    if acmg in ["pathogenic", "likely pathogenic"]:
+        return PRIORITY_DIABLO_PATHOGENIC
+
+    clinvar = _text(row.get("clinvar.sig"))
+    if "pathogenic" in clinvar and "conflicting" not in clinvar:
+        return PRIORITY_CLINVAR_PATHOGENIC
+
+    if _text(row.get("PHENOTYPEIDS")) not in ["", "-", "nan"]:
+        return PRIORITY_PHENOTYPE
+
+    return PRIORITY_OTHER
+
+def sort_by_priority(items, key_row=lambda item: item):
+    """Stable sort of items by the priority of the row each maps to."""
+    return sorted(items, key=lambda item: variant_priority(key_row(item)))
+
+def print_priority_summary(rows):
+    counts = {}
+    for row in rows:
+        tier = variant_priority(row)
+        counts[tier] = counts.get(tier, 0) + 1
+    summary = ", ".join(f"{PRIORITY_LABELS[tier]}: {counts[tier]}" for tier in sorted(counts))
+    print(f"Query order by priority - {summary}")
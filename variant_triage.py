@@ -0,0 +1,153 @@
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+from tsv_io import frame_to_text_records
+from final_acmg_classifier import records_to_classifier_frame, process_acmg_dataframe, flag_pathogenicity
+from merge_files import LEFT_KEYS, RIGHT_KEYS
+from variant_cache import VariantCache, normalize_variant, DEFAULT_CACHE_PATH
+from runtime_model import REMOTE_TOOLS
+
+# Column of the final output holding the rule that resolved a variant without remote queries
+TRIAGE_COLUMN = "Triage"
+
+# Conditions are [column, operator, value]; a rule applies to a row that meets every "when"
+# condition and no "unless" condition. Rules are tried in order, the first that applies wins.
+# Diablo or ClinVar pathogenic calls always go to the remote classifiers.
+PATHOGENIC_GUARD = [["ACMG", "in", ["pathogenic", "likely pathogenic"]], ["clinvar.sig", "contains", "pathogenic"]]
+DEFAULT_TRIAGE_RULES = [
+    {"code": "BA1", "classification": "Benign", "criterion": "ba1",
+     "when": [["gnomad3.af", ">", 0.05]], "unless": PATHOGENIC_GUARD},
+    {"code": "DIABLO_BA1", "classification": "Benign", "criterion": "ba1",
+     "when": [["ba1_diablo_acmg", "==", 1]], "unless": PATHOGENIC_GUARD},
+    {"code": "CLINVAR_EXPERT_BENIGN", "classification": "Benign",
+     "when": [["clinvar.sig", "in", ["benign", "benign/likely benign"]],
+              ["clinvar.rev_stat", "in", ["reviewed by expert panel", "practice guideline"]]]},
+]
+NUMERIC_OPERATORS = {">": np.greater, ">=": np.greater_equal, "<": np.less, "<=": np.less_equal}
+OPERATORS = [*NUMERIC_OPERATORS, "==", "!=", "in", "contains"]
+
+def load_triage_rules(path=None):
+    """Reads triage rules from a JSON file (a list of rules like DEFAULT_TRIAGE_RULES); the defaults without a path."""
+    if path is None:
+        return DEFAULT_TRIAGE_RULES
+    with open(path, "r") as f:
+        rules = json.load(f)
+    for rule in rules:
+        if not rule.get("code") or not rule.get("classification") or not rule.get("when"):
+            raise ValueError(f"{path}: every triage rule needs a code, a classification and when conditions")
+        for _, operator, _ in [*rule["when"], *rule.get("unless", [])]:
+            if operator not in OPERATORS:
+                raise ValueError(f"{path}: unknown operator {operator!r} in rule {rule['code']}; expected one of {', '.join(OPERATORS)}")
+    return rules
+
+def _column(df, name):
+    """The column of df matching name case-insensitively, or None."""
+    return next((col for col in df.columns if col.strip().casefold() == name.casefold()), None)
+
+def condition_mask(df, condition):
+    """True for the rows of df meeting a [column, operator, value] condition; False where the column is missing."""
+    name, operator, value = condition
+    col = _column(df, name)
+    if col is None:
+        return np.zeros(len(df), dtype=bool)
+    if operator in NUMERIC_OPERATORS or (operator in ["==", "!="] and not isinstance(value, str)):
+        numbers = pd.to_numeric(df[col].astype(object), errors="coerce").to_numpy(dtype=float)
+        if operator in NUMERIC_OPERATORS:
+            return NUMERIC_OPERATORS[operator](numbers, float(value))  # NaN compares False
+        equal = numbers == float(value)
+        return equal if operator == "==" else ~equal
+
+    text = df[col].astype(object).where(df[col].notna(), "").astype(str).str.strip().str.casefold()
+    if operator == "in":
+        return text.isin([str(item).casefold() for item in value]).to_numpy()
+    if operator == "contains":
+        return text.str.contains(str(value).casefold(), regex=False).to_numpy()
+    equal = (text == str(value).casefold()).to_numpy()
+    return equal if operator == "==" else ~equal
+
+def triage_codes(df, rules):
+    """The code of the first rule that applies to each row of df, "" where none does."""
+    codes = np.full(len(df), "", dtype=object)
+    for rule in rules:
+        applies = np.ones(len(df), dtype=bool)
+        for condition in rule["when"]:
+            applies &= condition_mask(df, condition)
+        for condition in rule.get("unless", []):
+            applies &= ~condition_mask(df, condition)
+        codes[applies & (codes == "")] = rule["code"]
+    return codes
+
+def calls_saved(df, set_name, use_cache=True, cache_path=DEFAULT_CACHE_PATH):
+    """
+    Remote calls each tool (by stage name) would have made for the rows of df: its unique
+    variants, as both clients query each variant once, less those the variant cache
+    already holds unless use_cache is off.
+    """
+    keys = LEFT_KEYS if set_name == "set1" else RIGHT_KEYS
+    if df.empty or not set(keys).issubset(df.columns):
+        return {stage: 0 for stage in REMOTE_TOOLS}
+    variants = {normalize_variant(*values) for values in zip(*(df[col].astype(object) for col in keys))}
+    variants.discard(None)  # Rows missing a key field are never queried
+    if not use_cache or not variants or not os.path.exists(cache_path):
+        return {stage: len(variants) for stage in REMOTE_TOOLS}
+
+    cache = VariantCache(cache_path)
+    try:
+        return {stage: sum(not cache.contains(tool, *variant) for variant in variants) for stage, tool in REMOTE_TOOLS.items()}
+    finally:
+        cache.close()
+
+def triage_variants(df, rules, set_name, use_cache=True):
+    """
+    Splits a Set 1 / Set 2 frame into the rows still to query and the rows a triage rule
+    resolves, the latter with their rule code in TRIAGE_COLUMN. Prints how many remote
+    calls the triaged rows save (see calls_saved; use_cache as the query stages use it).
+    """
+    if df.empty:
+        return df, pd.DataFrame()
+    codes = triage_codes(df, rules)
+    triaged = codes != ""
+    triaged_df = df[triaged].assign(**{TRIAGE_COLUMN: codes[triaged]})
+
+    counts = pd.Series(codes[triaged]).value_counts()
+    summary = ", ".join(f"{code}: {count}" for code, count in counts.items())
+    saved = calls_saved(triaged_df, set_name, use_cache)
+    print(f"Triage ({set_name}): {int(triaged.sum())} of {len(df)} variants resolved without remote queries"
+          + (f" ({summary})" if summary else "") + "; calls saved: "
+          + ", ".join(f"{stage} {count}" for stage, count in saved.items()))
+    return df[~triaged], triaged_df
+
+def classify_triaged(triaged_df, rules):
+    """
+    Classifies triaged rows the way the classifier does queried ones, without InterVar or
+    Auto-ACMG results: the ACMG call is the rule's classification and the rule's criterion
+    (if any) is set. TRIAGE_COLUMN is kept as the last column.
+    """
+    if triaged_df.empty:
+        return pd.DataFrame()
+    codes = triaged_df[TRIAGE_COLUMN].to_numpy(dtype=object)
+    df = process_acmg_dataframe(records_to_classifier_frame(frame_to_text_records(triaged_df.drop(columns=TRIAGE_COLUMN))))
+
+    for rule in rules:
+        matched = codes == rule["code"]
+        if not matched.any():
+            continue
+        df.loc[matched, "ACMG"] = rule["classification"]
+        if rule.get("criterion"):
+            df.loc[matched, f"Final_{rule['criterion'].upper()}"] = 1
+    df["Flag_Pathogenicity"] = flag_pathogenicity(df["ACMG"])
+    df[TRIAGE_COLUMN] = codes
+    return df
+
+if __name__ == "__main__":
+    # Usage: python variant_triage.py <set_tsv> [<rules.json>]
+    # Prints how many rows of a Set 1 / Set 2 TSV the rules resolve without remote queries.
+    if len(sys.argv) not in [2, 3]:
+        print("Usage: python variant_triage.py <set_tsv> [<rules.json>]")
+        sys.exit(1)
+
+    set_df = pd.read_csv(sys.argv[1], sep="\t", dtype=str, keep_default_na=False)
+    set_name = "set1" if "CHROMOSOME" in set_df.columns else "set2"
+    triage_variants(set_df, load_triage_rules(sys.argv[2] if len(sys.argv) == 3 else None), set_name)